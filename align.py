@@ -0,0 +1,146 @@
+"""按每张图片的实际版面对齐识别区域
+
+扫描件的标签位置每页会偏移几十个像素，固定的裁剪框可能截断文字。
+对齐时把用户框选的区域向四周扩大作为搜索范围，缩小到低分辨率后：
+- 二值化并横向膨胀，把同一行的字符连成文字块
+- 按行、列投影切分出文字块
+- 选出与用户框选区域重叠最多的文字块，合并后加上边距作为新的识别区域
+全部在 NumPy 数组上计算，每个区域只需几毫秒，远少于识别的耗时。
+找不到可信的文字块时仍使用原来的区域。
+"""
+import numpy as np
+
+from preprocess import binarize, to_gray
+
+
+def _runs(flags, max_gap=0):
+    """布尔序列中连续为真的区间 [(起点, 终点)]，间隔不超过 max_gap 的区间合并"""
+    indices = np.flatnonzero(flags)
+    if not len(indices):
+        return []
+    breaks = np.flatnonzero(np.diff(indices) > max_gap + 1)
+    starts = np.concatenate(([indices[0]], indices[breaks + 1]))
+    ends = np.concatenate((indices[breaks], [indices[-1]])) + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def _dilate(ink, width, height):
+    """把文字像素向右扩展 width 个像素、向下扩展 height 个像素，连成文字块"""
+    counts = np.cumsum(ink, axis=1, dtype=np.int32)
+    shifted = np.zeros_like(counts)
+    shifted[:, width:] = counts[:, :-width] if width < counts.shape[1] else 0
+    mask = counts - shifted > 0
+    counts = np.cumsum(mask, axis=0, dtype=np.int32)
+    shifted = np.zeros_like(counts)
+    shifted[height:] = counts[:-height] if height < counts.shape[0] else 0
+    return counts - shifted > 0
+
+
+def text_blocks(ink, gap, min_height):
+    """按行、列投影切分文字块，返回 [(左, 上, 右, 下)]"""
+    blocks = []
+    for top, bottom in _runs(ink.any(axis=1)):
+        if bottom - top < min_height:
+            # 太扁的是表格线或噪点
+            continue
+        for left, right in _runs(ink[top:bottom].any(axis=0), gap):
+            blocks.append((left, top, right, bottom))
+    return blocks
+
+
+def _area(box):
+    return max(0, box[2] - box[0]) * max(0, box[3] - box[1])
+
+
+def _intersection(a, b):
+    return (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+
+
+def select_blocks(blocks, prior, min_overlap=0.3):
+    """选出属于用户框选区域的文字块
+
+    大部分落在框选区域内的文字块都选中；没有时选重叠最多的一块；
+    完全不重叠时选中心离框选区域最近的一块。
+    """
+    if not blocks:
+        return []
+    overlaps = [_area(_intersection(block, prior)) for block in blocks]
+    chosen = [block for block, overlap in zip(blocks, overlaps)
+              if overlap >= min_overlap * _area(block)]
+    if chosen:
+        return chosen
+    if max(overlaps) > 0:
+        return [blocks[int(np.argmax(overlaps))]]
+
+    cx, cy = (prior[0] + prior[2]) / 2, (prior[1] + prior[3]) / 2
+    return [min(blocks, key=lambda b: ((b[0] + b[2]) / 2 - cx) ** 2 + ((b[1] + b[3]) / 2 - cy) ** 2)]
+
+
+class RegionAligner:
+    """按文字块对齐识别区域，实例可以传给工作进程
+
+    search 为搜索范围向四周扩大的比例（相对区域宽高），
+    work_height 为低分辨率下区域的目标高度（像素），
+    max_growth 为对齐后区域面积相对原区域的上限，超过时认为检测不可信。
+    """
+
+    def __init__(self, search=0.5, work_height=32, max_growth=4.0, padding=0.2):
+        self.search = search
+        self.work_height = work_height
+        self.max_growth = max_growth
+        self.padding = padding
+
+    @property
+    def signature(self):
+        """对齐配置的文字描述，作为识别结果缓存键的一部分"""
+        return f"{self.search}:{self.work_height}:{self.max_growth}:{self.padding}"
+
+    def window(self, box, size):
+        """区域的搜索范围（像素坐标），不超出图片"""
+        x0, y0, x1, y1 = box
+        dx = round((x1 - x0) * self.search)
+        dy = round((y1 - y0) * self.search)
+        width, height = size
+        return (max(0, x0 - dx), max(0, y0 - dy), min(width, x1 + dx), min(height, y1 + dy))
+
+    def __call__(self, image, prior):
+        """在搜索范围的图片中找到文字所在的区域
+
+        prior 为用户框选区域在 image 中的坐标，返回对齐后的区域（同一坐标系）。
+        """
+        x0, y0, x1, y1 = prior
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            return prior
+
+        # 按整数倍缩小，区域高度接近 work_height
+        factor = max(1, (y1 - y0) // self.work_height)
+        # 先缩小再转灰度，只处理缩小后的像素
+        small = image.reduce(factor) if factor > 1 else image
+        gray = to_gray(small)
+        if gray.size == 0 or float(gray.max() - gray.min()) < 32:
+            # 几乎没有对比度，没有可找的文字
+            return prior
+
+        ink = binarize(gray)
+        low_prior = (x0 // factor, y0 // factor, -(-x1 // factor), -(-y1 // factor))
+        line_height = max(2, (low_prior[3] - low_prior[1]) // 2)
+        mask = _dilate(ink, max(2, line_height // 2), 2)
+        blocks = text_blocks(mask, gap=line_height // 2, min_height=max(3, line_height // 4))
+        chosen = select_blocks(blocks, low_prior)
+        if not chosen:
+            return prior
+
+        left = min(b[0] for b in chosen) * factor
+        top = min(b[1] for b in chosen) * factor
+        # 膨胀只向右、向下扩展，减去多出的部分
+        right = (max(b[2] for b in chosen) - max(2, line_height // 2) + 1) * factor
+        bottom = (max(b[3] for b in chosen) - 1) * factor
+        if right <= left or bottom <= top:
+            return prior
+        if (right - left) * (bottom - top) > self.max_growth * (x1 - x0) * (y1 - y0):
+            return prior
+
+        pad = round((bottom - top) * self.padding)
+        width, height = image.size
+        return (max(0, left - pad), max(0, top - pad),
+                min(width, right + pad), min(height, bottom + pad))
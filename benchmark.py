@@ -0,0 +1,337 @@
+"""性能基准测试
+
+离线生成带文字的合成图片（不同分辨率和格式），分别计时：
+- preview：预览图读取和缩放（高质量与快速两种）
+- ocr：按区域解码裁剪（以及先对齐区域再裁剪），每种识别引擎逐张识别和合并识别
+- rename：大量重名时的重命名
+- pipeline：多进程识别并重命名的完整流程
+结果写成JSON，可以用 --compare 与之前提交的结果对比。
+
+示例：
+    python benchmark.py --out bench.json
+    python benchmark.py --sizes 1280x960,4000x3000 --formats png,jpg --count 10 --out new.json
+    python benchmark.py --compare bench.json --out new.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageDraw, ImageFont
+
+from align import RegionAligner
+from image_io import load_regions
+from metrics import StageTimings
+from name_index import NameIndex
+from ocr_engine import BACKENDS, create_engine, resolve_backend
+from preview_cache import PreviewCache
+from renamer_core import OcrPool, load_aligned, ocr_regions, rename_batch, rename_image
+
+# 合成图片中文字所在的区域（比例坐标）
+TEXT_BOX = (0.05, 0.04, 0.65, 0.12)
+
+# 生成文字使用的字符
+_CHARS = 'ABCDEFGHJKLMNPQRSTUVWXYZ0123456789'
+
+
+def _load_font(size):
+    """优先使用 DejaVuSans，没有时使用 Pillow 自带的字体"""
+    try:
+        return ImageFont.truetype('DejaVuSans.ttf', size)
+    except OSError:
+        try:
+            return ImageFont.load_default(size)
+        except TypeError:
+            # Pillow 10.1 之前自带的字体不能指定大小
+            return ImageFont.load_default()
+
+
+def make_corpus(directory, sizes, formats, count, seed=0):
+    """生成合成图片，相同参数和种子总是生成相同的图片，返回 {(尺寸, 格式): [路径]}"""
+    rng = random.Random(seed)
+    corpus = {}
+    for width, height in sizes:
+        for fmt in formats:
+            subdir = os.path.join(directory, f"{width}x{height}_{fmt}")
+            os.makedirs(subdir, exist_ok=True)
+            font = _load_font(max(12, int(height * (TEXT_BOX[3] - TEXT_BOX[1]) * 0.6)))
+            paths = []
+            for i in range(count):
+                text = ''.join(rng.choice(_CHARS) for _ in range(10))
+                image = Image.new('RGB', (width, height), (250, 250, 245))
+                draw = ImageDraw.Draw(image)
+                # 一些随机线条模拟版面内容
+                for _ in range(20):
+                    y = rng.randrange(int(height * 0.2), height)
+                    draw.line((rng.randrange(width), y, rng.randrange(width), y),
+                              fill=(120, 120, 120), width=max(1, height // 500))
+                draw.text((int(width * TEXT_BOX[0]) + 4, int(height * TEXT_BOX[1]) + 4),
+                          text, fill=(20, 20, 20), font=font)
+
+                path = os.path.join(subdir, f"{i:04d}.{fmt}")
+                if fmt in ('jpg', 'jpeg'):
+                    image.save(path, quality=90)
+                else:
+                    image.save(path)
+                paths.append(path)
+            corpus[(width, height), fmt] = paths
+    return corpus
+
+
+def measure(func, repeat):
+    """执行 func 若干次，返回每次的耗时（秒）"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def make_result(name, params, times, items):
+    """整理一项基准测试的结果，per_item 为每张图片（每个文件）的平均耗时"""
+    best = min(times)
+    return {
+        'name': name,
+        'params': params,
+        'items': items,
+        'times': [round(t, 6) for t in times],
+        'min': round(best, 6),
+        'median': round(statistics.median(times), 6),
+        'stdev': round(statistics.stdev(times), 6) if len(times) > 1 else 0.0,
+        'per_item': round(best / items, 6) if items else None
+    }
+
+
+def bench_preview(paths, repeat, box_size=(1280, 800)):
+    """预览图：每次使用新缓存，测量冷启动的读取和缩放"""
+    def run(fast):
+        cache = PreviewCache(level_size=(1920, 1080))
+        for path in paths:
+            if fast:
+                cache.get_fast(path, box_size)
+            else:
+                cache.get(path, box_size)
+
+    return [('preview', {'fast': False}, measure(lambda: run(False), repeat)),
+            ('preview', {'fast': True}, measure(lambda: run(True), repeat))]
+
+
+def bench_ocr(paths, repeat, backends, lang):
+    """按区域解码裁剪，以及各识别引擎的识别"""
+    results = [('decode_crop', {}, measure(
+        lambda: [load_regions(path, [TEXT_BOX]) for path in paths], repeat))]
+    # 对齐包括解码更大的搜索范围，与 decode_crop 的差值就是对齐的额外开销
+    aligner = RegionAligner()
+    results.append(('decode_crop', {'align': True}, measure(
+        lambda: [load_aligned(path, [TEXT_BOX], aligner, StageTimings()) for path in paths],
+        repeat)))
+
+    regions = {'text': TEXT_BOX}
+    for backend in backends:
+        try:
+            resolve_backend(backend)
+            engine = create_engine(lang, backend)
+        except RuntimeError as e:
+            print(f"跳过 {backend}: {e}", file=sys.stderr)
+            continue
+        with engine:
+            # 先识别一次，排除模型加载的耗时
+            ocr_regions(paths[0], regions, engine)
+            results.append(('ocr', {'backend': backend}, measure(
+                lambda: [ocr_regions(path, regions, engine) for path in paths], repeat)))
+
+        # 所有图片合并成一次识别调用
+        def run_batch():
+            with OcrPool(workers=1, lang=lang, backend=backend, batch_size=len(paths)) as pool:
+                list(pool.recognize(paths, regions))
+        results.append(('ocr', {'backend': backend, 'batch': True}, measure(run_batch, repeat)))
+    return results
+
+
+def bench_rename(directory, count, repeat):
+    """所有文件识别出相同的文字，测量大量重名时分配编号和重命名的耗时"""
+    def run(use_index):
+        workdir = os.path.join(directory, 'rename')
+        shutil.rmtree(workdir, ignore_errors=True)
+        os.makedirs(workdir)
+        paths = []
+        for i in range(count):
+            path = os.path.join(workdir, f"src_{i:06d}.png")
+            open(path, 'wb').close()
+            paths.append(path)
+
+        names = NameIndex() if use_index else None
+        start = time.perf_counter()
+        for path in paths:
+            rename_image(path, 'INVOICE', names=names)
+        return time.perf_counter() - start
+
+    # 只统计重命名本身，不包括准备文件的时间
+    return [('rename', {'collisions': True, 'name_index': use_index},
+             [run(use_index) for _ in range(repeat)])
+            for use_index in (True, False)]
+
+
+def bench_pipeline(paths, directory, repeat, workers, lang):
+    """多进程识别并重命名的完整流程，每次在图片副本上运行"""
+    def run():
+        workdir = os.path.join(directory, 'pipeline')
+        shutil.rmtree(workdir, ignore_errors=True)
+        os.makedirs(workdir)
+        copies = []
+        for path in paths:
+            copy = os.path.join(workdir, os.path.basename(path))
+            shutil.copyfile(path, copy)
+            copies.append(copy)
+
+        start = time.perf_counter()
+        for _ in rename_batch(copies, TEXT_BOX, workers=workers, lang=lang):
+            pass
+        return time.perf_counter() - start
+
+    return [('pipeline', {'workers': workers}, [run() for _ in range(repeat)])]
+
+
+def git_revision():
+    """当前提交的哈希，不在 git 仓库中时为 None"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def result_key(result):
+    """用于对比两次结果的键"""
+    return result['name'], json.dumps(result['params'], sort_keys=True)
+
+
+def compare(old_report, new_report):
+    """逐项对比两次结果中每张图片的平均耗时"""
+    old = {result_key(r): r for r in old_report['results']}
+    for result in new_report['results']:
+        previous = old.get(result_key(result))
+        if previous is None or not previous['per_item']:
+            continue
+        ratio = result['per_item'] / previous['per_item']
+        print(f"{result['name']:12} {json.dumps(result['params'], ensure_ascii=False):60} "
+              f"{previous['per_item'] * 1000:8.2f} -> {result['per_item'] * 1000:8.2f} ms/张"
+              f"  x{ratio:.2f}")
+
+
+def parse_sizes(value):
+    """解析 1280x960,4000x3000 格式的尺寸列表"""
+    sizes = []
+    for item in value.split(','):
+        width, _, height = item.partition('x')
+        try:
+            sizes.append((int(width), int(height)))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"无效的尺寸: {item}")
+    return sizes
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="图片重命名流程的性能基准测试")
+    parser.add_argument('--sizes', type=parse_sizes, default=parse_sizes('1280x960,4000x3000'),
+                        help="合成图片的尺寸，默认 1280x960,4000x3000")
+    parser.add_argument('--formats', default='png,jpg',
+                        help="合成图片的格式，默认 png,jpg")
+    parser.add_argument('--count', type=int, default=10,
+                        help="每种尺寸和格式生成的图片数，默认 10")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="生成图片的随机种子")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="每项测试的重复次数，默认 3")
+    parser.add_argument('--backends', default=','.join(b for b in BACKENDS if b != 'auto'),
+                        help="要测试的识别引擎，默认全部")
+    parser.add_argument('--lang', default='eng',
+                        help="识别语言，默认 eng")
+    parser.add_argument('--rename-count', type=int, default=2000,
+                        help="重名测试的文件数，默认 2000")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="完整流程测试的进程数，默认等于CPU核心数")
+    parser.add_argument('--only', default='preview,ocr,rename,pipeline',
+                        help="只运行部分测试，逗号分隔")
+    parser.add_argument('--workdir',
+                        help="生成图片的目录，默认使用临时目录并在结束后删除")
+    parser.add_argument('--out', default='benchmark.json',
+                        help="结果文件，默认 benchmark.json")
+    parser.add_argument('--compare', metavar='PATH',
+                        help="与之前的结果文件对比")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    only = set(args.only.split(','))
+    formats = args.formats.split(',')
+    backends = [b for b in args.backends.split(',') if b]
+
+    directory = args.workdir or tempfile.mkdtemp(prefix='image_renamer_bench_')
+    results = []
+    try:
+        corpus = make_corpus(directory, args.sizes, formats, args.count, args.seed)
+        for ((width, height), fmt), paths in corpus.items():
+            params = {'size': f"{width}x{height}", 'format': fmt}
+            print(f"{params['size']} {fmt}", file=sys.stderr)
+            entries = []
+            if 'preview' in only:
+                entries += bench_preview(paths, args.repeat)
+            if 'ocr' in only:
+                entries += bench_ocr(paths, args.repeat, backends, args.lang)
+            if 'pipeline' in only:
+                entries += bench_pipeline(paths, directory, args.repeat, args.workers, args.lang)
+            for name, extra, times in entries:
+                results.append(make_result(name, {**params, **extra}, times, len(paths)))
+
+        if 'rename' in only:
+            for name, extra, times in bench_rename(directory, args.rename_count, args.repeat):
+                results.append(make_result(name, {'count': args.rename_count, **extra},
+                                           times, args.rename_count))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    report = {
+        'revision': git_revision(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {
+            'sizes': [f"{w}x{h}" for w, h in args.sizes],
+            'formats': formats,
+            'count': args.count,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'lang': args.lang
+        },
+        'results': results
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for result in results:
+        per_item = result['per_item'] * 1000 if result['per_item'] is not None else 0.0
+        print(f"{result['name']:12} {json.dumps(result['params'], ensure_ascii=False):60} "
+              f"{result['min']:10.4f}s  {per_item:8.2f} ms/张")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""保存的裁剪方案，固定版式的文档不需要每次手动框选
+
+方案保存在JSON文件中，每个方案包含若干命名的识别区域和文件名模板：
+    {"发票": {"regions": {"date": [...], "no": [...]}, "template": "{date}_{no}"}}
+裁剪框统一使用相对图片宽高的比例坐标（0~1），同一个方案可以用于不同分辨率的图片。
+"""
+import json
+import os
+
+from renamer_core import DEFAULT_TEMPLATE, as_regions
+
+DEFAULT_PROFILES_PATH = os.path.join(
+    os.environ.get('XDG_CONFIG_HOME') or os.path.join(os.path.expanduser('~'), '.config'),
+    'image_renamer',
+    'profiles.json'
+)
+
+
+class ProfileStore:
+    """读写裁剪方案文件"""
+
+    def __init__(self, path=DEFAULT_PROFILES_PATH):
+        self.path = path
+        self._profiles = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self._profiles = json.load(f)
+
+    def names(self):
+        """所有方案名称"""
+        return sorted(self._profiles)
+
+    def get(self, name):
+        """返回方案的 (区域字典, 文件名模板)，区域使用比例坐标"""
+        if name not in self._profiles:
+            raise KeyError(f"没有名为 {name} 的裁剪方案")
+
+        profile = self._profiles[name]
+        if 'box' in profile:
+            # 只有一个裁剪框的旧格式
+            regions = as_regions(profile['box'])
+        else:
+            regions = profile['regions']
+        regions = {region: tuple(float(c) for c in box) for region, box in regions.items()}
+        return regions, profile.get('template', DEFAULT_TEMPLATE)
+
+    def save(self, name, crop_box, template=DEFAULT_TEMPLATE):
+        """保存方案，crop_box 为单个裁剪框或 {区域名: 裁剪框}，均为比例坐标"""
+        regions = as_regions(crop_box)
+        for box in regions.values():
+            if not all(isinstance(c, float) and 0.0 <= c <= 1.0 for c in box):
+                raise ValueError("裁剪方案必须使用0到1之间的比例坐标")
+
+        self._profiles[name] = {
+            'regions': {region: [round(c, 6) for c in box] for region, box in regions.items()},
+            'template': template
+        }
+        self._write()
+
+    def delete(self, name):
+        """删除方案"""
+        self._profiles.pop(name, None)
+        self._write()
+
+    def _write(self):
+        """先写临时文件再替换，避免写到一半时损坏方案文件"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._profiles, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
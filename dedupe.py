@@ -0,0 +1,274 @@
+"""批次内重复图片的检测，重复的扫描件只识别一次
+
+同一份文件被扫描或导出了两次时，每张图片的识别区域都一样，识别一次就够了。
+检测分两步：
+- 文件内容完全相同的图片直接按文件哈希归为一组
+- 缩小解码后计算感知哈希（dHash），只用来快速找到候选的代表图片；
+  再逐格比较识别区域的低分辨率灰度图，区域中任何一格有明显差别都不算重复
+
+同一版式的单据整页几乎一样，只有编号等几个字不同，
+把两张不同的单据当成重复会让其中一张得不到正确的文件名，所以判断偏向保守：
+区域太小看不清字时只认文件内容完全相同的图片。
+"""
+import os
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import numpy as np
+from PIL import Image
+
+from image_io import decoded_bytes, resolve_box
+from ocr_cache import file_digest
+
+# 重复图片的处理方式：只报告，或者移到子目录
+ACTIONS = ('report', 'move')
+
+# 移走重复图片时使用的子目录名
+DUPLICATE_DIR = 'duplicates'
+
+# 比较识别区域时缩放到的高度（像素），原图中区域比这更矮时不做近似比较
+REGION_HEIGHT = 48
+# 区域比较图的宽度上限，相对高度的倍数
+MAX_REGION_ASPECT = 8
+# 逐格比较时格子的边长（像素）
+CELL_SIZE = 4
+# 查找候选时区域哈希允许不同的位数
+KEY_DISTANCE = 3
+# 区域哈希忽略的亮度变化，平坦背景上的噪点不会翻转哈希位
+KEY_MARGIN = 8
+
+
+def _dhash(gray, width, height, margin=0):
+    """差值哈希：缩小到 (width+1)×height 后比较左右相邻像素，返回整数"""
+    small = np.asarray(gray.resize((width + 1, height), Image.Resampling.BOX), dtype=np.int16)
+    diff = small[:, 1:] - small[:, :-1]
+    bits = np.abs(diff) > margin if margin else diff > 0
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def _neighbour_range(values):
+    """每个像素 3×3 邻域内的最小值和最大值"""
+    padded = np.pad(values, 1, mode='edge')
+    height, width = values.shape
+    stack = np.stack([padded[y:y + height, x:x + width] for y in range(3) for x in range(3)])
+    return stack.min(axis=0), stack.max(axis=0)
+
+
+def region_difference(a, b, cell=CELL_SIZE):
+    """两张区域比较图中差别最大的一格的平均差值（0-255）
+
+    每个像素与另一张图对应位置的 3×3 邻域比较，落在邻域的亮度范围内不算差别，
+    重新压缩和缩放造成的笔画边缘变化因此被忽略，多出或少了的笔画仍会计入。
+    """
+    if a.shape != b.shape:
+        return 255.0
+    a = a.astype(np.int16)
+    b = b.astype(np.int16)
+    low, high = _neighbour_range(b)
+    diff = np.maximum(0, np.maximum(a - high, low - a))
+    low, high = _neighbour_range(a)
+    diff = np.maximum(diff, np.maximum(0, np.maximum(b - high, low - b)))
+
+    height, width = diff.shape
+    rows, columns = max(1, height // cell), max(1, width // cell)
+    cells = diff[:rows * cell, :columns * cell].reshape(rows, cell, columns, cell)
+    return float(cells.mean(axis=(1, 3)).max())
+
+
+class ImageSignature:
+    """一张图片用于查重的特征"""
+
+    def __init__(self, digest, page, key=None, regions=None):
+        # 文件内容哈希
+        self.digest = digest
+        # 整页的 64 位 dHash
+        self.page = page
+        # 第一个区域的 64 位哈希，查找候选用；区域太小时为 None
+        self.key = key
+        # 各区域的低分辨率灰度图（uint8 数组），区域太小时为 None
+        self.regions = regions
+
+
+def image_signature(image_path, crop_boxes, budget=None):
+    """缩小解码图片并计算查重特征，crop_boxes 为各区域的裁剪框
+
+    budget 为 MemoryBudget 时，解码前按解码后的像素大小领取预算。
+    """
+    digest = file_digest(image_path)
+    with Image.open(image_path) as image:
+        size = image.size
+        boxes = [resolve_box(box, size) for box in crop_boxes]
+        heights = [box[3] - box[1] for box in boxes]
+        comparable = bool(boxes) and min(heights) >= REGION_HEIGHT
+        # 缩小后区域仍比比较图高一半以上；不比较区域时尽量缩小，只算整页哈希
+        factor = 8
+        if comparable:
+            factor = 1
+            while factor < 8 and min(heights) / (factor * 2) >= REGION_HEIGHT * 1.5:
+                factor *= 2
+        image.draft('L', (-(-size[0] // factor), -(-size[1] // factor)))
+        # 不支持按比例解码的格式会完整解码，转灰度前后的图片同时存在
+        cost = decoded_bytes(image.size, image.mode) + image.size[0] * image.size[1]
+        with budget.reserve(cost) if budget is not None else nullcontext():
+            gray = image.convert('L')
+            # 退出 with 只关闭文件，close() 才立即释放解码出的像素
+            image.close()
+
+    page = _dhash(gray, 8, 8)
+    if not comparable:
+        return ImageSignature(digest, page)
+
+    scale_x = gray.width / size[0]
+    scale_y = gray.height / size[1]
+    regions = []
+    for x0, y0, x1, y1 in boxes:
+        crop = gray.crop((round(x0 * scale_x), round(y0 * scale_y),
+                          round(x1 * scale_x), round(y1 * scale_y)))
+        width = min(round(REGION_HEIGHT * (x1 - x0) / (y1 - y0)),
+                    REGION_HEIGHT * MAX_REGION_ASPECT)
+        regions.append(np.asarray(crop.resize((max(1, width), REGION_HEIGHT),
+                                              Image.Resampling.BOX)))
+    key = _dhash(Image.fromarray(regions[0]), 16, 4, KEY_MARGIN)
+    return ImageSignature(digest, page, key, regions)
+
+
+def _chunks(value):
+    """把 64 位哈希分成 4 段 16 位，相差不超过 3 位的两个哈希至少有一段相同"""
+    return [(value >> shift) & 0xFFFF for shift in (0, 16, 32, 48)]
+
+
+class DuplicateIndex:
+    """已见过的代表图片的特征索引，按区域哈希分段查找候选再逐格比较
+
+    只在内存中保留最近 max_items 张代表图片的区域比较图，
+    更早的图片只能按文件哈希找到完全相同的重复；文件哈希也只保留最近 max_digests 张。
+    """
+
+    def __init__(self, page_distance=10, max_difference=10.0, max_items=4096,
+                 max_digests=65536):
+        self.page_distance = page_distance
+        self.max_difference = max_difference
+        self.max_items = max_items
+        self.max_digests = max_digests
+        # {文件哈希: 代表图片}，按加入顺序淘汰
+        self._digests = OrderedDict()
+        # {代表图片: 特征}，按加入顺序淘汰
+        self._signatures = OrderedDict()
+        # 4 个分段的 {段值: [代表图片]}
+        self._buckets = [{} for _ in range(4)]
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def find(self, signature):
+        """查找与 signature 重复的代表图片，没有时返回 None"""
+        representative = self._digests.get(signature.digest)
+        if representative is not None or signature.key is None:
+            return representative
+
+        seen = set()
+        for bucket, chunk in zip(self._buckets, _chunks(signature.key)):
+            for candidate in bucket.get(chunk, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                if self._matches(signature, self._signatures[candidate]):
+                    return candidate
+        return None
+
+    def _matches(self, signature, other):
+        if other.key is None or len(other.regions) != len(signature.regions):
+            return False
+        if bin(signature.key ^ other.key).count('1') > KEY_DISTANCE:
+            return False
+        if bin(signature.page ^ other.page).count('1') > self.page_distance:
+            return False
+        return all(region_difference(a, b) <= self.max_difference
+                   for a, b in zip(signature.regions, other.regions))
+
+    def add(self, image_path, signature):
+        """登记一张代表图片"""
+        self._digests[signature.digest] = image_path
+        self._digests.move_to_end(signature.digest)
+        while len(self._digests) > self.max_digests:
+            self._digests.popitem(last=False)
+        if signature.key is None:
+            return
+        self._signatures[image_path] = signature
+        for bucket, chunk in zip(self._buckets, _chunks(signature.key)):
+            bucket.setdefault(chunk, []).append(image_path)
+        while len(self._signatures) > self.max_items:
+            self._forget(*self._signatures.popitem(last=False))
+
+    def _forget(self, image_path, signature):
+        for bucket, chunk in zip(self._buckets, _chunks(signature.key)):
+            paths = bucket[chunk]
+            paths.remove(image_path)
+            if not paths:
+                del bucket[chunk]
+
+
+class DuplicateFinder:
+    """重复图片检测的配置，每个批次用 index() 创建新的索引
+
+    action 为 report 时重复的图片保留原名，只在结果中标出；
+    为 move 时移到图片所在目录下的 directory 子目录中。
+    """
+
+    def __init__(self, action='report', workers=4, lookahead=32, directory=DUPLICATE_DIR,
+                 page_distance=10, max_difference=10.0):
+        if action not in ACTIONS:
+            raise ValueError(f"未知的重复图片处理方式: {action}")
+        self.action = action
+        self.workers = workers
+        self.lookahead = lookahead
+        self.directory = directory
+        self.page_distance = page_distance
+        # 区域中差别最大的一格的平均差值上限（0-255）
+        self.max_difference = max_difference
+
+    def index(self):
+        return DuplicateIndex(self.page_distance, self.max_difference)
+
+    def target(self, image_path):
+        """重复图片移走后的路径，不检查是否重名"""
+        directory, name = os.path.split(image_path)
+        return os.path.join(directory, self.directory, name)
+
+    def is_moved(self, image_path):
+        """图片是否在移走重复图片的子目录中"""
+        return (self.action == 'move'
+                and os.path.basename(os.path.dirname(image_path)) == self.directory)
+
+    def signatures(self, image_paths, crop_boxes, skip=None, budget=None):
+        """在线程池中计算特征，按输入顺序逐个返回 (路径, 特征)
+
+        解码时 Pillow 会释放 GIL，几个线程就能跟上识别进程池的速度。
+        最多提前计算 lookahead 张，输入可以是边扫描边产生路径的生成器；
+        skip(path) 为真的图片和读取失败的图片，特征为 None；
+        budget 为与识别进程共用的 MemoryBudget。
+        """
+        def compute(image_path):
+            if skip is not None and skip(image_path):
+                return None
+            try:
+                return image_signature(image_path, crop_boxes, budget)
+            except (OSError, ValueError, Image.DecompressionBombError):
+                # 读取失败的图片交给识别流程报告错误
+                return None
+
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            try:
+                for image_path in image_paths:
+                    pending.append((image_path, executor.submit(compute, image_path)))
+                    if len(pending) >= self.lookahead:
+                        image_path, future = pending.popleft()
+                        yield image_path, future.result()
+                while pending:
+                    image_path, future = pending.popleft()
+                    yield image_path, future.result()
+            finally:
+                for _, future in pending:
+                    future.cancel()
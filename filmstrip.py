@@ -0,0 +1,186 @@
+"""图片列表的缩略图条
+
+只为能显示下的几个位置创建画布元素，滚动时改写这些位置显示的图片，
+只有正在显示的缩略图持有 PhotoImage，选择上万张图片时内存占用也不会增长。
+"""
+import os
+import queue
+import tkinter as tk
+from tkinter import ttk
+
+from PIL import ImageTk
+
+
+class Filmstrip(ttk.Frame):
+    """可横向滚动的缩略图条，点击缩略图时以序号调用 on_select"""
+
+    # 每个缩略图位置的内边距（像素）
+    PADDING = 6
+    # 文件名标签的高度（像素）
+    LABEL_HEIGHT = 16
+    # 轮询生成结果的间隔（毫秒）
+    POLL_INTERVAL = 80
+
+    def __init__(self, master, cache, on_select, fetch=None):
+        super().__init__(master)
+        self.cache = cache
+        self.on_select = on_select
+        # 文件夹边扫描边浏览时，滚动到末尾前调用 fetch(count) 继续读取图片
+        self.fetch = fetch
+        self.images = []
+        # 第一个位置显示的图片序号
+        self.first = 0
+        self.current = None
+        # 每个位置的画布元素和当前显示的图片序号
+        self.slots = []
+        # 正在显示的缩略图 {图片路径: PhotoImage}，只保留可见的
+        self.photos = {}
+        self._polling = False
+
+        width, height = cache.size
+        self.slot_width = width + self.PADDING * 2
+        self.canvas = tk.Canvas(self, height=height + self.LABEL_HEIGHT + self.PADDING * 2,
+                                bg='#e8e8ec', highlightthickness=0)
+        self.canvas.pack(fill='x')
+        self.scrollbar = ttk.Scrollbar(self, orient='horizontal', command=self.on_scroll)
+        self.scrollbar.pack(fill='x')
+
+        self.canvas.bind('<Configure>', lambda event: self.refresh())
+        self.canvas.bind('<Button-1>', self.on_click)
+        self.canvas.bind('<MouseWheel>', self.on_mouse_wheel)
+        self.canvas.bind('<Shift-MouseWheel>', self.on_mouse_wheel)
+        self.canvas.bind('<Button-4>', lambda event: self.scroll_by(-1))
+        self.canvas.bind('<Button-5>', lambda event: self.scroll_by(1))
+
+    def visible_count(self):
+        """能显示下的缩略图个数，包括右侧只显示一部分的那个"""
+        return max(1, -(-self.canvas.winfo_width() // self.slot_width))
+
+    def set_images(self, images):
+        """显示新的图片列表，列表会被直接引用，调用方追加图片后调用 refresh"""
+        self.images = images
+        self.first = 0
+        self.current = None
+        self.refresh()
+
+    def set_current(self, index):
+        """标出当前图片，不在可见范围内时滚动过去"""
+        self.current = index
+        count = self.visible_count()
+        if index < self.first:
+            self.first = index
+        elif index >= self.first + count - 1:
+            # 最后一个位置可能只显示一部分，让当前图片完整显示
+            self.first = index - count + 2
+        self.refresh()
+
+    def _create_slot(self):
+        x = len(self.slots) * self.slot_width
+        width, height = self.cache.size
+        return {
+            'frame': self.canvas.create_rectangle(x + 2, 2, x + self.slot_width - 2,
+                                                  height + self.LABEL_HEIGHT + self.PADDING * 2 - 2,
+                                                  outline='', width=2),
+            'image': self.canvas.create_image(x + self.slot_width // 2,
+                                              self.PADDING + height // 2, anchor='center'),
+            'label': self.canvas.create_text(x + self.slot_width // 2,
+                                             self.PADDING + height + self.LABEL_HEIGHT // 2,
+                                             font=('微软雅黑', 8), width=self.slot_width - 4),
+            'index': None,
+        }
+
+    def refresh(self):
+        """按当前位置改写各位置显示的图片，只请求可见图片的缩略图"""
+        count = self.visible_count()
+        if self.fetch is not None:
+            self.fetch(self.first + count * 2)
+        total = len(self.images)
+        self.first = max(0, min(self.first, total - count + 1))
+
+        while len(self.slots) < count:
+            self.slots.append(self._create_slot())
+
+        visible = {}
+        missing = []
+        for position, slot in enumerate(self.slots):
+            index = self.first + position
+            if position >= count or index >= total:
+                slot['index'] = None
+                self.canvas.itemconfigure(slot['image'], image='')
+                self.canvas.itemconfigure(slot['label'], text='')
+                self.canvas.itemconfigure(slot['frame'], outline='')
+                continue
+
+            image_path = self.images[index]
+            slot['index'] = index
+            photo = self.photos.get(image_path)
+            if photo is None:
+                thumbnail = self.cache.get(image_path)
+                if thumbnail is not None:
+                    photo = ImageTk.PhotoImage(thumbnail)
+                elif image_path not in self.cache.failed:
+                    missing.append(image_path)
+            if photo is not None:
+                visible[image_path] = photo
+            self.canvas.itemconfigure(slot['image'], image=photo or '')
+            self.canvas.itemconfigure(slot['label'], text=os.path.basename(image_path))
+            self.canvas.itemconfigure(slot['frame'],
+                                      outline='#0078d4' if index == self.current else '')
+        # 滚出可见范围的 PhotoImage 随之释放
+        self.photos = visible
+
+        # 先生成可见的，再预取后面一屏
+        ahead = self.images[self.first + count:self.first + count * 2]
+        self.cache.request(missing + [path for path in ahead if self.cache.get(path) is None])
+        if missing and not self._polling:
+            self._polling = True
+            self.after(self.POLL_INTERVAL, self.poll)
+
+        if total:
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + count) / total))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def poll(self):
+        """取回后台生成好的缩略图，有可见的图片时刷新"""
+        shown = {self.images[slot['index']] for slot in self.slots
+                 if slot['index'] is not None and slot['index'] < len(self.images)}
+        updated = False
+        try:
+            while True:
+                if self.cache.finished.get_nowait() in shown:
+                    updated = True
+        except queue.Empty:
+            pass
+        self._polling = False
+        if updated:
+            self.refresh()
+        elif any(path not in self.photos and path not in self.cache.failed for path in shown):
+            self._polling = True
+            self.after(self.POLL_INTERVAL, self.poll)
+
+    def scroll_to(self, first):
+        self.first = first
+        self.refresh()
+
+    def scroll_by(self, count):
+        self.scroll_to(self.first + count)
+
+    def on_scroll(self, action, value, unit=None):
+        """滚动条的拖动和点击"""
+        if action == 'moveto':
+            self.scroll_to(int(float(value) * len(self.images)))
+        elif unit == 'pages':
+            self.scroll_by(int(value) * max(1, self.visible_count() - 1))
+        else:
+            self.scroll_by(int(value))
+
+    def on_mouse_wheel(self, event):
+        self.scroll_by(-1 if event.delta > 0 else 1)
+
+    def on_click(self, event):
+        position = int(event.x // self.slot_width)
+        if position < len(self.slots):
+            index = self.slots[position]['index']
+            if index is not None:
+                self.on_select(index)
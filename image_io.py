@@ -0,0 +1,226 @@
+"""按区域读取图片，尽量只解码裁剪区域需要的数据"""
+import math
+from contextlib import nullcontext
+
+from PIL import Image
+
+# JPEG 按比例缩小解码时，裁剪区域至少保留的高度（像素），保证OCR精度
+MIN_REGION_HEIGHT = 96
+
+# 未压缩数据每个像素的位数，用于文件中没有记录行字节数的情况
+_RAW_BITS = {
+    '1': 1, '1;I': 1, 'L': 8, 'P': 8, 'I;16': 16, 'I;16B': 16,
+    'RGB': 24, 'BGR': 24, 'RGBA': 32, 'RGBX': 32, 'BGRX': 32, 'CMYK': 32,
+}
+
+# 常见图片格式的文件头
+_SIGNATURES = (
+    b'\x89PNG\r\n\x1a\n',
+    b'\xff\xd8\xff',
+    b'BM',
+    b'GIF87a', b'GIF89a',
+    b'II*\x00', b'MM\x00*',
+)
+
+# Pillow 解码后每个像素占用的字节数，其余模式为 4 字节
+_PIXEL_BYTES = {'1': 1, 'L': 1, 'P': 1, 'I;16': 2, 'I;16B': 2, 'I;16L': 2, 'I;16N': 2}
+
+
+def decoded_bytes(size, mode):
+    """按尺寸和模式估算解码后像素占用的内存（字节）"""
+    return size[0] * size[1] * _PIXEL_BYTES.get(mode, 4)
+
+
+def has_image_header(path):
+    """根据文件头判断是否为图片，只读取开头几个字节"""
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(8)
+    except OSError:
+        return False
+    return header.startswith(_SIGNATURES)
+
+
+def resolve_box(crop_box, size):
+    """把裁剪框换算成图片的像素坐标
+
+    全部为浮点数的裁剪框视为相对图片宽高的比例坐标（0~1），
+    整数裁剪框视为原图像素坐标，直接返回。
+    """
+    if all(isinstance(c, float) for c in crop_box):
+        width, height = size
+        x0, y0, x1, y1 = crop_box
+        return (round(x0 * width), round(y0 * height),
+                round(x1 * width), round(y1 * height))
+    return tuple(int(c) for c in crop_box)
+
+
+def load_regions(image_path, crop_boxes, min_height=MIN_REGION_HEIGHT, budget=None):
+    """打开图片，只解码包含所有裁剪区域的最小矩形
+
+    返回 (解码出的图片, 各区域在该图片中的坐标)。
+    budget 为 MemoryBudget 时，解码前按解码后的像素大小领取预算，
+    裁剪完关闭整页图片后归还。解码方式：
+    - JPEG：利用 DCT 缩放按 1/2、1/4、1/8 解码，最小的区域高度不低于 min_height
+    - 分块/分条存储的 TIFF：只解码与区域相交的块
+    - 未压缩的 BMP/TIFF：只读取区域所在的行
+    - 非隔行 PNG：解码到区域底部即停止
+    其他格式按原方式完整解码。
+    """
+    with Image.open(image_path) as image:
+        boxes = [resolve_box(crop_box, image.size) for crop_box in crop_boxes]
+        union = _bounding_box(boxes)
+        tile = image.tile
+
+        # 原图坐标到解码结果坐标的换算：x 乘 scale_x，y 乘 scale_y 再减 top
+        scale_x = scale_y = 1.0
+        top = 0
+        if image.format == 'JPEG':
+            region_height = min(b[3] - b[1] for b in boxes)
+            scale_x, scale_y = _draft(image, region_height, min_height)
+        elif len(tile) > 1:
+            _keep_tiles(image, union)
+        elif len(tile) == 1 and tile[0][0] == 'raw':
+            top = _read_band(image, union)
+        elif (len(tile) == 1 and image.format == 'PNG'
+              and not image.info.get('interlace')):
+            _stop_at_row(image, union[3])
+
+        boxes = [_map_box(box, scale_x, scale_y, top) for box in boxes]
+        union = _bounding_box(boxes)
+        # 裁剪时才真正解码，整页和裁剪结果同时存在
+        cost = (decoded_bytes(image.size, image.mode)
+                + decoded_bytes((union[2] - union[0], union[3] - union[1]), image.mode))
+        with budget.reserve(cost) if budget is not None else nullcontext():
+            region = image.crop(union)
+            # 退出 with 只关闭文件，close() 才立即释放整页像素
+            image.close()
+
+    local_boxes = [(b[0] - union[0], b[1] - union[1], b[2] - union[0], b[3] - union[1])
+                   for b in boxes]
+    return region, local_boxes
+
+
+def _bounding_box(boxes):
+    """包含所有矩形的最小矩形"""
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+def _map_box(box, scale_x, scale_y, top):
+    """把原图坐标换算成解码结果中的坐标，向外取整"""
+    if scale_x == 1.0 and scale_y == 1.0:
+        return box[0], box[1] - top, box[2], box[3] - top
+    return (math.floor(box[0] * scale_x), math.floor(box[1] * scale_y) - top,
+            math.ceil(box[2] * scale_x), math.ceil(box[3] * scale_y) - top)
+
+
+def image_size(image_path):
+    """读取图片尺寸，只解析文件头"""
+    with Image.open(image_path) as image:
+        return image.size
+
+
+def fit_size(image_size, box_size, margin=0.9):
+    """计算保持纵横比放入显示区域后的尺寸，留出一些边距"""
+    img_width, img_height = image_size
+    box_width, box_height = box_size
+    scale_ratio = min(box_width / img_width, box_height / img_height) * margin
+    return max(1, int(img_width * scale_ratio)), max(1, int(img_height * scale_ratio))
+
+
+def load_level(image_path, max_size):
+    """读取不超过 max_size 的中等分辨率图，返回 (图片, 原图尺寸)
+
+    预览图都从这一层缩放得到，避免每次重新解码原图。
+    """
+    with Image.open(image_path) as image:
+        original_size = image.size
+        level_size = fit_size(original_size, max_size, margin=1.0)
+        if level_size[0] > original_size[0] or level_size[1] > original_size[1]:
+            level_size = original_size
+
+        # JPEG 直接按接近目标的尺寸解码，避免完整解码大图
+        image.draft('RGB', level_size)
+        if image.mode not in ('RGB', 'RGBA', 'L'):
+            image = image.convert('RGBA')
+        return image.resize(level_size, Image.Resampling.LANCZOS, reducing_gap=3.0), original_size
+
+
+def load_thumbnail(image_path, size):
+    """读取不超过 size 的缩略图
+
+    JPEG 直接按接近目标的尺寸解码，大图只需要解码一小部分数据。
+    """
+    with Image.open(image_path) as image:
+        image.draft('RGB', size)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.thumbnail(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+        # 关闭文件后原图对象不能再使用，返回独立的副本
+        return image.copy()
+
+
+def _draft(image, region_height, min_height):
+    """让 JPEG 解码器直接输出缩小的图片，返回宽高的缩放比例"""
+    width, height = image.size
+    scale = 1
+    while scale < 8 and region_height / (scale * 2) >= min_height:
+        scale *= 2
+    if scale == 1:
+        return 1.0, 1.0
+
+    image.draft(None, (-(-width // scale), -(-height // scale)))
+    return image.size[0] / width, image.size[1] / height
+
+
+def _keep_tiles(image, box):
+    """只保留与裁剪区域相交的数据块"""
+    x0, y0, x1, y1 = box
+    image.tile = [
+        t for t in image.tile
+        if t[1][0] < x1 and t[1][2] > x0 and t[1][1] < y1 and t[1][3] > y0
+    ]
+
+
+def _read_band(image, box):
+    """未压缩数据只读取区域所在的行，返回该行带在原图中的起始行"""
+    width, height = image.size
+    decoder, extents, offset, args = image.tile[0]
+    if isinstance(args, str):
+        args = (args,)
+    rawmode = args[0]
+    stride = args[1] if len(args) > 1 else 0
+    orientation = args[2] if len(args) > 2 else 1
+
+    if extents != (0, 0, width, height):
+        return 0
+    if not stride:
+        if rawmode not in _RAW_BITS:
+            return 0
+        stride = (width * _RAW_BITS[rawmode] + 7) // 8
+
+    top = max(0, min(box[1], height - 1))
+    bottom = max(top + 1, min(box[3], height))
+    if orientation < 0:
+        # 自下而上存储的行（BMP）
+        offset += (height - bottom) * stride
+    else:
+        offset += top * stride
+
+    image.tile = [(decoder, (0, 0, width, bottom - top), offset,
+                   (rawmode, stride, orientation))]
+    image._size = (width, bottom - top)
+    return top
+
+
+def _stop_at_row(image, bottom):
+    """按行顺序解码的格式只解码到区域底部"""
+    width, height = image.size
+    decoder, extents, offset, args = image.tile[0]
+    bottom = max(1, min(bottom, height))
+    if extents != (0, 0, width, height) or bottom == height:
+        return
+
+    image.tile = [(decoder, (0, 0, width, bottom), offset, args)]
+    image._size = (width, bottom)
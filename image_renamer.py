@@ -1,13 +1,44 @@
 import os
+import queue
 import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
+from tkinter import filedialog, messagebox, simpledialog, ttk
 import ctypes
 
-import pytesseract
-from PIL import Image, ImageTk
+from PIL import ImageTk
+
+from align import RegionAligner
+from crop_profiles import ProfileStore
+from dedupe import DUPLICATE_DIR, DuplicateFinder
+from filmstrip import Filmstrip
+from metrics import RunMetrics
+from ocr_cache import OcrCache
+from ocr_policy import RetryPolicy
+from plan_view import PlanWindow
+from preprocess import Preprocessor
+from preview_cache import PreviewCache
+from rename_job import RenameJob
+from rename_journal import JOURNAL_NAME, RenameJournal
+from renamer_core import (DEFAULT_REGION, DEFAULT_TEMPLATE, IMAGE_EXTENSIONS, format_name,
+                          scan_images)
+from thumbnail_cache import ThumbnailCache
+
+
+# 最近一次重命名的耗时统计报告
+METRICS_PATH = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+    'image_renamer',
+    'last_run_metrics.json'
+)
 
 
 class ImageRenamer:
+    # 轮询后台任务事件队列的间隔（毫秒）
+    JOB_POLL_INTERVAL = 100
+    # 前后各预取的图片数
+    PREFETCH_COUNT = 2
+    # 窗口停止调整多久后生成高质量预览图（毫秒）
+    RESIZE_SETTLE_DELAY = 200
+
     def __init__(self, root):
         self.root = root
 
@@ -26,9 +57,6 @@ class ImageRenamer:
         self.root.title("图片重命名工具")
         self.root.configure(bg="#f5f5f7")
 
-        # 绑定窗口大小变化事件
-        self.root.bind('<Configure>', self.on_window_resize)
-
         # 设置窗口图标
         try:
             self.root.iconbitmap("icon.ico")  # 如果有图标文件，可以设置
@@ -40,6 +68,9 @@ class ImageRenamer:
 
         # 初始化变量
         self.images = []
+        # 选择文件夹时为文件夹路径，图片列表随浏览逐步从目录扫描中读取
+        self.image_source = None
+        self.image_iter = None
         self.current_image = None
         self.current_image_index = 0
         self.selection_coords = None
@@ -53,6 +84,33 @@ class ImageRenamer:
         self.last_x = 0
         self.last_y = 0
 
+        # 后台重命名任务及其日志
+        self.job = None
+        self.journal = None
+
+        # 保存的裁剪方案
+        self.profile_store = ProfileStore()
+
+        # 命名的识别区域（比例坐标）及组合文件名的模板
+        self.regions = {}
+        self.template = DEFAULT_TEMPLATE
+
+        # 识别结果缓存，重复处理同样的图片时跳过OCR
+        try:
+            self.ocr_cache = OcrCache()
+        except Exception:
+            self.ocr_cache = None
+
+        # 预览图缓存，中等分辨率层按屏幕大小解码
+        self.preview_cache = PreviewCache(
+            level_size=(root.winfo_screenwidth(), root.winfo_screenheight())
+        )
+        self.resize_timer = None
+        self.fast_refresh_pending = False
+
+        # 缩略图缓存，后台生成并保存在磁盘上
+        self.thumbnail_cache = ThumbnailCache()
+
         # 创建自定义样式
         self.create_styles()
 
@@ -142,6 +200,14 @@ class ImageRenamer:
         )
         self.select_button.pack(side="left", padx=10)
 
+        self.select_folder_button = ttk.Button(
+            self.toolbar,
+            text="选择文件夹",
+            command=self.select_folder,
+            style='Accent.TButton'
+        )
+        self.select_folder_button.pack(side="left", padx=10)
+
         self.rename_button = ttk.Button(
             self.toolbar,
             text="重命名图片",
@@ -150,6 +216,96 @@ class ImageRenamer:
         )
         self.rename_button.pack(side="left", padx=10)
 
+        # 先识别出所有新文件名，检查修改后再执行
+        self.plan_button = ttk.Button(
+            self.toolbar,
+            text="生成计划",
+            command=self.plan_images,
+            style='Accent.TButton'
+        )
+        self.plan_button.pack(side="left", padx=10)
+
+        self.pause_button = ttk.Button(
+            self.toolbar,
+            text="暂停",
+            command=self.toggle_pause_job,
+            style='Accent.TButton',
+            state="disabled"
+        )
+        self.pause_button.pack(side="left", padx=10)
+
+        self.cancel_button = ttk.Button(
+            self.toolbar,
+            text="取消",
+            command=self.cancel_job,
+            style='Accent.TButton',
+            state="disabled"
+        )
+        self.cancel_button.pack(side="left", padx=10)
+
+        self.undo_button = ttk.Button(
+            self.toolbar,
+            text="撤销重命名",
+            command=self.undo_rename,
+            style='Accent.TButton'
+        )
+        self.undo_button.pack(side="left", padx=10)
+
+        # OCR并行进程数
+        workers_label = ttk.Label(
+            self.toolbar,
+            text="OCR进程数",
+            font=('微软雅黑', 11),
+            background='#f5f5f7'
+        )
+        workers_label.pack(side="left", padx=(20, 5))
+
+        self.workers_var = tk.IntVar(value=os.cpu_count() or 1)
+        self.workers_spinbox = ttk.Spinbox(
+            self.toolbar,
+            from_=1,
+            to=64,
+            width=4,
+            textvariable=self.workers_var
+        )
+        self.workers_spinbox.pack(side="left")
+
+        # 识别前对扫描件做灰度、二值化、纠偏等预处理
+        self.preprocess_var = tk.BooleanVar(value=False)
+        self.preprocess_check = ttk.Checkbutton(
+            self.toolbar,
+            text="预处理",
+            variable=self.preprocess_var
+        )
+        self.preprocess_check.pack(side="left", padx=(20, 0))
+
+        # 标签位置每页略有偏移时，按每张图片的版面对齐选择框
+        self.align_var = tk.BooleanVar(value=False)
+        self.align_check = ttk.Checkbutton(
+            self.toolbar,
+            text="自动对齐",
+            variable=self.align_var
+        )
+        self.align_check.pack(side="left", padx=(10, 0))
+
+        # 同一份文件扫描了两次时只识别一次，重复的图片移到子目录
+        self.dedupe_var = tk.BooleanVar(value=False)
+        self.dedupe_check = ttk.Checkbutton(
+            self.toolbar,
+            text="查重",
+            variable=self.dedupe_var
+        )
+        self.dedupe_check.pack(side="left", padx=(10, 0))
+
+        # 置信度低的区域换用单行模式、放大后重新识别，会多调用几次识别引擎
+        self.retry_var = tk.BooleanVar(value=False)
+        self.retry_check = ttk.Checkbutton(
+            self.toolbar,
+            text="重新识别",
+            variable=self.retry_var
+        )
+        self.retry_check.pack(side="left", padx=(10, 0))
+
         # 添加帮助按钮
         self.help_button = ttk.Button(
             self.toolbar,
@@ -183,6 +339,18 @@ class ImageRenamer:
         self.canvas.bind("<ButtonRelease-1>", self.on_release)
         self.canvas.bind("<Motion>", self.on_motion)
 
+        # 绑定画布大小变化事件
+        self.canvas.bind("<Configure>", self.on_window_resize)
+
+        # 缩略图条，点击缩略图跳到对应的图片
+        self.filmstrip = Filmstrip(
+            self.image_container,
+            self.thumbnail_cache,
+            on_select=self.show_image_at,
+            fetch=self.ensure_images
+        )
+        self.filmstrip.pack(fill="x", padx=2, pady=(8, 0))
+
         # 创建导航按钮框架
         self.nav_frame = ttk.Frame(self.image_container, style='Toolbar.TFrame')
         self.nav_frame.pack(fill="x", pady=10)
@@ -222,6 +390,43 @@ class ImageRenamer:
         )
         self.clear_button.pack(side="right", padx=10)
 
+        # 把当前选择框加为命名区域
+        self.add_region_button = ttk.Button(
+            self.nav_frame,
+            text="添加区域",
+            command=self.add_region,
+            style='Nav.TButton'
+        )
+        self.add_region_button.pack(side="right", padx=10)
+
+        # 裁剪方案
+        self.save_profile_button = ttk.Button(
+            self.nav_frame,
+            text="保存方案",
+            command=self.save_profile,
+            style='Nav.TButton'
+        )
+        self.save_profile_button.pack(side="right", padx=10)
+
+        self.profile_var = tk.StringVar()
+        self.profile_combobox = ttk.Combobox(
+            self.nav_frame,
+            textvariable=self.profile_var,
+            values=self.profile_store.names(),
+            state="readonly",
+            width=16
+        )
+        self.profile_combobox.pack(side="right", padx=5)
+        self.profile_combobox.bind("<<ComboboxSelected>>", self.on_profile_selected)
+
+        profile_label = ttk.Label(
+            self.nav_frame,
+            text="裁剪方案",
+            font=('微软雅黑', 11),
+            background='#f5f5f7'
+        )
+        profile_label.pack(side="right", padx=(20, 5))
+
     def create_status_bar(self):
         """创建底部状态栏"""
         self.status_frame = ttk.Frame(self.main_frame, style='Status.TFrame')
@@ -236,6 +441,13 @@ class ImageRenamer:
         )
         self.status_label.pack(fill="x")
 
+        # 批量处理进度条
+        self.progress_bar = ttk.Progressbar(
+            self.status_frame,
+            mode='determinate'
+        )
+        self.progress_bar.pack(fill="x", padx=5)
+
         # 提示信息
         self.tip_label = ttk.Label(
             self.status_frame,
@@ -246,13 +458,15 @@ class ImageRenamer:
 
     def update_status(self, message):
         """更新状态信息"""
+        # 不在这里强制刷新，交给Tk事件循环在空闲时重绘
         self.status_label.config(text=message)
-        self.root.update()
 
     def update_image_counter(self):
         """更新图片计数器"""
         if self.images:
-            self.count_label.config(text=f"{self.current_image_index + 1}/{len(self.images)}")
+            # 文件夹还没扫描完时总数未知
+            more = "+" if self.image_iter is not None else ""
+            self.count_label.config(text=f"{self.current_image_index + 1}/{len(self.images)}{more}")
         else:
             self.count_label.config(text="0/0")
 
@@ -260,31 +474,76 @@ class ImageRenamer:
         """选择多个图片文件"""
         file_paths = filedialog.askopenfilenames(
             title="选择图片",
-            filetypes=[("Image files", "*.png *.jpg *.jpeg *.bmp *.gif")]
+            filetypes=[("Image files", ' '.join('*' + ext for ext in IMAGE_EXTENSIONS))]
         )
         if file_paths:
+            self.image_source = None
+            self.image_iter = None
             self.images = list(file_paths)
             self.current_image_index = 0
+            self.filmstrip.set_images(self.images)
+            self.filmstrip.set_current(0)
             self.show_image(self.images[0])
+            if self.profile_var.get() and not self.selection_coords:
+                self.on_profile_selected()
             self.update_status(f"已选择 {len(self.images)} 个文件")
             self.update_image_counter()
 
             # 更新导航按钮状态
             self.update_nav_buttons()
 
-    def show_image(self, image_path):
-        """显示图片在画布上"""
+    def select_folder(self):
+        """选择文件夹，图片在浏览和重命名时边扫描边读取，不先列出整个文件夹"""
+        directory = filedialog.askdirectory(title="选择文件夹")
+        if not directory:
+            return
+
+        self.image_source = directory
+        self.current_image_index = 0
+        self.rescan_folder()
+        if not self.images:
+            messagebox.showwarning("警告", "文件夹中没有图片")
+            return
+
+        self.filmstrip.set_current(0)
+        self.show_image(self.images[0])
+        if self.profile_var.get() and not self.selection_coords:
+            self.on_profile_selected()
+        self.update_status(f"已选择文件夹 {directory}")
+        self.update_image_counter()
+        self.update_nav_buttons()
+
+    def rescan_folder(self):
+        """重新扫描所选文件夹，只读取到当前图片和预取所需的数量"""
+        self.image_iter = scan_images(self.image_source)
+        self.images = []
+        self.ensure_images(self.current_image_index + self.PREFETCH_COUNT + 1)
+        self.current_image_index = min(self.current_image_index, max(0, len(self.images) - 1))
+        self.filmstrip.set_images(self.images)
+        self.filmstrip.set_current(self.current_image_index)
+
+    def ensure_images(self, count):
+        """从文件夹扫描中继续读取图片，直到列表中至少有 count 张或扫描结束"""
+        while self.image_iter is not None and len(self.images) < count:
+            image_path = next(self.image_iter, None)
+            if image_path is None:
+                self.image_iter = None
+            else:
+                self.images.append(image_path)
+
+    def show_image(self, image_path, fast=False):
+        """显示图片在画布上，fast 为真时用快速滤镜缩放"""
         try:
+            # 记下选择框的比例坐标，换图或缩放后按新图片的尺寸重新画出
+            selection = self.get_normalized_selection()
+
             # 清除现有选择框
             if hasattr(self, 'selection_rect'):
                 self.canvas.delete(self.selection_rect)
+                delattr(self, 'selection_rect')
                 self.selection_coords = None
 
-            # 打开图片
-            image = Image.open(image_path)
-
             # 获取画布尺寸
-            self.canvas.update()
             canvas_width = self.canvas.winfo_width()
             canvas_height = self.canvas.winfo_height()
 
@@ -293,18 +552,13 @@ class ImageRenamer:
                 canvas_width = 800
                 canvas_height = 600
 
-            # 计算缩放比例，保持纵横比
-            img_width, img_height = image.size
-            width_ratio = canvas_width / img_width
-            height_ratio = canvas_height / img_height
-            scale_ratio = min(width_ratio, height_ratio) * 0.9  # 留出一些边距
-
-            # 计算新尺寸
-            new_width = int(img_width * scale_ratio)
-            new_height = int(img_height * scale_ratio)
-
-            # 缩放图片
-            resized_image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+            # 从缓存获取缩放后的预览图，保持纵横比
+            canvas_size = (canvas_width, canvas_height)
+            if fast:
+                resized_image, (img_width, img_height) = self.preview_cache.get_fast(image_path, canvas_size)
+            else:
+                resized_image, (img_width, img_height) = self.preview_cache.get(image_path, canvas_size)
+            new_width, new_height = resized_image.size
             self.current_image = ImageTk.PhotoImage(resized_image)
 
             # 清除画布并显示新图片
@@ -327,29 +581,54 @@ class ImageRenamer:
                 'original_height': img_height
             }
 
+            if selection:
+                self.draw_selection(selection)
+            self.draw_regions()
+
+            if fast:
+                return
+
             # 更新状态
             self.update_status(f"当前图片: {os.path.basename(image_path)}")
 
+            # 后台预取前后几张图片
+            self.prefetch_neighbors(canvas_size)
+
         except Exception as e:
             self.update_status(f"加载图片出错: {str(e)}")
 
+    def prefetch_neighbors(self, canvas_size):
+        """在后台预先读取当前图片前后的图片"""
+        index = self.current_image_index
+        self.ensure_images(index + self.PREFETCH_COUNT + 1)
+        neighbors = []
+        for offset in range(1, self.PREFETCH_COUNT + 1):
+            # 先预取下一张，再预取上一张
+            for i in (index + offset, index - offset):
+                if 0 <= i < len(self.images):
+                    neighbors.append(self.images[i])
+        self.preview_cache.prefetch(neighbors, canvas_size)
+
     def show_prev_image(self):
         """显示上一张图片"""
         if not self.images or self.current_image_index <= 0:
             return
-
-        self.current_image_index -= 1
-        self.show_image(self.images[self.current_image_index])
-        self.update_image_counter()
-        self.update_nav_buttons()
+        self.show_image_at(self.current_image_index - 1)
 
     def show_next_image(self):
         """显示下一张图片"""
+        self.ensure_images(self.current_image_index + 2)
         if not self.images or self.current_image_index >= len(self.images) - 1:
             return
+        self.show_image_at(self.current_image_index + 1)
 
-        self.current_image_index += 1
-        self.show_image(self.images[self.current_image_index])
+    def show_image_at(self, index):
+        """显示列表中第 index 张图片"""
+        if not 0 <= index < len(self.images):
+            return
+        self.current_image_index = index
+        self.show_image(self.images[index])
+        self.filmstrip.set_current(index)
         self.update_image_counter()
         self.update_nav_buttons()
 
@@ -368,6 +647,7 @@ class ImageRenamer:
             self.prev_button.config(state="normal")
 
         # 更新下一张按钮状态
+        self.ensure_images(self.current_image_index + 2)
         if self.current_image_index >= len(self.images) - 1:
             self.next_button.config(state="disabled")
         else:
@@ -380,94 +660,414 @@ class ImageRenamer:
                 self.clear_button.config(state="disabled")
 
     def clear_selection(self):
-        """清除当前选择框"""
+        """清除当前选择框，没有选择框时清除已添加的命名区域"""
         if hasattr(self, 'selection_rect'):
             self.canvas.delete(self.selection_rect)
             delattr(self, 'selection_rect')
             self.selection_coords = None
             self.update_status("已清除选择区域")
             self.canvas.config(cursor='')
+        elif self.regions:
+            self.regions = {}
+            self.template = DEFAULT_TEMPLATE
+            self.draw_regions()
+            self.update_status("已清除命名区域")
 
     def show_help(self):
         """显示帮助信息"""
         help_text = """使用说明：
 
-1. 点击"选择图片"按钮选择要处理的图片文件
+1. 点击"选择图片"按钮选择要处理的图片文件，或点击"选择文件夹"处理整个文件夹
 2. 在图片上按住鼠标左键拖动来选择要识别的文字区域
 3. 可以拖动选择框或通过边缘调整其大小
 4. 使用"上一张"/"下一张"按钮浏览多张图片
 5. 点击"重命名图片"按钮，程序将自动识别选中区域的文字并重命名图片
 6. 使用"清除选择"按钮可以清除当前的选择框
+7. 框选后点击"保存方案"可以保存为裁剪方案，以后直接在"裁剪方案"中选择即可
+8. 需要识别多处文字时，每框选一处点击"添加区域"并命名（如 date、no），
+   保存方案时用模板组合文件名，例如 {date}_{no}
+9. 扫描件有噪点、光照不均或歪斜时，勾选"预处理"后再重命名，可以提高识别率
+10. 文字较小或识别结果常有错字时，勾选"重新识别"，置信度低的区域会换用更费时的设置再识别一次
 
 注意：
-- 支持的图片格式：PNG、JPG、JPEG、BMP、GIF
+- 选择框按比例换算，不同分辨率的图片会裁剪相同位置的区域
+- 支持的图片格式：PNG、JPG、JPEG、BMP、GIF、TIFF
 - 文字识别支持中文和英文
 - 重命名时会自动过滤掉不支持的文件名字符"""
 
         messagebox.showinfo("使用帮助", help_text)
 
-    def get_display_to_original_ratio(self):
-        """获取显示图片与原始图片的比例"""
+    def get_normalized_selection(self):
+        """把选择框换算成相对图片宽高的比例坐标，没有选择框时返回 None"""
+        if not self.selection_coords or not hasattr(self, 'image_display_info'):
+            return None
+
+        width = self.image_display_info['width']
+        height = self.image_display_info['height']
+        x0, y0, x1, y1 = self.selection_coords
+        box = (x0 / width, y0 / height, x1 / width, y1 / height)
+        return tuple(min(1.0, max(0.0, float(c))) for c in box)
+
+    def draw_selection(self, box):
+        """按比例坐标在当前图片上画出选择框"""
         if not hasattr(self, 'image_display_info'):
-            return 1.0
-        return (self.image_display_info['original_width'] /
-                self.image_display_info['width'])
+            return
 
-    def rename_images(self):
-        if not self.selection_coords or not self.images:
-            messagebox.showwarning("警告", "请先选择图片并框选区域")
+        info = self.image_display_info
+        self.selection_coords = [
+            box[0] * info['width'],
+            box[1] * info['height'],
+            box[2] * info['width'],
+            box[3] * info['height']
+        ]
+        if hasattr(self, 'selection_rect'):
+            self.canvas.delete(self.selection_rect)
+        self.selection_rect = self.canvas.create_rectangle(
+            self.selection_coords[0] + info['x'],
+            self.selection_coords[1] + info['y'],
+            self.selection_coords[2] + info['x'],
+            self.selection_coords[3] + info['y'],
+            outline='#1a73e8',
+            width=2
+        )
+
+    def add_region(self):
+        """把当前选择框加为命名的识别区域"""
+        selection = self.get_normalized_selection()
+        if not selection:
+            messagebox.showwarning("警告", "请先框选区域")
             return
 
-        total = len(self.images)
-        success = 0
-        failed = 0
+        name = simpledialog.askstring("添加区域", "区域名称（用于文件名模板，如 date）：",
+                                      parent=self.root)
+        if not name:
+            return
+        if not name.isidentifier():
+            messagebox.showwarning("警告", "区域名称只能包含字母、数字和下划线")
+            return
+
+        self.regions[name] = selection
+        self.clear_selection()
+        self.draw_regions()
+        self.update_status(f"已添加区域 {name}，共 {len(self.regions)} 个区域")
+
+    def draw_regions(self):
+        """在当前图片上画出已添加的命名区域"""
+        self.canvas.delete('region')
+        if not hasattr(self, 'image_display_info'):
+            return
 
-        for i, image_path in enumerate(self.images, 1):
+        info = self.image_display_info
+        for name, box in self.regions.items():
+            x0 = box[0] * info['width'] + info['x']
+            y0 = box[1] * info['height'] + info['y']
+            x1 = box[2] * info['width'] + info['x']
+            y1 = box[3] * info['height'] + info['y']
+            self.canvas.create_rectangle(x0, y0, x1, y1, outline='#34a853', width=2,
+                                         dash=(4, 2), tags='region')
+            self.canvas.create_text(x0 + 4, y0 - 2, text=name, anchor='sw',
+                                    fill='#34a853', font=('微软雅黑', 10), tags='region')
+
+    def on_profile_selected(self, event=None):
+        """选择裁剪方案后在当前图片上画出对应的选择框或命名区域"""
+        name = self.profile_var.get()
+        if not name or not self.images:
+            return
+
+        regions, template = self.profile_store.get(name)
+        if list(regions) == [DEFAULT_REGION] and template == DEFAULT_TEMPLATE:
+            # 只有一个区域的方案画成可以继续调整的选择框
+            self.regions = {}
+            self.template = DEFAULT_TEMPLATE
+            self.draw_selection(regions[DEFAULT_REGION])
+        else:
+            self.clear_selection()
+            self.regions = regions
+            self.template = template
+        self.draw_regions()
+        self.update_status(f"已应用裁剪方案: {name}")
+
+    def save_profile(self):
+        """把命名区域或当前选择框保存为裁剪方案"""
+        if self.regions:
+            crop_box = dict(self.regions)
+        else:
+            crop_box = self.get_normalized_selection()
+            if not crop_box:
+                messagebox.showwarning("警告", "请先框选区域")
+                return
+
+        name = simpledialog.askstring("保存裁剪方案", "方案名称：", parent=self.root)
+        if not name:
+            return
+
+        template = DEFAULT_TEMPLATE
+        if self.regions:
+            default = self.template
+            if default == DEFAULT_TEMPLATE:
+                default = '_'.join(f"{{{region}}}" for region in self.regions)
+            template = simpledialog.askstring("保存裁剪方案", "文件名模板：",
+                                              initialvalue=default, parent=self.root)
+            if not template:
+                return
             try:
-                self.update_status(f"正在处理第 {i}/{total} 张图片: {image_path}")
-
-                # 打开图片
-                image = Image.open(image_path)
-
-                # 获取比例并调整坐标
-                ratio = self.get_display_to_original_ratio()
-                real_coords = [int(c * ratio) for c in self.selection_coords]
-
-                # 裁剪选中区域
-                cropped = image.crop(real_coords)
-
-                # OCR识别
-                text = pytesseract.image_to_string(cropped, lang='chi_sim').strip()
-                self.update_status(f"识别文本: {text}")
-
-                if text:
-                    # 获取原始文件扩展名
-                    _, ext = os.path.splitext(image_path)
-                    # 构建新文件名（移除非法字符）
-                    new_name = ''.join(c for c in text if c.isalnum() or c in '._- ') + ext
-                    new_path = os.path.join(os.path.dirname(image_path), new_name)
-
-                    # 检查文件名是否已存在
-                    base, ext = os.path.splitext(new_path)
-                    counter = 1
-                    while os.path.exists(new_path):
-                        new_path = f"{base}_{counter}{ext}"
-                        counter += 1
-
-                    self.update_status(f"重命名文件为: {os.path.basename(new_path)}")
-                    os.rename(image_path, new_path)
-                    success += 1
-                else:
-                    self.update_status("OCR未能识别出文字")
-                    failed += 1
+                format_name(template, {region: '' for region in self.regions})
+            except ValueError as e:
+                messagebox.showwarning("警告", str(e))
+                return
+            self.template = template
+
+        self.profile_store.save(name, crop_box, template)
+        self.profile_combobox.config(values=self.profile_store.names())
+        self.profile_var.set(name)
+        self.update_status(f"已保存裁剪方案: {name}")
+
+    def rename_images(self):
+        self.start_job(dry_run=False)
+
+    def plan_images(self):
+        """只识别不重命名，完成后打开计划窗口"""
+        self.start_job(dry_run=True)
+
+    def start_job(self, dry_run):
+        if self.job is not None:
+            return
+
+        # 使用比例坐标，每张图片按自己的尺寸换算裁剪区域
+        if self.regions:
+            crop_box, template = dict(self.regions), self.template
+        else:
+            crop_box, template = self.get_normalized_selection(), DEFAULT_TEMPLATE
+        if not crop_box or not self.images:
+            messagebox.showwarning("警告", "请先选择图片并框选区域或选择裁剪方案")
+            return
+
+        try:
+            workers = self.workers_var.get()
+        except tk.TclError:
+            workers = None
+
+        preprocess = Preprocessor() if self.preprocess_var.get() else None
+
+        # 重命名记录写入图片所在目录的日志，用于中断后继续和撤销
+        self.journal = None if dry_run else RenameJournal(self.get_journal_path())
 
-            except Exception as e:
-                self.update_status(f"处理图片出错: {str(e)}")
-                failed += 1
+        # 选择的是文件夹时重新扫描，边扫描边识别
+        if self.image_source is not None:
+            image_paths = scan_images(self.image_source)
+        else:
+            image_paths = self.images
+
+        metrics = RunMetrics(workers=workers or os.cpu_count() or 1,
+                             preprocess=bool(preprocess))
+
+        # 在后台线程中处理，界面通过轮询事件队列更新进度
+        self.job = RenameJob(image_paths, crop_box, workers=workers,
+                             journal=self.journal, cache=self.ocr_cache,
+                             template=template, preprocess=preprocess, metrics=metrics,
+                             dry_run=dry_run,
+                             policy=RetryPolicy() if self.retry_var.get() else None,
+                             aligner=RegionAligner() if self.align_var.get() else None,
+                             duplicates=DuplicateFinder('move') if self.dedupe_var.get() else None)
+        self.run_job()
+
+    def apply_plan(self, plan):
+        """执行计划窗口中确认的重命名"""
+        if self.job is not None or not len(plan):
+            return
+        self.journal = RenameJournal(self.get_journal_path())
+        self.job = RenameJob(None, None, journal=self.journal, cache=self.ocr_cache,
+                             metrics=RunMetrics(plan=True), plan=plan)
+        self.run_job()
+
+    def run_job(self):
+        """启动后台任务并开始轮询进度"""
+        self.job.start()
+        self.set_job_controls(running=True)
+        self.root.after(self.JOB_POLL_INTERVAL, self.poll_job)
+
+    def poll_job(self):
+        """读取后台任务的进度事件并更新界面"""
+        job = self.job
+        if job is None:
+            return
+
+        # 一次取完队列中的事件，只刷新一次状态栏
+        message = None
+        finished = None
+        try:
+            while True:
+                kind, data = job.events.get_nowait()
+                if kind == 'start':
+                    if data['total'] is None:
+                        # 文件夹边扫描边处理，总数未知
+                        self.progress_bar.config(mode='indeterminate')
+                        self.progress_bar.start()
+                    else:
+                        self.progress_bar.config(mode='determinate',
+                                                 maximum=max(1, data['total']), value=0)
+                elif kind == 'progress':
+                    if data['total'] is not None:
+                        self.progress_bar.config(value=float(self.progress_bar['value']) + 1)
+                        position = f"{data['index'] + 1}/{data['total']}"
+                    else:
+                        position = f"{data['index'] + 1}"
+                    self.update_image_path(data['index'], data['path'], data['new_path'])
+                    if data.get('duplicate_of') and not data['error']:
+                        message = (f"第 {position} 张图片与 "
+                                   f"{os.path.basename(data['duplicate_of'])} 重复，不再识别"
+                                   + ("" if job.dry_run else f"，已移到 {DUPLICATE_DIR} 子目录"))
+                    elif job.dry_run and data['new_path']:
+                        message = (f"正在识别第 {position} 张图片，"
+                                   f"新文件名: {os.path.basename(data['new_path'])}")
+                    elif data['skipped']:
+                        message = f"正在处理第 {position} 张图片，之前已处理过，跳过"
+
+                    elif data['new_path']:
+                        message = (f"正在处理第 {position} 张图片，"
+                                   f"重命名文件为: {os.path.basename(data['new_path'])}")
+                    else:
+                        message = f"正在处理第 {position} 张图片，处理图片出错: {data['error']}"
+                elif kind == 'error':
+                    message = f"处理图片出错: {data['message']}"
+                elif kind == 'done':
+                    finished = data
+        except queue.Empty:
+            pass
+
+        if message:
+            # 附上实时的吞吐量，便于调整进程数
+            self.update_status(f"{message}（{job.metrics.summary()}）")
+            if not job.dry_run:
+                self.filmstrip.refresh()
+
+        if finished is None:
+            self.root.after(self.JOB_POLL_INTERVAL, self.poll_job)
+            return
+
+        job.join()
+        self.job = None
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        self.set_job_controls(running=False)
+        self.progress_bar.stop()
+        self.progress_bar.config(mode='determinate')
+
+        if job.dry_run:
+            # 只生成了计划，文件没有变化
+            self.update_status(f"计划已生成（{job.metrics.summary()}）")
+            if len(job.plan):
+                PlanWindow(self.root, job.plan, on_apply=self.apply_plan)
+            return
+
+        if self.image_source is not None:
+            # 文件夹中的文件名已经改变，从头重新扫描
+            self.rescan_folder()
+            self.update_image_counter()
+            self.update_nav_buttons()
 
         # 显示处理结果统计
-        result_message = f"处理完成！\n成功: {success} 张\n失败: {failed} 张"
-        messagebox.showinfo("完成", result_message)
+        title = "已取消" if finished['cancelled'] else "完成"
+        result_message = (f"处理{title}！\n成功: {finished['success']} 张\n"
+                          f"失败: {finished['failed']} 张")
+        if finished['skipped']:
+            result_message += f"\n跳过已处理: {finished['skipped']} 张"
+        if finished['duplicates']:
+            result_message += f"\n重复: {finished['duplicates']} 张"
+        result_message += f"\n{job.metrics.summary()}"
+        try:
+            job.metrics.write(METRICS_PATH)
+            result_message += f"\n耗时统计已保存到 {METRICS_PATH}"
+        except OSError:
+            pass
+        self.update_status(result_message.replace("\n", " "))
+        messagebox.showinfo(title, result_message)
+
+    def update_image_path(self, index, old_path, new_path):
+        """图片被重命名后更新列表中的路径"""
+        if not new_path or index >= len(self.images) or self.images[index] != old_path:
+            return
+        self.images[index] = new_path
+        # 缩略图按文件身份保存在磁盘上，改名后仍能命中
+        self.thumbnail_cache.forget(old_path)
+
+    def get_journal_path(self):
+        """当前这批图片的重命名日志路径"""
+        if self.image_source is not None:
+            return os.path.join(self.image_source, JOURNAL_NAME)
+        return os.path.join(os.path.dirname(self.images[0]), JOURNAL_NAME)
+
+    def undo_rename(self):
+        """撤销最近一次批量重命名"""
+        if self.job is not None:
+            return
+
+        if not self.images or not os.path.exists(self.get_journal_path()):
+            messagebox.showwarning("警告", "没有可以撤销的重命名")
+            return
+
+        with RenameJournal(self.get_journal_path()) as journal:
+            if journal.last_batch is None:
+                messagebox.showwarning("警告", "没有可以撤销的重命名")
+                return
+            if not messagebox.askyesno("撤销", "确定要撤销最近一次批量重命名吗？"):
+                return
+
+            restored = {}
+            failed = 0
+            for current_path, original_path, error in journal.rollback():
+                if error:
+                    failed += 1
+                else:
+                    restored[current_path] = original_path
+
+        # 把列表中的路径换回原文件名
+        if self.image_source is not None:
+            self.rescan_folder()
+            self.update_image_counter()
+            self.update_nav_buttons()
+        else:
+            self.images = [restored.get(path, path) for path in self.images]
+            self.filmstrip.set_images(self.images)
+            self.filmstrip.set_current(self.current_image_index)
+
+        result_message = f"撤销完成！\n已还原: {len(restored)} 张\n失败: {failed} 张"
+        self.update_status(result_message.replace("\n", " "))
+        messagebox.showinfo("撤销", result_message)
+
+    def toggle_pause_job(self):
+        """暂停或继续后台任务"""
+        if self.job is None:
+            return
+
+        if self.job.paused:
+            self.job.resume()
+            self.pause_button.config(text="暂停")
+            self.update_status("已继续处理")
+        else:
+            self.job.pause()
+            self.pause_button.config(text="继续")
+            self.update_status("已暂停处理")
+
+    def cancel_job(self):
+        """取消后台任务"""
+        if self.job is None:
+            return
+
+        self.job.cancel()
+        self.pause_button.config(state="disabled")
+        self.cancel_button.config(state="disabled")
+        self.update_status("正在取消...")
+
+    def set_job_controls(self, running):
+        """根据任务运行状态切换按钮"""
+        self.rename_button.config(state="disabled" if running else "normal")
+        self.plan_button.config(state="disabled" if running else "normal")
+        self.undo_button.config(state="disabled" if running else "normal")
+        self.select_button.config(state="disabled" if running else "normal")
+        self.pause_button.config(text="暂停", state="normal" if running else "disabled")
+        self.cancel_button.config(state="normal" if running else "disabled")
 
     def on_press(self, event):
         """处理鼠标按下事件"""
@@ -632,18 +1232,31 @@ class ImageRenamer:
 
     def on_window_resize(self, event):
         """处理窗口大小变化事件"""
-        # 确保事件来自主窗口而不是子组件
-        if event.widget == self.root:
-            # 添加一个小延迟来防止过于频繁的刷新
-            self.root.after_cancel(self.resize_timer) if hasattr(self, 'resize_timer') else None
-            self.resize_timer = self.root.after(100, self.refresh_current_image)
+        if not self.images:
+            return
+
+        # 拖动过程中只在空闲时用快速滤镜重绘一次，合并连续的事件
+        if not self.fast_refresh_pending:
+            self.fast_refresh_pending = True
+            self.root.after_idle(self.refresh_current_image_fast)
+
+        # 停止调整后再生成高质量预览图
+        if self.resize_timer is not None:
+            self.root.after_cancel(self.resize_timer)
+        self.resize_timer = self.root.after(self.RESIZE_SETTLE_DELAY, self.refresh_current_image)
+
+    def refresh_current_image_fast(self):
+        """用缓存的中等分辨率图快速刷新当前图片"""
+        self.fast_refresh_pending = False
+        if self.images:
+            self.show_image(self.images[self.current_image_index], fast=True)
 
     def refresh_current_image(self):
         """刷新当前显示的图片"""
-        if hasattr(self, 'current_image_index') and self.images:
+        self.resize_timer = None
+        if self.images:
             self.show_image(self.images[self.current_image_index])
 
-
 if __name__ == "__main__":
     root = tk.Tk()
     app = ImageRenamer(root)
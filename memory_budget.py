@@ -0,0 +1,54 @@
+"""多个识别进程共享的内存预算
+
+整页解码是处理中占用内存最多的一步（600dpi 的 A4 彩色扫描件解码后约 140MB），
+裁剪出的区域和识别引擎占用的内存小得多。进程数多、图片又大时，
+所有进程同时解码会让内存峰值随进程数成倍增长。
+每个进程解码前按文件头估算的像素大小领取预算，裁剪完释放整页图片后归还，
+同时在解码的图片总大小不超过预算，峰值内存与进程数和批次大小无关。
+"""
+import multiprocessing
+from contextlib import contextmanager
+
+# 默认的解码内存预算（字节）
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+
+
+class MemoryBudget:
+    """按字节计的共享预算，可以在创建进程池时传给工作进程
+
+    单张图片的估计超过整个预算时，等其他进程都归还后独占预算，不会一直等待。
+    """
+
+    def __init__(self, limit=DEFAULT_MEMORY_BUDGET, context=None):
+        context = context or multiprocessing
+        self.limit = max(1, int(limit))
+        # 已领取的字节数，由 _condition 保护
+        self._used = context.RawValue('q', 0)
+        self._condition = context.Condition()
+
+    @property
+    def used(self):
+        return self._used.value
+
+    def acquire(self, size):
+        """等到预算足够时领取 size 字节，返回实际领取的字节数"""
+        size = min(max(0, int(size)), self.limit)
+        with self._condition:
+            self._condition.wait_for(lambda: self._used.value + size <= self.limit)
+            self._used.value += size
+        return size
+
+    def release(self, size):
+        """归还 acquire 返回的字节数"""
+        with self._condition:
+            self._used.value -= size
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, size):
+        """在 with 块中占用 size 字节的预算"""
+        size = self.acquire(size)
+        try:
+            yield
+        finally:
+            self.release(size)
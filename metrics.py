@@ -0,0 +1,241 @@
+"""重命名过程的分阶段耗时统计
+
+工作进程把每张图片各阶段的耗时记在 StageTimings 中随结果一起返回，
+主进程汇总到 RunMetrics 的直方图里，结束时导出为 JSON 或 Prometheus 文本格式。
+"""
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# 直方图桶的上界（秒），最后一个桶为 +Inf
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+           0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+# 导出的指标名前缀
+PREFIX = 'image_renamer'
+
+
+class StageTimings(dict):
+    """一次任务中各阶段的耗时（秒），可以在进程之间传递"""
+
+    @contextmanager
+    def measure(self, stage):
+        """统计 with 块的耗时，同一阶段多次统计时累加"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self[stage] = self.get(stage, 0.0) + time.perf_counter() - start
+
+
+class Histogram:
+    """固定分桶的耗时直方图"""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        """记录一次耗时"""
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """按分桶估计分位数，桶内按线性分布插值"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(BUCKETS, self.counts):
+            if count and seen + count >= rank:
+                upper = min(bound, self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.max
+
+    def cumulative(self):
+        """各桶的累计次数，与 Prometheus 的 le 标签对应"""
+        total = 0
+        result = []
+        for bound, count in zip(BUCKETS, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else 0.0,
+            'max': round(self.max, 6),
+            'p50': round(self.quantile(0.5), 6),
+            'p95': round(self.quantile(0.95), 6),
+            'buckets': {_format_bound(bound): count for bound, count in self.cumulative()}
+        }
+
+
+def _format_bound(bound):
+    """桶上界的文字表示"""
+    return '+Inf' if bound == math.inf else repr(bound)
+
+
+def _labels(pairs):
+    """Prometheus 标签文字，没有标签时为空"""
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+
+class RunMetrics:
+    """一次批量重命名的统计：各阶段耗时直方图、计数和吞吐量
+
+    后台任务线程写入，界面线程可以同时读取。
+    """
+
+    def __init__(self, **info):
+        # 运行参数，如进程数、引擎、语言，原样写入报告
+        self.info = dict(info)
+        self.stages = {}
+        self.counters = {}
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """开始计时"""
+        self.started = time.monotonic()
+        self.finished = None
+
+    def finish(self):
+        """结束计时"""
+        self.finished = time.monotonic()
+
+    @property
+    def elapsed(self):
+        """已运行的时间（秒）"""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    def observe(self, stage, seconds):
+        """记录某个阶段的一次耗时"""
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def add_timings(self, timings):
+        """合并一次任务的各阶段耗时"""
+        for stage, seconds in timings.items():
+            self.observe(stage, seconds)
+
+    @contextmanager
+    def measure(self, stage):
+        """统计 with 块的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def incr(self, name, count=1):
+        """增加计数"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + count
+
+    def throughput(self):
+        """每秒处理的图片数（包括跳过的图片）"""
+        elapsed = self.elapsed
+        return self.counters.get('images', 0) / elapsed if elapsed > 0 else 0.0
+
+    def cache_hit_rate(self):
+        """识别结果缓存的命中率，没有查询过缓存时为 None"""
+        hits = self.counters.get('cache_hits', 0)
+        lookups = hits + self.counters.get('cache_misses', 0)
+        return hits / lookups if lookups else None
+
+    def summary(self):
+        """一行文字摘要，用于状态栏"""
+        text = f"{self.counters.get('images', 0)} 张，{self.throughput():.1f} 张/秒"
+        ocr = self.stages.get('ocr')
+        if ocr is not None and ocr.count:
+            text += f"，识别平均 {ocr.sum / ocr.count * 1000:.0f} 毫秒"
+        rate = self.cache_hit_rate()
+        if rate is not None:
+            text += f"，缓存命中 {rate:.0%}"
+        low = self.counters.get('low_confidence', 0)
+        if low:
+            text += f"，{low} 张置信度低"
+        duplicates = self.counters.get('duplicates', 0)
+        if duplicates:
+            text += f"，{duplicates} 张重复"
+        return text
+
+    def to_dict(self):
+        """导出为可以序列化成 JSON 的字典"""
+        with self._lock:
+            rate = self.cache_hit_rate()
+            return {
+                'info': dict(self.info),
+                'elapsed': round(self.elapsed, 6),
+                'throughput': round(self.throughput(), 3),
+                'cache_hit_rate': None if rate is None else round(rate, 4),
+                'counters': dict(self.counters),
+                'stages': {stage: histogram.to_dict()
+                           for stage, histogram in sorted(self.stages.items())}
+            }
+
+    def to_prometheus(self):
+        """导出为 Prometheus 文本格式，运行参数作为标签"""
+        with self._lock:
+            info = sorted(self.info.items())
+            lines = [
+                f"# HELP {PREFIX}_stage_seconds 每张图片各阶段的耗时",
+                f"# TYPE {PREFIX}_stage_seconds histogram",
+            ]
+            for stage, histogram in sorted(self.stages.items()):
+                labels = [('stage', stage)] + info
+                for bound, count in histogram.cumulative():
+                    le = labels + [('le', _format_bound(bound))]
+                    lines.append(f"{PREFIX}_stage_seconds_bucket{_labels(le)} {count}")
+                lines.append(f"{PREFIX}_stage_seconds_sum{_labels(labels)} {histogram.sum:.6f}")
+                lines.append(f"{PREFIX}_stage_seconds_count{_labels(labels)} {histogram.count}")
+
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+                lines.append(f"{PREFIX}_{name}_total{_labels(info)} {value}")
+
+            gauges = [('run_seconds', f"{self.elapsed:.6f}"),
+                      ('images_per_second', f"{self.throughput():.3f}")]
+            rate = self.cache_hit_rate()
+            if rate is not None:
+                gauges.append(('cache_hit_ratio', f"{rate:.4f}"))
+            for name, value in gauges:
+                lines.append(f"# TYPE {PREFIX}_{name} gauge")
+                lines.append(f"{PREFIX}_{name}{_labels(info)} {value}")
+            return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """写入报告，扩展名为 .prom 或 .txt 时使用 Prometheus 文本格式，否则为 JSON"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if path.lower().endswith(('.prom', '.txt')):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.to_dict(), ensure_ascii=False, indent=2) + '\n'
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
@@ -0,0 +1,117 @@
+"""目录文件名索引，批量重命名时以常数时间分配不重复的文件名"""
+import os
+
+
+def _key(path):
+    """路径的比较形式：绝对路径，不区分大小写的系统上统一大小写"""
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _is_numbered(path, current_path):
+    """当前路径是否为目标文件名加编号的形式（同一目录）"""
+    directory, name = os.path.split(_key(path))
+    current_dir, current_name = os.path.split(_key(current_path))
+    if current_dir != directory:
+        return False
+    base, ext = os.path.splitext(name)
+    current_base, current_ext = os.path.splitext(current_name)
+    suffix = current_base[len(base) + 1:]
+    return (current_ext == ext and current_base.startswith(base + '_')
+            and suffix.isdigit())
+
+
+class _DirectoryNames:
+    """单个目录中已占用的文件名，以及每个文件名下一次尝试的编号"""
+
+    def __init__(self, directory):
+        # 只扫描一次目录，之后随重命名增量更新
+        try:
+            with os.scandir(directory or '.') as entries:
+                self.taken = {os.path.normcase(entry.name) for entry in entries}
+        except FileNotFoundError:
+            # 还没有创建的目标目录（如移走重复图片的子目录）
+            self.taken = set()
+        self.counters = {}
+        # 本批次重命名产生的文件名，边扫描边重命名时目录中会出现这些新文件名
+        self.outputs = set()
+
+
+class NameIndex:
+    """按目录缓存文件名，同一批次内的重名在重命名之前就能发现
+
+    目录按绝对路径区分，"./x" 和 "x" 共用同一份索引。
+    有重命名日志时，日志中记录的重命名结果若已经是目标文件名加编号的形式，直接保留。
+    """
+
+    def __init__(self, journal=None):
+        self.journal = journal
+        # {目录的比较形式: _DirectoryNames}
+        self._directories = {}
+
+    def _names(self, directory):
+        key = _key(directory or '.')
+        names = self._directories.get(key)
+        if names is None:
+            names = self._directories[key] = _DirectoryNames(directory)
+        return names
+
+    def claim(self, path, current_path=None):
+        """为 path 分配一个未被占用的路径并预留
+
+        文件名已被占用时在末尾追加编号；current_path 为文件当前的路径，
+        当前路径就是目标路径时直接保留原名。当前路径是之前重命名的结果
+        （记录在日志中）并且是目标文件名加编号的形式时，同样保留。
+        """
+        if current_path is not None:
+            if _key(current_path) == _key(path):
+                return current_path
+            if (self.journal is not None and self.journal.is_output(current_path)
+                    and _is_numbered(path, current_path)):
+                return current_path
+
+        directory, name = os.path.split(path)
+        base, ext = os.path.splitext(name)
+
+        names = self._names(directory)
+        if os.path.normcase(name) not in names.taken:
+            names.taken.add(os.path.normcase(name))
+            return path
+
+        # 从上次用到的编号继续，同一个文件名大量重复时不必从1开始逐个尝试
+        key = os.path.normcase(name)
+        counter = names.counters.get(key, 1)
+        while os.path.normcase(f"{base}_{counter}{ext}") in names.taken:
+            counter += 1
+        names.counters[key] = counter + 1
+
+        new_name = f"{base}_{counter}{ext}"
+        names.taken.add(os.path.normcase(new_name))
+        return os.path.join(directory, new_name)
+
+    def add(self, path):
+        """登记其他程序新写入的文件，已经扫描过的目录中这个文件名不再分配"""
+        directory, name = os.path.split(path)
+        names = self._directories.get(_key(directory or '.'))
+        if names is not None:
+            names.taken.add(os.path.normcase(name))
+
+    def add_output(self, path):
+        """记下 path 是重命名产生的文件"""
+        directory, name = os.path.split(path)
+        names = self._names(directory)
+        name = os.path.normcase(name)
+        names.outputs.add(name)
+
+    def is_output(self, path):
+        """path 是否为重命名产生的文件，按目录只记录文件名"""
+        directory, name = os.path.split(path)
+        names = self._directories.get(_key(directory or '.'))
+        return names is not None and os.path.normcase(name) in names.outputs
+
+    def release(self, path):
+        """文件被移走或重命名失败后释放文件名"""
+        directory, name = os.path.split(path)
+        names = self._directories.get(_key(directory or '.'))
+        if names is not None:
+            names.taken.discard(os.path.normcase(name))
+
@@ -0,0 +1,251 @@
+"""OCR结果的磁盘缓存
+
+以 (文件内容哈希, 识别区域, 语言, 引擎) 为键保存各区域的识别文字和置信度，命中时完全跳过 tesseract。
+文件大小和修改时间没有变化时主进程直接使用记录的哈希，不读取文件内容；
+没有记录或大小、修改时间不一致时（新图片、复制到别处、只是被 touch 过），
+由工作进程计算哈希后用 CacheProbe 只读查询，内容相同的文件仍能命中，每个文件只计算一次哈希。
+"""
+import hashlib
+import json
+import os
+import pathlib
+import sqlite3
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+    'image_renamer',
+    'ocr_cache.sqlite3'
+)
+
+# 默认最多保存的识别结果条数
+DEFAULT_MAX_ENTRIES = 200000
+
+# 文件记录条数的上限，相对识别结果条数上限的倍数
+FILES_PER_ENTRY = 2
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """计算文件内容的哈希"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def normalize_box(crop_box):
+    """统一裁剪框的表示，比例坐标保留6位小数"""
+    return ','.join(
+        f"{c:.6f}" if isinstance(c, float) else str(int(c)) for c in crop_box
+    )
+
+
+def normalize_regions(regions):
+    """统一 {区域名: 裁剪框} 的表示，与区域顺序无关"""
+    return ';'.join(f"{name}={normalize_box(regions[name])}" for name in sorted(regions))
+
+
+def _decode(row):
+    """把结果行转换为 ({区域名: 文字}, {区域名: 置信度})，旧版本保存的结果没有置信度"""
+    return json.loads(row[0]), json.loads(row[1]) if row[1] else {}
+
+
+class CacheProbe:
+    """工作进程中按文件哈希只读查询识别结果
+
+    只保存缓存文件路径和缓存键中哈希之后的部分，可以传给工作进程；
+    主进程还没有提交的结果查不到，只会当作未命中。
+    """
+
+    def __init__(self, path, regions, lang, config=''):
+        self.path = path
+        self.suffix = OcrCache.make_key('', regions, lang, config)
+
+    def get(self, digest):
+        """返回 ({区域名: 文字}, {区域名: 置信度})，未命中或缓存无法读取时返回 None"""
+        try:
+            db = sqlite3.connect(pathlib.Path(self.path).absolute().as_uri() + '?mode=ro',
+                                 uri=True)
+            try:
+                row = db.execute('SELECT text, confidence FROM results WHERE key = ?',
+                                 (digest + self.suffix,)).fetchone()
+            finally:
+                db.close()
+        except sqlite3.Error:
+            return None
+        return _decode(row) if row else None
+
+
+class OcrCache:
+    """基于SQLite的识别结果缓存，超出条数上限时淘汰最久未使用的结果"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES,
+                 commit_every=500):
+        self.path = path
+        self.max_entries = max_entries
+        self.commit_every = commit_every
+        self._uncommitted = 0
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # 后台任务线程也会使用这个连接，同一时间只有一个线程访问
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT)'
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'key TEXT PRIMARY KEY, text TEXT, last_used REAL)'
+        )
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)'
+        )
+        # 旧版本的缓存没有置信度一列
+        columns = [row[1] for row in self._db.execute('PRAGMA table_info(results)')]
+        if 'confidence' not in columns:
+            self._db.execute('ALTER TABLE results ADD COLUMN confidence TEXT')
+        # 结果条数和文件记录条数的估计值（覆盖写入也会计入），只用于判断何时淘汰
+        self._count = self._db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        self._file_count = self._db.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def make_key(digest, regions, lang, config=''):
+        """生成识别结果的缓存键"""
+        return f"{digest}|{normalize_regions(regions)}|{lang}|{config}"
+
+    def known_digest(self, path):
+        """大小和修改时间与记录一致时返回记录的哈希，否则返回 None，不读取文件内容"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        row = self._db.execute(
+            'SELECT size, mtime_ns, digest FROM files WHERE path = ?', (path,)
+        ).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+        return None
+
+    def probe(self, regions, lang, config=''):
+        """工作进程计算哈希后查询结果使用的 CacheProbe，与 lookup 使用相同的缓存键"""
+        return CacheProbe(self.path, regions, lang, config)
+
+    def _record(self, path, st, digest):
+        """记录文件的大小、修改时间和哈希"""
+        self._db.execute(
+            'INSERT OR REPLACE INTO files (path, size, mtime_ns, digest) VALUES (?, ?, ?, ?)',
+            (path, st.st_size, st.st_mtime_ns, digest)
+        )
+        self._file_count += 1
+        self._changed()
+
+    def lookup(self, path, regions, lang, config=''):
+        """查找识别结果 ({区域名: 文字}, {区域名: 置信度})，未命中时返回 None
+
+        只使用记录的哈希；哈希未知时直接返回 None，由工作进程计算哈希后查询。
+        旧版本保存的结果没有置信度，置信度为空字典。
+        """
+        digest = self.known_digest(path)
+        if digest is None:
+            return None
+
+        key = self.make_key(digest, regions, lang, config)
+        row = self._db.execute(
+            'SELECT text, confidence FROM results WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._db.execute('UPDATE results SET last_used = ? WHERE key = ?', (time.time(), key))
+        self._changed()
+        return _decode(row)
+
+    def store(self, path, digest, regions, lang, fields, config='', confidences=None,
+              hit=False):
+        """保存识别结果 {区域名: 文字} 和 {区域名: 置信度}，同时记录文件的大小、修改时间和哈希
+
+        hit 为真时结果是工作进程用 CacheProbe 查到的，计为命中并刷新使用时间。
+        """
+        if hit:
+            self.hits += 1
+        self._record(path, os.stat(path), digest)
+        key = self.make_key(digest, regions, lang, config)
+        cursor = self._db.execute(
+            'INSERT OR REPLACE INTO results (key, text, confidence, last_used) VALUES (?, ?, ?, ?)',
+            (key, json.dumps(fields, ensure_ascii=False),
+             json.dumps(confidences) if confidences else None, time.time())
+        )
+        if cursor.rowcount:
+            self._count += 1
+        self._changed()
+
+    def move(self, old_path, new_path):
+        """文件被重命名后更新记录的路径"""
+        self._db.execute('DELETE FROM files WHERE path = ?', (new_path,))
+        self._db.execute('UPDATE files SET path = ? WHERE path = ?', (new_path, old_path))
+        self._changed()
+
+    def _changed(self):
+        """累计一定数量的修改后再提交，减少磁盘同步次数"""
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        """提交修改，并淘汰超出上限的旧结果和文件记录"""
+        evicted = False
+        if self._count > self.max_entries:
+            # 多淘汰一成，避免每次提交都要清理
+            excess = self._count - int(self.max_entries * 0.9)
+            self._db.execute(
+                'DELETE FROM results WHERE key IN ('
+                'SELECT key FROM results ORDER BY last_used LIMIT ?)', (excess,)
+            )
+            self._count = self._db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+            evicted = True
+        if evicted or self._file_count > self.max_entries * FILES_PER_ENTRY:
+            self.prune()
+        self._db.commit()
+        self._uncommitted = 0
+
+    def prune(self):
+        """删除识别结果都已被淘汰的文件记录；仍超出上限时删除最早写入的记录"""
+        # 缓存键以 "哈希|" 开头，按主键的范围查找，不需要扫描整张表
+        self._db.execute(
+            "DELETE FROM files WHERE NOT EXISTS (SELECT 1 FROM results "
+            "WHERE key > files.digest || '|' AND key < files.digest || '}')"
+        )
+        limit = self.max_entries * FILES_PER_ENTRY
+        count = self._db.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+        if count > limit:
+            # INSERT OR REPLACE 会分配新的 rowid，rowid 小的是最久没有更新的记录
+            excess = count - int(limit * 0.9)
+            self._db.execute(
+                'DELETE FROM files WHERE rowid IN ('
+                'SELECT rowid FROM files ORDER BY rowid LIMIT ?)', (excess,)
+            )
+            count -= excess
+        self._file_count = count
+
+    def close(self):
+        """提交并关闭缓存"""
+        if self._db is not None:
+            self.commit()
+            self._db.close()
+            self._db = None
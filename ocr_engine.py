@@ -0,0 +1,211 @@
+"""OCR识别引擎
+
+优先使用 tesserocr 直接调用 libtesseract，模型只在创建引擎时加载一次；
+没有安装 tesserocr 时退回 pytesseract，每次识别启动一个 tesseract 进程。
+pytesseract 可以把多个区域合成一个多页 TIFF 一起识别，分摊启动进程的开销。
+识别结果都是 (文字, 置信度)，置信度为各词置信度的平均值（0-100），没有文字时为0。
+"""
+import os
+import tempfile
+
+import pytesseract
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+DEFAULT_LANG = 'chi_sim'
+
+BACKENDS = ('auto', 'tesserocr', 'pytesseract')
+
+
+class OcrEngine:
+    """识别引擎基类"""
+
+    name = None
+
+    def __init__(self, lang=DEFAULT_LANG):
+        self.lang = lang
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def recognize(self, image, psm=None, lang=None):
+        """识别图片中的文字，返回 (文字, 置信度)
+
+        psm 为 tesseract 的页面分割模式，lang 为临时使用的识别语言，为 None 时使用默认设置。
+        """
+        raise NotImplementedError
+
+    def recognize_regions(self, image, boxes):
+        """依次识别图片中的多个区域，返回各区域的 (文字, 置信度)"""
+        return [self.recognize(image.crop(box)) for box in boxes]
+
+    def recognize_batch(self, images):
+        """识别一组图片，返回各图片的 (文字, 置信度)"""
+        return [self.recognize(image) for image in images]
+
+    def close(self):
+        """释放引擎占用的资源"""
+
+
+class TesserocrEngine(OcrEngine):
+    """常驻内存的 libtesseract 引擎，识别模型在多张图片之间复用"""
+
+    name = 'tesserocr'
+
+    def __init__(self, lang=DEFAULT_LANG):
+        super().__init__(lang)
+        if tesserocr is None:
+            raise RuntimeError("未安装 tesserocr")
+        self._api = tesserocr.PyTessBaseAPI(lang=lang)
+        # 重新识别时临时使用的其他语言，按需加载后保留
+        self._other_apis = {}
+
+    def _get_api(self, lang):
+        if lang is None or lang == self.lang:
+            return self._api
+        api = self._other_apis.get(lang)
+        if api is None:
+            api = self._other_apis[lang] = tesserocr.PyTessBaseAPI(lang=lang)
+        return api
+
+    def _read(self, api):
+        """读取当前识别区域的文字和平均置信度"""
+        text = api.GetUTF8Text().strip()
+        return text, float(api.MeanTextConf()) if text else 0.0
+
+    def recognize(self, image, psm=None, lang=None):
+        api = self._get_api(lang)
+        default_psm = api.GetPageSegMode()
+        if psm is not None:
+            api.SetPageSegMode(psm)
+        api.SetImage(image)
+        try:
+            return self._read(api)
+        finally:
+            api.Clear()
+            api.SetPageSegMode(default_psm)
+
+    def recognize_regions(self, image, boxes):
+        # 图片只传给引擎一次，各区域通过 SetRectangle 指定
+        self._api.SetImage(image)
+        try:
+            results = []
+            for x0, y0, x1, y1 in boxes:
+                self._api.SetRectangle(x0, y0, x1 - x0, y1 - y0)
+                results.append(self._read(self._api))
+            return results
+        finally:
+            self._api.Clear()
+
+    def close(self):
+        if self._api is not None:
+            self._api.End()
+            self._api = None
+        for api in self._other_apis.values():
+            api.End()
+        self._other_apis.clear()
+
+
+class PytesseractEngine(OcrEngine):
+    """通过 pytesseract 调用 tesseract 命令行，每张图片启动一个进程"""
+
+    name = 'pytesseract'
+
+    def recognize(self, image, psm=None, lang=None):
+        # 使用词级别的结果，才能得到每个词的置信度
+        config = f'--psm {psm}' if psm is not None else ''
+        data = pytesseract.image_to_data(image, lang=lang or self.lang, config=config,
+                                         output_type=pytesseract.Output.DICT)
+        return split_pages(data, 1)[0]
+
+    def recognize_batch(self, images):
+        """把所有图片存成一个多页 TIFF，只启动一次 tesseract，再按页拆分结果"""
+        if len(images) <= 1:
+            return [self.recognize(image) for image in images]
+
+        pages = [_tiff_page(image) for image in images]
+        with tempfile.TemporaryDirectory(prefix='image_renamer_') as directory:
+            path = os.path.join(directory, 'batch.tif')
+            pages[0].save(path, save_all=True, append_images=pages[1:])
+            data = pytesseract.image_to_data(path, lang=self.lang,
+                                             output_type=pytesseract.Output.DICT)
+        return split_pages(data, len(images))
+
+
+def _tiff_page(image):
+    """转换成 TIFF 页面支持的模式"""
+    if image.mode in ('1', 'L', 'RGB'):
+        return image
+    return image.convert('RGB')
+
+
+def _is_cjk(char):
+    """是否为中日韩文字或全角符号，这些文字之间不加空格"""
+    return ('\u2e80' <= char <= '\u9fff' or '\uac00' <= char <= '\ud7af'
+            or '\uf900' <= char <= '\ufaff' or '\uff00' <= char <= '\uffef')
+
+
+def _join_words(words):
+    """把一行中的词连成文字，中文之间不加空格"""
+    text = words[0]
+    for word in words[1:]:
+        if _is_cjk(text[-1]) or _is_cjk(word[0]):
+            text += word
+        else:
+            text += ' ' + word
+    return text
+
+
+def split_pages(data, count):
+    """把 image_to_data 的 TSV 结果按页拆分
+
+    返回每页的 (文字, 置信度)，文字的行之间用换行分隔，置信度为各词置信度的平均值。
+    """
+    lines = {}
+    confidences = [[] for _ in range(count)]
+    columns = zip(data['level'], data['page_num'], data['block_num'],
+                  data['par_num'], data['line_num'], data['text'], data['conf'])
+    for level, page, block, paragraph, line, text, conf in columns:
+        text = str(text).strip()
+        # 只有第5级（词）带有文字
+        if level != 5 or not text or not 1 <= page <= count:
+            continue
+        lines.setdefault((page, block, paragraph, line), []).append(text)
+        conf = float(conf)
+        if conf >= 0:
+            confidences[page - 1].append(conf)
+
+    pages = [[] for _ in range(count)]
+    for (page, _, _, _), words in lines.items():
+        pages[page - 1].append(_join_words(words))
+    return [('\n'.join(page), sum(conf) / len(conf) if conf else 0.0)
+            for page, conf in zip(pages, confidences)]
+
+
+def resolve_backend(backend='auto'):
+    """确认引擎可用，auto 时返回实际使用的引擎名"""
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的OCR引擎: {backend}")
+    if backend == 'tesserocr' and tesserocr is None:
+        raise RuntimeError("未安装 tesserocr")
+    if backend == 'auto':
+        return 'pytesseract' if tesserocr is None else 'auto'
+    return backend
+
+
+def create_engine(lang=DEFAULT_LANG, backend='auto'):
+    """创建识别引擎，auto 时优先使用 tesserocr"""
+    backend = resolve_backend(backend)
+    if backend in ('tesserocr', 'auto'):
+        try:
+            return TesserocrEngine(lang)
+        except RuntimeError:
+            if backend == 'tesserocr':
+                raise
+    return PytesseractEngine(lang)
@@ -0,0 +1,95 @@
+"""按识别置信度决定是否重新识别
+
+第一次识别使用最快的设置；置信度足够高时直接采用，
+只有置信度低或没有识别出文字的区域才依次尝试更费时的设置，
+例如单行模式（--psm 7）、放大后再识别、增加识别语言。
+"""
+from PIL import Image
+
+# 低于这个置信度（0-100）的区域会重新识别
+DEFAULT_MIN_CONFIDENCE = 60
+
+# 默认的重新识别设置，按耗时从低到高排列
+DEFAULT_PASSES = (
+    {'psm': 7},
+    {'psm': 7, 'scale': 2.0},
+    {'psm': 6, 'scale': 3.0},
+)
+
+# 一次重新识别设置中可以使用的参数
+PASS_KEYS = ('psm', 'scale', 'extra_lang')
+
+
+def parse_pass(value):
+    """解析 psm=7,scale=2,extra_lang=eng 格式的重新识别设置"""
+    options = {}
+    for item in value.split(','):
+        key, _, text = item.partition('=')
+        key = key.strip()
+        if key not in PASS_KEYS or not text:
+            raise ValueError(f"无效的重新识别设置: {item}")
+        try:
+            if key == 'psm':
+                options[key] = int(text)
+            elif key == 'scale':
+                options[key] = float(text)
+            else:
+                options[key] = text.strip()
+        except ValueError:
+            raise ValueError(f"无效的重新识别设置: {item}")
+    return options
+
+
+def upscale(image, scale):
+    """按比例放大图片"""
+    width, height = image.size
+    return image.resize((max(1, round(width * scale)), max(1, round(height * scale))),
+                        Image.LANCZOS)
+
+
+class RetryPolicy:
+    """低置信度区域的重新识别策略，可以传给工作进程"""
+
+    def __init__(self, min_confidence=DEFAULT_MIN_CONFIDENCE, passes=DEFAULT_PASSES,
+                 extra_lang=None):
+        self.min_confidence = min_confidence
+        self.passes = [dict(options) for options in passes]
+        if extra_lang:
+            # 增加识别语言最费时，放在最后
+            self.passes.append({'psm': 7, 'extra_lang': extra_lang})
+
+    @property
+    def signature(self):
+        """策略的文字表示，策略不同时识别结果也不同，用作缓存键的一部分"""
+        passes = ';'.join(','.join(f"{key}={options[key]}" for key in sorted(options))
+                          for options in self.passes)
+        return f"min={self.min_confidence}:{passes}"
+
+    def accept(self, text, confidence):
+        """识别结果是否可以直接采用"""
+        return bool(text.strip()) and confidence >= self.min_confidence
+
+    def retry(self, engine, image, text, confidence):
+        """依次用更费时的设置重新识别一个区域，返回置信度最高的 (文字, 置信度)
+
+        某次的结果可以采用时立即停止。
+        """
+        best = (text, confidence)
+        for options in self.passes:
+            region = image
+            if options.get('scale'):
+                region = upscale(image, options['scale'])
+            lang = None
+            if options.get('extra_lang'):
+                lang = f"{engine.lang}+{options['extra_lang']}"
+            try:
+                result = engine.recognize(region, psm=options.get('psm'), lang=lang)
+            finally:
+                if region is not image:
+                    # 放大的副本比原区域大几倍，用完立即释放
+                    region.close()
+            if result[0].strip() and (not best[0].strip() or result[1] > best[1]):
+                best = result
+            if self.accept(*best):
+                break
+        return best
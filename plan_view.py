@@ -0,0 +1,306 @@
+"""重命名计划的查看和修改窗口
+
+表格只创建能显示下的几十行，滚动时改写这些行的内容，
+计划有十万条时也不会为每一条创建控件。
+"""
+import os
+import tkinter as tk
+from tkinter import filedialog, messagebox, simpledialog, ttk
+
+# 表格的行高（像素），用于计算一屏能显示几行
+ROW_HEIGHT = 24
+
+# 状态的显示文字
+STATUS_TEXT = {
+    'ok': "待重命名",
+    'unchanged': "不变",
+    'conflict': "重名",
+    'uncertain': "置信度低",
+    'error': "失败",
+    'disabled': "不执行",
+    'duplicate': "重复",
+}
+
+# 筛选选项和包含的状态
+FILTERS = {
+    "全部": None,
+    "需要检查": ('error', 'conflict', 'uncertain'),
+    "失败": ('error',),
+    "重名": ('conflict',),
+    "置信度低": ('uncertain',),
+    "不执行": ('disabled',),
+    "重复": ('duplicate',),
+}
+
+
+class PlanTable(ttk.Frame):
+    """虚拟滚动的计划表格"""
+
+    COLUMNS = (('status', "状态", 70), ('name', "原文件名", 260),
+               ('new_name', "新文件名", 320), ('confidence', "置信度", 70))
+
+    def __init__(self, master, plan, on_change=None):
+        super().__init__(master)
+        self.plan = plan
+        # 修改计划后调用，用于刷新统计
+        self.on_change = on_change
+        # 当前筛选出的计划序号，全部显示时为 range，不复制列表
+        self.rows = range(len(plan))
+        # 第一行显示的是 rows 中的第几条
+        self.top = 0
+        # 选中的计划序号
+        self.selected = None
+        # 复用的表格行
+        self.items = []
+
+        style = ttk.Style(self)
+        style.configure('Plan.Treeview', rowheight=ROW_HEIGHT)
+
+        self.tree = ttk.Treeview(self, columns=[c[0] for c in self.COLUMNS],
+                                 show='headings', selectmode='browse', style='Plan.Treeview')
+        for column, text, width in self.COLUMNS:
+            self.tree.heading(column, text=text)
+            self.tree.column(column, width=width, stretch=column in ('name', 'new_name'))
+        self.tree.tag_configure('error', foreground='#c0392b')
+        self.tree.tag_configure('conflict', foreground='#d35400')
+        self.tree.tag_configure('uncertain', foreground='#b7950b')
+        self.tree.tag_configure('disabled', foreground='#999999')
+        self.tree.tag_configure('unchanged', foreground='#666666')
+        self.tree.tag_configure('duplicate', foreground='#2874a6')
+
+        # 滚动条由表格自己控制，不和 Treeview 的 yview 关联
+        self.scrollbar = ttk.Scrollbar(self, orient='vertical', command=self.on_scroll)
+        self.scrollbar.pack(side='right', fill='y')
+        self.tree.pack(side='left', fill='both', expand=True)
+
+        self.tree.bind('<Configure>', lambda event: self.refresh())
+        self.tree.bind('<MouseWheel>', self.on_mouse_wheel)
+        self.tree.bind('<Button-4>', lambda event: self.scroll_by(-3))
+        self.tree.bind('<Button-5>', lambda event: self.scroll_by(3))
+        self.tree.bind('<<TreeviewSelect>>', self.on_select)
+        self.tree.bind('<Up>', lambda event: self.move_selection(-1))
+        self.tree.bind('<Down>', lambda event: self.move_selection(1))
+        self.tree.bind('<Prior>', lambda event: self.move_selection(-self.visible_count()))
+        self.tree.bind('<Next>', lambda event: self.move_selection(self.visible_count()))
+        self.tree.bind('<Double-1>', self.on_double_click)
+        self.tree.bind('<Return>', lambda event: self.edit_selected())
+        self.tree.bind('<space>', lambda event: self.toggle_selected())
+
+    def visible_count(self):
+        """一屏能显示的行数"""
+        height = self.tree.winfo_height() - ROW_HEIGHT  # 减去表头
+        return max(1, height // ROW_HEIGHT)
+
+    def set_filter(self, statuses):
+        """只显示指定状态的条目，statuses 为 None 时显示全部"""
+        if statuses is None:
+            self.rows = range(len(self.plan))
+        else:
+            self.rows = [index for index in range(len(self.plan))
+                         if self.plan.status(index) in statuses]
+        self.top = 0
+        self.refresh()
+
+    def refresh(self):
+        """按当前位置改写表格中的行"""
+        count = self.visible_count()
+        total = len(self.rows)
+        self.top = max(0, min(self.top, total - count))
+        shown = min(count, total - self.top)
+
+        # 行数只随窗口大小变化，滚动时不增删
+        while len(self.items) < shown:
+            self.items.append(self.tree.insert('', 'end'))
+        while len(self.items) > shown:
+            self.tree.delete(self.items.pop())
+
+        selected_item = None
+        for item, index in zip(self.items, self.rows[self.top:self.top + shown]):
+            entry = self.plan[index]
+            status = self.plan.status(index)
+            confidence = entry.get('confidence')
+            if entry['new_path']:
+                new_name = os.path.basename(entry['new_path'])
+                if status == 'duplicate':
+                    new_name = os.path.join(os.path.basename(os.path.dirname(entry['new_path'])),
+                                            new_name)
+            elif status == 'duplicate':
+                new_name = f"与 {os.path.basename(entry['duplicate_of'])} 重复，保留原名"
+            else:
+                new_name = entry['error'] or ''
+            self.tree.item(item, tags=(status,), values=(
+                STATUS_TEXT[status],
+                os.path.basename(entry['path']),
+                new_name,
+                '' if confidence is None else f"{confidence:.0f}",
+            ))
+            if index == self.selected:
+                selected_item = item
+        self.tree.selection_set(selected_item or ())
+
+        if total:
+            self.scrollbar.set(self.top / total, (self.top + shown) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll_to(self, top):
+        self.top = top
+        self.refresh()
+
+    def scroll_by(self, rows):
+        self.scroll_to(self.top + rows)
+
+    def on_scroll(self, action, value, unit=None):
+        """滚动条的拖动和点击"""
+        if action == 'moveto':
+            self.scroll_to(int(float(value) * len(self.rows)))
+        elif unit == 'pages':
+            self.scroll_by(int(value) * self.visible_count())
+        else:
+            self.scroll_by(int(value))
+
+    def on_mouse_wheel(self, event):
+        self.scroll_by(-3 if event.delta > 0 else 3)
+
+    def index_of(self, item):
+        """表格行当前显示的计划序号"""
+        try:
+            return self.rows[self.top + self.items.index(item)]
+        except (ValueError, IndexError):
+            return None
+
+    def on_select(self, event):
+        selection = self.tree.selection()
+        if selection:
+            self.selected = self.index_of(selection[0])
+
+    def move_selection(self, step):
+        """键盘移动选中行，移出可见范围时滚动表格"""
+        if not self.rows:
+            return 'break'
+        try:
+            position = self.rows.index(self.selected) + step
+        except ValueError:
+            position = self.top
+        position = max(0, min(position, len(self.rows) - 1))
+        self.selected = self.rows[position]
+        count = self.visible_count()
+        if position < self.top:
+            self.top = position
+        elif position >= self.top + count:
+            self.top = position - count + 1
+        self.refresh()
+        return 'break'
+
+    def on_double_click(self, event):
+        if self.tree.identify_region(event.x, event.y) == 'cell':
+            self.selected = self.index_of(self.tree.identify_row(event.y))
+            self.edit_selected()
+
+    def edit_selected(self):
+        """修改选中图片的文件名文字"""
+        if self.selected is None:
+            return
+        entry = self.plan[self.selected]
+        text = simpledialog.askstring("修改文件名", f"{os.path.basename(entry['path'])} 的新文件名：",
+                                      initialvalue=entry['text'] or '', parent=self)
+        if text is None:
+            return
+        self.plan.set_text(self.selected, text)
+        self.changed()
+
+    def toggle_selected(self):
+        """切换选中图片是否重命名"""
+        if self.selected is None:
+            return
+        entry = self.plan[self.selected]
+        self.plan.set_enabled(self.selected, not entry['enabled'])
+        self.changed()
+
+    def changed(self):
+        self.refresh()
+        if self.on_change is not None:
+            self.on_change()
+
+
+class PlanWindow(tk.Toplevel):
+    """查看、修改和执行重命名计划的窗口"""
+
+    def __init__(self, master, plan, on_apply):
+        super().__init__(master)
+        self.plan = plan
+        # 点击“执行重命名”后以计划为参数调用
+        self.on_apply = on_apply
+        self.title("重命名计划")
+        self.geometry("900x600")
+
+        toolbar = ttk.Frame(self)
+        toolbar.pack(fill='x', padx=10, pady=10)
+
+        ttk.Label(toolbar, text="显示").pack(side='left')
+        self.filter_var = tk.StringVar(value="全部")
+        filter_box = ttk.Combobox(toolbar, textvariable=self.filter_var, values=list(FILTERS),
+                                  state='readonly', width=10)
+        filter_box.pack(side='left', padx=(5, 20))
+        filter_box.bind('<<ComboboxSelected>>', self.on_filter)
+
+        self.summary_label = ttk.Label(toolbar)
+        self.summary_label.pack(side='left')
+
+        ttk.Button(toolbar, text="执行重命名", command=self.apply).pack(side='right', padx=5)
+        ttk.Button(toolbar, text="保存计划", command=self.save).pack(side='right', padx=5)
+
+        ttk.Label(self, text="双击或回车修改文件名，空格切换是否重命名").pack(anchor='w', padx=10)
+
+        self.table = PlanTable(self, plan, on_change=self.update_summary)
+        self.table.pack(fill='both', expand=True, padx=10, pady=10)
+        self.update_summary()
+
+    def update_summary(self):
+        """显示各状态的条数"""
+        counts = self.plan.counts()
+        parts = [f"共 {len(self.plan)} 张"]
+        parts += [f"{STATUS_TEXT[status]} {counts[status]}"
+                  for status in STATUS_TEXT if counts.get(status)]
+        self.summary_label.config(text="，".join(parts))
+
+    def on_filter(self, event=None):
+        self.table.set_filter(FILTERS[self.filter_var.get()])
+
+    def save(self):
+        """把计划保存为文件，可以之后用命令行 --apply 执行"""
+        path = filedialog.asksaveasfilename(parent=self, title="保存计划",
+                                            defaultextension='.jsonl',
+                                            filetypes=[("重命名计划", "*.jsonl")])
+        if not path:
+            return
+        try:
+            self.plan.save(path)
+        except OSError as e:
+            messagebox.showerror("错误", f"保存计划失败: {e}", parent=self)
+
+    def apply(self):
+        """确认后执行计划并关闭窗口"""
+        counts = self.plan.counts()
+        # 执行的是所有启用且新路径与原路径不同的条目，包括置信度低的
+        count = moved = 0
+        for index in range(len(self.plan)):
+            entry = self.plan[index]
+            if (self.plan.status(index) in ('error', 'disabled') or not entry['new_path']
+                    or entry['new_path'] == entry['path']):
+                continue
+            if entry.get('duplicate_of'):
+                moved += 1
+            else:
+                count += 1
+        message = f"将重命名 {count} 张图片。"
+        if moved:
+            message += f"\n{moved} 张重复的图片移到子目录。"
+        if counts.get('conflict'):
+            message += f"\n其中 {counts['conflict']} 张重名，执行时会追加编号。"
+        if counts.get('uncertain'):
+            message += f"\n其中 {counts['uncertain']} 张识别置信度较低。"
+        if not messagebox.askokcancel("执行重命名", message, parent=self):
+            return
+        self.destroy()
+        self.on_apply(self.plan)
@@ -0,0 +1,209 @@
+"""识别前的图片预处理
+
+对每个识别区域依次执行（都可以单独关闭）：
+- gray：转为灰度
+- upscale：区域太矮时放大，使文字达到 tesseract 合适的像素高度
+- binarize：Sauvola 局部自适应二值化，光照不均的扫描件也能分出文字
+- deskew：按投影轮廓估计倾斜角度并转正
+- trim：去掉没有文字的空白边
+除缩放和旋转外都在 NumPy 数组上整体计算，不逐像素循环。
+"""
+import numpy as np
+from PIL import Image
+
+# 所有步骤，按执行顺序排列；upscale 之后的步骤都在灰度图上进行
+STEPS = ('gray', 'upscale', 'binarize', 'deskew', 'trim')
+
+# 灰度转换的权重（ITU-R 601）
+_GRAY_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def parse_steps(value):
+    """解析逗号分隔的步骤列表，all 表示全部步骤，none 表示不预处理"""
+    value = value.strip().lower()
+    if value == 'all':
+        return STEPS
+    if value in ('', 'none'):
+        return ()
+    steps = tuple(step.strip() for step in value.split(','))
+    unknown = [step for step in steps if step not in STEPS]
+    if unknown:
+        raise ValueError(f"未知的预处理步骤: {', '.join(unknown)}")
+    return tuple(step for step in STEPS if step in steps)
+
+
+def to_gray(image):
+    """转为 float32 灰度数组"""
+    if image.mode in ('L', 'I;16', 'I', 'F'):
+        array = np.asarray(image, dtype=np.float32)
+        if image.mode != 'L':
+            # 高位深图片拉伸到 0~255
+            low, high = float(array.min()), float(array.max())
+            array = (array - low) * (255.0 / max(high - low, 1.0))
+        return array
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    array = np.asarray(image, dtype=np.float32)
+    gray = array[..., :3] @ _GRAY_WEIGHTS
+    if array.shape[-1] == 4:
+        # 透明部分按白色背景处理
+        alpha = array[..., 3] / 255.0
+        gray = gray * alpha + 255.0 * (1.0 - alpha)
+    return gray
+
+
+def _box_sums(values, radius):
+    """用积分图计算每个像素周围 (2r+1)x(2r+1) 窗口内的和，边缘按最近像素延伸"""
+    size = 2 * radius + 1
+    padded = np.pad(values, radius, mode='edge')
+    integral = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1), dtype=np.float64)
+    np.cumsum(padded, axis=0, out=integral[1:, 1:])
+    np.cumsum(integral[1:, 1:], axis=1, out=integral[1:, 1:])
+    return (integral[size:, size:] - integral[:-size, size:]
+            - integral[size:, :-size] + integral[:-size, :-size])
+
+
+def binarize(gray, window=None, k=0.2, dynamic_range=128.0):
+    """Sauvola 局部阈值二值化，返回文字像素为 True 的布尔数组
+
+    window 为窗口边长，默认取区域短边的一半；深色背景浅色文字会自动反转。
+    """
+    height, width = gray.shape
+    if window is None:
+        window = max(15, min(height, width) // 2)
+    radius = max(1, window // 2)
+
+    count = float((2 * radius + 1) ** 2)
+    mean = _box_sums(gray, radius) / count
+    variance = _box_sums(np.square(gray, dtype=np.float64), radius) / count - np.square(mean)
+    std = np.sqrt(np.maximum(variance, 0.0))
+    threshold = mean * (1.0 + k * (std / dynamic_range - 1.0))
+    ink = gray < threshold
+
+    # 文字像素占多数时认为是深色背景
+    if ink.mean() > 0.5:
+        ink = ~ink
+    return ink
+
+
+def estimate_skew(ink, max_angle=5.0, step=0.25, max_points=50000):
+    """按水平投影轮廓估计把文字行转正所需的旋转角度（度，逆时针为正）
+
+    对每个候选角度把文字像素沿该角度投影到纵轴，文字行对齐时投影最集中。
+    所有候选角度一次计算，不逐角度旋转图片。
+    """
+    ys, xs = np.nonzero(ink)
+    if len(ys) < 50:
+        return 0.0
+    if len(ys) > max_points:
+        # 文字像素太多时等间隔抽样，不影响角度估计
+        stride = len(ys) // max_points + 1
+        ys, xs = ys[::stride], xs[::stride]
+
+    angles = np.arange(-max_angle, max_angle + step / 2, step)
+    slopes = np.tan(np.radians(angles))
+    # rows[i, j]：第 j 个像素沿第 i 个角度投影后的行号
+    xs = xs - xs.mean()
+    rows = np.rint(ys[None, :] - slopes[:, None] * xs[None, :]).astype(np.int64)
+    rows -= rows.min()
+    bins = int(rows.max()) + 1
+
+    # 所有角度的直方图拼成一维一起统计
+    offsets = np.arange(len(angles), dtype=np.int64)[:, None] * bins
+    histograms = np.bincount((rows + offsets).ravel(), minlength=len(angles) * bins)
+    scores = np.square(histograms.reshape(len(angles), bins), dtype=np.float64).sum(axis=1)
+
+    best = int(np.argmax(scores))
+    # 分数相同时选择最接近0的角度，避免无意义的旋转
+    if scores[best] <= scores[len(angles) // 2]:
+        return 0.0
+    return float(angles[best])
+
+
+def ink_bounds(ink, margin=0, min_fraction=0.005):
+    """包含文字像素的矩形 (左, 上, 右, 下)，没有文字时返回 None
+
+    文字像素少于该行（列）长度 min_fraction 的行和列视为噪点，不计入范围。
+    """
+    height, width = ink.shape
+    rows = np.flatnonzero(ink.sum(axis=1) > width * min_fraction)
+    cols = np.flatnonzero(ink.sum(axis=0) > height * min_fraction)
+    if not len(rows) or not len(cols):
+        return None
+    return (max(0, int(cols[0]) - margin), max(0, int(rows[0]) - margin),
+            min(width, int(cols[-1]) + 1 + margin), min(height, int(rows[-1]) + 1 + margin))
+
+
+class Preprocessor:
+    """按配置的步骤处理识别区域，实例可以传给工作进程"""
+
+    def __init__(self, steps=STEPS, min_height=64, max_scale=4.0, max_skew=5.0,
+                 margin=8):
+        unknown = [step for step in steps if step not in STEPS]
+        if unknown:
+            raise ValueError(f"未知的预处理步骤: {', '.join(unknown)}")
+        self.steps = tuple(step for step in STEPS if step in steps)
+        self.min_height = min_height
+        self.max_scale = max_scale
+        self.max_skew = max_skew
+        self.margin = margin
+
+    @property
+    def signature(self):
+        """预处理配置的文字描述，作为识别结果缓存键的一部分"""
+        if not self.steps:
+            return ''
+        return (f"{','.join(self.steps)}:{self.min_height}:{self.max_scale}:"
+                f"{self.max_skew}:{self.margin}")
+
+    def __call__(self, image):
+        """处理一个区域，返回交给 tesseract 的图片"""
+        if not self.steps:
+            return image
+
+        gray = to_gray(image)
+        if 'upscale' in self.steps:
+            gray = self._upscale(gray)
+
+        ink = None
+        if 'binarize' in self.steps or 'deskew' in self.steps or 'trim' in self.steps:
+            ink = binarize(gray)
+
+        # 输出二值图，没有要求二值化时输出灰度图
+        if 'binarize' in self.steps:
+            output = np.where(ink, 0, 255).astype(np.uint8)
+        else:
+            output = np.clip(gray, 0, 255).astype(np.uint8)
+
+        if 'deskew' in self.steps:
+            angle = estimate_skew(ink, self.max_skew)
+            if abs(angle) >= 0.25:
+                output, ink = self._rotate(output, ink, angle)
+
+        if 'trim' in self.steps:
+            bounds = ink_bounds(ink, self.margin)
+            if bounds is not None:
+                left, top, right, bottom = bounds
+                output = output[top:bottom, left:right]
+
+        return Image.fromarray(output, 'L')
+
+    def _upscale(self, gray):
+        """区域高度不足 min_height 时等比放大"""
+        height, width = gray.shape
+        if height >= self.min_height:
+            return gray
+        scale = min(self.max_scale, self.min_height / height)
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        image = Image.fromarray(gray, 'F').resize(size, Image.Resampling.BICUBIC)
+        return np.asarray(image, dtype=np.float32)
+
+    @staticmethod
+    def _rotate(output, ink, angle):
+        """把输出图片和文字掩码一起转正，新露出的角落填充为背景"""
+        image = Image.fromarray(output, 'L').rotate(
+            angle, Image.Resampling.BICUBIC, expand=True, fillcolor=255)
+        mask = Image.fromarray(ink.astype(np.uint8) * 255, 'L').rotate(
+            angle, Image.Resampling.NEAREST, expand=True, fillcolor=0)
+        return np.asarray(image), np.asarray(mask) > 127
@@ -0,0 +1,129 @@
+"""预览图缓存，后台预取相邻图片
+
+每张图片缓存两层：
+- 中等分辨率层：解码一次、不超过屏幕大小的图，所有预览都从它缩放
+- 预览图：按显示区域尺寸用 LANCZOS 缩放后的最终结果
+拖动窗口大小时用快速滤镜从中等分辨率层缩放，停下后再生成高质量预览图。
+"""
+import os
+import queue
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from image_io import fit_size, load_level
+
+# 缓存占用内存上限（字节）
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# 中等分辨率层的默认最大尺寸
+DEFAULT_LEVEL_SIZE = (2048, 2048)
+
+
+def _image_bytes(image):
+    """估算图片像素占用的内存"""
+    width, height = image.size
+    return width * height * len(image.getbands())
+
+
+class PreviewCache:
+    """按路径和修改时间缓存中等分辨率层及预览图的LRU缓存"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, level_size=DEFAULT_LEVEL_SIZE):
+        self.max_bytes = max_bytes
+        self.level_size = tuple(level_size)
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        # 预取请求队列，只由一个后台线程处理
+        self._requests = queue.Queue()
+        self._worker = threading.Thread(target=self._prefetch_loop, daemon=True)
+        self._worker.start()
+
+    def get(self, image_path, box_size):
+        """获取高质量预览图，返回 (预览图, 原图尺寸)，未命中时同步读取"""
+        mtime = os.stat(image_path).st_mtime_ns
+        key = ('preview', image_path, mtime, tuple(box_size))
+        item = self._lookup(key)
+        if item is not None:
+            return item
+
+        level, original_size = self._get_level(image_path, mtime)
+        new_size = fit_size(original_size, box_size)
+        item = level.resize(new_size, Image.Resampling.LANCZOS), original_size
+        self._put(key, item)
+        return item
+
+    def get_fast(self, image_path, box_size):
+        """快速获取预览图，用于拖动窗口大小等需要连续重绘的场景
+
+        已有高质量预览图时直接返回，否则用快速滤镜从中等分辨率层缩放，
+        结果不放入缓存。
+        """
+        mtime = os.stat(image_path).st_mtime_ns
+        item = self._lookup(('preview', image_path, mtime, tuple(box_size)))
+        if item is not None:
+            return item
+
+        level, original_size = self._get_level(image_path, mtime)
+        new_size = fit_size(original_size, box_size)
+        return level.resize(new_size, Image.Resampling.BILINEAR, reducing_gap=2.0), original_size
+
+    def _get_level(self, image_path, mtime):
+        """获取中等分辨率层，未命中时解码原图"""
+        key = ('level', image_path, mtime)
+        item = self._lookup(key)
+        if item is None:
+            item = load_level(image_path, self.level_size)
+            self._put(key, item)
+        return item
+
+    def _lookup(self, key):
+        """查找缓存项，命中时标记为最近使用"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def _put(self, key, item):
+        """加入缓存，超出内存上限时淘汰最久未使用的项"""
+        size = _image_bytes(item[0])
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return
+            self._items[key] = item
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                _, (old_image, _) = self._items.popitem(last=False)
+                self._bytes -= _image_bytes(old_image)
+
+    def prefetch(self, image_paths, box_size):
+        """在后台预先读取这些图片，新的请求会替换尚未处理的旧请求"""
+        try:
+            while True:
+                self._requests.get_nowait()
+        except queue.Empty:
+            pass
+
+        for image_path in image_paths:
+            self._requests.put((image_path, tuple(box_size)))
+
+    def _prefetch_loop(self):
+        """后台预取线程"""
+        while True:
+            image_path, box_size = self._requests.get()
+            try:
+                self.get(image_path, box_size)
+            except Exception:
+                # 预取失败不影响显示，真正显示时会再报告错误
+                pass
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
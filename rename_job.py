@@ -0,0 +1,121 @@
+import queue
+import threading
+
+from memory_budget import DEFAULT_MEMORY_BUDGET
+from rename_plan import RenamePlan
+from renamer_core import DEFAULT_LANG, DEFAULT_TEMPLATE, rename_batch
+
+
+class RenameJob(threading.Thread):
+    """在后台线程中批量识别并重命名图片，进度事件通过队列发送给界面
+
+    dry_run 为真时只识别并生成重命名计划（self.plan），不重命名；
+    传入 plan 时不再识别，直接执行计划中的重命名。
+    """
+
+    def __init__(self, image_paths, crop_box, workers=None, lang=DEFAULT_LANG,
+                 journal=None, cache=None, template=DEFAULT_TEMPLATE, preprocess=None,
+                 metrics=None, dry_run=False, plan=None, policy=None, aligner=None,
+                 duplicates=None, memory_budget=DEFAULT_MEMORY_BUDGET):
+        super().__init__(daemon=True)
+        # 可以是列表，也可以是边扫描边产生路径的生成器
+        self.image_paths = image_paths
+        self.crop_box = crop_box
+        self.workers = workers
+        self.lang = lang
+        self.journal = journal
+        self.cache = cache
+        self.template = template
+        self.preprocess = preprocess
+        # RetryPolicy，置信度低的区域重新识别
+        self.policy = policy
+        # RegionAligner，按每张图片的版面对齐识别区域
+        self.aligner = aligner
+        # DuplicateFinder，重复的图片只识别一次
+        self.duplicates = duplicates
+        # 同时解码的整页图片总大小上限（字节）
+        self.memory_budget = memory_budget
+        # RunMetrics，界面线程可以随时读取当前的统计
+        self.metrics = metrics
+        self.dry_run = dry_run
+        self.plan = RenamePlan() if dry_run else plan
+
+        # 界面线程通过 after() 轮询这个队列
+        self.events = queue.Queue()
+
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+
+    def cancel(self):
+        """取消任务，已经完成的重命名会保留"""
+        self._cancelled.set()
+        self._running.set()
+
+    def pause(self):
+        """暂停任务"""
+        self._running.clear()
+
+    def resume(self):
+        """继续任务"""
+        self._running.set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def post(self, kind, **data):
+        """发送一条进度事件"""
+        self.events.put((kind, data))
+
+    def run(self):
+        if self.plan is not None and not self.dry_run:
+            total = len(self.plan)
+            results = self.plan.apply(self.journal, self.cache, self.metrics)
+        else:
+            # 生成器的总数未知，为 None
+            total = len(self.image_paths) if hasattr(self.image_paths, '__len__') else None
+            results = rename_batch(self.image_paths, self.crop_box,
+                                   workers=self.workers, lang=self.lang,
+                                   journal=self.journal, cache=self.cache,
+                                   template=self.template, preprocess=self.preprocess,
+                                   metrics=self.metrics, dry_run=self.dry_run,
+                                   policy=self.policy, aligner=self.aligner,
+                                   duplicates=self.duplicates,
+                                   memory_budget=self.memory_budget)
+        success = 0
+        failed = 0
+        skipped = 0
+        duplicates = 0
+        self.post('start', total=total)
+
+        try:
+            for result in results:
+                if self.dry_run:
+                    self.plan.add(result)
+                if result['skipped']:
+                    skipped += 1
+                elif result['error']:
+                    failed += 1
+                elif result.get('duplicate_of'):
+                    duplicates += 1
+                else:
+                    success += 1
+                self.post('progress', total=total, **result)
+
+                # 暂停时阻塞在这里，进程池的在途任务做完后也会停下
+                self._running.wait()
+                if self._cancelled.is_set():
+                    break
+        except Exception as e:
+            self.post('error', message=str(e))
+        finally:
+            results.close()
+
+        self.post('done', success=success, failed=failed, skipped=skipped,
+                  duplicates=duplicates,
+                  cancelled=self._cancelled.is_set())
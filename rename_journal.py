@@ -0,0 +1,207 @@
+"""重命名日志，记录计划和已完成的重命名，用于中断后继续和撤销
+
+日志是只追加的JSON行文件，每行一条记录：
+    {"op": "begin", "batch": ..., "time": ...}   开始一批重命名
+    {"op": "plan", "batch": ..., "src": ..., "dst": ...}   即将重命名
+    {"op": "done", "batch": ..., "src": ..., "dst": ...}   重命名完成
+    {"op": "undo", "batch": ..., "src": ..., "dst": ...}   已撤销
+src 和 dst 记录为绝对路径，比较时不区分大小写的系统上统一大小写，
+从不同的工作目录、用相对或绝对路径重新运行都能认出已处理的图片。
+写入按条数或时间批量刷新并 fsync，程序崩溃时最多丢失最后一个刷新周期内的记录。
+常驻运行时用 rotate() 把日志文件归档并清空内存中的记录，内存和文件都不会一直增长。
+"""
+import json
+import os
+import time
+import uuid
+
+# 默认日志文件名，放在图片所在目录
+JOURNAL_NAME = '.image_renamer_journal.jsonl'
+
+
+def _key(path):
+    """路径的比较形式：绝对路径，不区分大小写的系统上统一大小写"""
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _stamp():
+    """批次编号和归档文件名使用的时间戳，带随机后缀避免重复"""
+    return time.strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:6]
+
+
+class RenameJournal:
+    """只追加的重命名日志"""
+
+    def __init__(self, path, flush_every=256, flush_interval=1.0):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.batch = None
+
+        # 已完成的重命名 src 的比较形式 -> (src, dst, batch)，以及所有重命名结果路径的比较形式
+        self._done = {}
+        self._outputs = set()
+        self._batches = []
+
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+        self._load()
+        self._file = open(path, 'a', encoding='utf-8')
+        self._recover()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        """内存中记录的已完成重命名的数量"""
+        return len(self._done)
+
+    def _load(self):
+        """读取已有的日志记录"""
+        self._pending = {}
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 崩溃时最后一行可能没有写完整
+                    continue
+                self._apply(record)
+
+    def _apply(self, record):
+        """把一条记录应用到内存中的状态"""
+        op = record.get('op')
+        batch = record.get('batch')
+        if op == 'begin':
+            self._batches.append(batch)
+        elif op in ('plan', 'done', 'undo'):
+            # 旧日志中的相对路径按当前目录解析
+            src = os.path.abspath(record['src'])
+            dst = os.path.abspath(record['dst'])
+            if op == 'plan':
+                self._pending[_key(src)] = (src, dst, batch)
+            elif op == 'done':
+                self._pending.pop(_key(src), None)
+                self._done[_key(src)] = (src, dst, batch)
+                self._outputs.add(_key(dst))
+            else:
+                self._done.pop(_key(src), None)
+                self._outputs.discard(_key(dst))
+
+    def _recover(self):
+        """检查崩溃前计划了但没有记录完成的重命名"""
+        for src, dst, batch in list(self._pending.values()):
+            if not os.path.exists(src) and os.path.exists(dst):
+                # 重命名已经发生，只是完成记录没来得及写入
+                self._write({'op': 'done', 'batch': batch, 'src': src, 'dst': dst})
+        self._pending.clear()
+        self.flush()
+
+    def _write(self, record):
+        """追加一条记录，按需批量刷新到磁盘"""
+        self._apply(record)
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._unflushed += 1
+        if (self._unflushed >= self.flush_every or
+                time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """把缓冲的记录写入磁盘"""
+        if self._unflushed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        """刷新并关闭日志文件"""
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def begin(self):
+        """开始一批新的重命名，返回批次编号"""
+        self.batch = _stamp()
+        self._write({'op': 'begin', 'batch': self.batch, 'time': time.time()})
+        return self.batch
+
+    def rotate(self):
+        """把日志文件归档为 <日志文件名>.<时间>，之后写入新的日志文件，返回归档的路径
+
+        内存中的记录随之清空，归档前的重命名只能用归档文件撤销；
+        当前批次在新文件中继续。
+        """
+        self.flush()
+        self._file.close()
+        archive = f"{self.path}.{_stamp()}"
+        os.replace(self.path, archive)
+        self._done.clear()
+        self._pending.clear()
+        self._outputs.clear()
+        self._batches.clear()
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if self.batch is not None:
+            self._write({'op': 'begin', 'batch': self.batch, 'time': time.time()})
+            self.flush()
+        return archive
+
+    def plan(self, src, dst):
+        """记录即将执行的重命名"""
+        self._write({'op': 'plan', 'batch': self.batch,
+                     'src': os.path.abspath(src), 'dst': os.path.abspath(dst)})
+
+    def done(self, src, dst):
+        """记录已完成的重命名"""
+        self._write({'op': 'done', 'batch': self.batch,
+                     'src': os.path.abspath(src), 'dst': os.path.abspath(dst)})
+
+    def is_done(self, path):
+        """图片是否已经处理过（原文件已重命名，或本身就是重命名的结果）"""
+        key = _key(path)
+        return key in self._done or key in self._outputs
+
+    def is_output(self, path):
+        """路径是否为日志中记录的重命名结果"""
+        return _key(path) in self._outputs
+
+    def renamed_path(self, path):
+        """返回已完成重命名的新路径（绝对路径）"""
+        entry = self._done.get(_key(path))
+        return entry[1] if entry else None
+
+    @property
+    def last_batch(self):
+        """最近一批仍有可撤销重命名的批次编号"""
+        batches = {batch for _, _, batch in self._done.values()}
+        for batch in reversed(self._batches):
+            if batch in batches:
+                return batch
+        return None
+
+    def rollback(self, batch=None):
+        """撤销一批重命名（默认最近一批），逐个返回 (当前路径, 还原路径, 错误信息)"""
+        batch = batch or self.last_batch
+        entries = [(src, dst) for src, dst, b in self._done.values() if b == batch]
+
+        # 倒序撤销，保证同名编号文件按相反顺序还原
+        for src, dst in reversed(entries):
+            error = None
+            if os.path.exists(src):
+                error = "原文件名已被占用"
+            elif not os.path.exists(dst):
+                error = "文件不存在"
+            else:
+                try:
+                    os.rename(dst, src)
+                    self._write({'op': 'undo', 'batch': batch, 'src': src, 'dst': dst})
+                except OSError as e:
+                    error = str(e)
+            yield dst, src, error
+        self.flush()
@@ -0,0 +1,216 @@
+"""重命名计划：先识别出所有新文件名，检查修改后再统一执行
+
+计划保存为JSON行文件，每行一张图片：
+    {"path": ..., "new_path": ..., "text": ..., "fields": {...}, "error": ...,
+     "collision": false, "confidence": null, "enabled": true}
+重复的图片还有 "duplicate_of"，new_path 为空时保留原名不动。
+可以直接编辑文件中的 text 或 new_path，再用 --apply 执行。
+"""
+import json
+import os
+import time
+
+from name_index import NameIndex
+from ocr_policy import DEFAULT_MIN_CONFIDENCE
+from renamer_core import desired_path, move_image
+
+
+def _key(path):
+    return os.path.normcase(path)
+
+
+class RenamePlan:
+    """一批图片的重命名计划"""
+
+    def __init__(self, entries=None, min_confidence=DEFAULT_MIN_CONFIDENCE):
+        self.entries = []
+        # 识别置信度低于这个值且没有修改过的条目需要检查
+        self.min_confidence = min_confidence
+        # 各目标路径被多少张图片使用，用于发现修改后的重名
+        self._targets = {}
+        for entry in entries or []:
+            self._append(entry)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, index):
+        return self.entries[index]
+
+    def _append(self, entry):
+        entry.setdefault('collision', False)
+        entry.setdefault('confidence', None)
+        entry.setdefault('enabled', True)
+        self.entries.append(entry)
+        self._add_target(entry)
+
+    def _add_target(self, entry):
+        if entry['new_path'] and entry['new_path'] != entry['path']:
+            key = _key(entry['new_path'])
+            self._targets[key] = self._targets.get(key, 0) + 1
+
+    def _remove_target(self, entry):
+        if entry['new_path'] and entry['new_path'] != entry['path']:
+            key = _key(entry['new_path'])
+            self._targets[key] -= 1
+            if not self._targets[key]:
+                del self._targets[key]
+
+    def add(self, result):
+        """加入 rename_batch(dry_run=True) 返回的一条结果"""
+        entry = {
+            'path': result['path'],
+            'new_path': None if result['skipped'] else result['new_path'],
+            'text': result['text'],
+            'fields': result['fields'],
+            'error': result['error'],
+            'collision': result.get('collision', False),
+            'confidence': result.get('confidence'),
+            # 之前已经处理过的图片默认不再重命名
+            'enabled': not result['skipped'],
+        }
+        if result.get('duplicate_of'):
+            entry['duplicate_of'] = result['duplicate_of']
+        self._append(entry)
+
+    def set_text(self, index, text):
+        """修改一张图片的文件名文字，重新计算新路径"""
+        entry = self.entries[index]
+        self._remove_target(entry)
+        text = text.strip()
+        entry['text'] = text
+        entry['edited'] = True
+        # 给重复的图片指定文件名后按普通图片重命名
+        entry.pop('duplicate_of', None)
+        if text:
+            entry['new_path'] = desired_path(entry['path'], text)
+            entry['error'] = None
+            entry['enabled'] = True
+        else:
+            entry['new_path'] = None
+            entry['error'] = "文件名为空"
+        self._add_target(entry)
+
+    def set_enabled(self, index, enabled):
+        """设置是否执行这一条重命名"""
+        self.entries[index]['enabled'] = enabled
+
+    def conflict(self, index):
+        """是否存在文件名冲突
+
+        规划时因重名追加了编号，或者修改后与计划中其他图片、磁盘上已有的文件重名。
+        """
+        entry = self.entries[index]
+        new_path = entry['new_path']
+        if not new_path or new_path == entry['path']:
+            return False
+        if self._targets.get(_key(new_path), 0) > 1:
+            return True
+        if entry.get('edited'):
+            return os.path.exists(new_path)
+        return entry['collision']
+
+    def uncertain(self, index):
+        """识别置信度是否偏低，修改过文件名的条目不算"""
+        entry = self.entries[index]
+        confidence = entry['confidence']
+        return (confidence is not None and confidence < self.min_confidence
+                and not entry.get('edited'))
+
+    def status(self, index):
+        """一条计划的状态：error、disabled、duplicate、conflict、uncertain、unchanged 或 ok"""
+        entry = self.entries[index]
+        if entry['error']:
+            return 'error'
+        if not entry['enabled']:
+            return 'disabled'
+        if entry.get('duplicate_of'):
+            return 'duplicate'
+        if self.conflict(index):
+            return 'conflict'
+        if self.uncertain(index):
+            return 'uncertain'
+        if entry['new_path'] == entry['path']:
+            return 'unchanged'
+        return 'ok'
+
+    def counts(self):
+        """各状态的条数"""
+        counts = {}
+        for index in range(len(self.entries)):
+            status = self.status(index)
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def save(self, path):
+        """写入计划文件，先写临时文件再替换"""
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for entry in self.entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path, min_confidence=DEFAULT_MIN_CONFIDENCE):
+        """读取计划文件"""
+        entries = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entries.append(json.loads(line))
+        return cls(entries, min_confidence)
+
+    def apply(self, journal=None, cache=None, metrics=None):
+        """执行计划中的重命名，逐个返回与 rename_batch 格式相同的结果
+
+        新文件名在执行时被占用（目录在规划后有变化）时追加编号。
+        """
+        if journal is not None:
+            journal.begin()
+        if metrics is not None:
+            metrics.start()
+        names = NameIndex(journal)
+        try:
+            for index, entry in enumerate(self.entries):
+                path = entry['path']
+                result = {
+                    'index': index,
+                    'path': path,
+                    'new_path': None,
+                    'text': entry['text'],
+                    'fields': entry['fields'],
+                    'error': entry['error'],
+                    'skipped': False
+                }
+                if entry.get('duplicate_of'):
+                    result['duplicate_of'] = entry['duplicate_of']
+                if not entry['error']:
+                    if (not entry['enabled'] or not entry['new_path']
+                            or (journal is not None and journal.is_done(path))):
+                        # 不执行的、保留原名的重复图片和之前已处理过的都跳过
+                        result['skipped'] = True
+                    else:
+                        start = time.perf_counter()
+                        try:
+                            new_path = names.claim(entry['new_path'], path)
+                            result['new_path'] = move_image(path, new_path, journal, names)
+                            if cache is not None and new_path != path:
+                                cache.move(path, new_path)
+                        except OSError as e:
+                            result['error'] = str(e)
+                        if metrics is not None:
+                            metrics.observe('rename', time.perf_counter() - start)
+                if metrics is not None:
+                    metrics.incr('images')
+                    if result['skipped']:
+                        metrics.incr('skipped')
+                    else:
+                        metrics.incr('failed' if result['error'] else 'renamed')
+                yield result
+        finally:
+            if journal is not None:
+                journal.flush()
+            if cache is not None:
+                cache.commit()
+            if metrics is not None:
+                metrics.finish()
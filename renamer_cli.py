@@ -0,0 +1,431 @@
+"""命令行批量重命名，不需要图形界面
+
+示例：
+    python renamer_cli.py scans/ --box 100,50,900,160
+    python renamer_cli.py "scans/**/*.jpg" --box 0.1,0.02,0.6,0.08 --relative --workers 8
+    python renamer_cli.py scans/ --box 100,50,900,160 --journal scans.jsonl
+    python renamer_cli.py --undo --journal scans.jsonl
+    python renamer_cli.py scans/ --box 0.1,0.02,0.6,0.08 --relative --save-profile 发票
+    python renamer_cli.py scans/ --profile 发票
+    python renamer_cli.py scans/ --relative --region date=0.70,0.05,0.95,0.09 \
+        --region no=0.70,0.10,0.95,0.14 --template "{date}_{no}"
+    python renamer_cli.py scans/ --box 100,50,900,160 --preprocess all
+    python renamer_cli.py scans/ --box 100,50,900,160 --metrics run.prom
+    python renamer_cli.py scans/ --box 100,50,900,160 --engine pytesseract --batch-size 32
+    python renamer_cli.py scans/ --box 100,50,900,160 --min-confidence 80 --retry-lang eng
+    python renamer_cli.py scans/ --box 0.1,0.02,0.6,0.08 --relative --align
+    python renamer_cli.py scans/ --box 100,50,900,160 --duplicates move
+    python renamer_cli.py scans/ --box 100,50,900,160 --workers 32 --memory-budget 256
+    python renamer_cli.py scans/ --box 100,50,900,160 --plan scans.plan.jsonl
+    python renamer_cli.py --apply scans.plan.jsonl --journal scans.jsonl
+    python renamer_cli.py /mnt/scans/ --box 0.1,0.02,0.6,0.08 --relative --watch
+    python renamer_cli.py /mnt/drop/ --box 0.1,0.02,0.6,0.08 --relative --queue /mnt/drop/queue.db
+    python renamer_cli.py --work /mnt/drop/queue.db --workers 16
+    python renamer_cli.py --collect /mnt/drop/queue.db --journal /mnt/drop/journal.jsonl
+"""
+import argparse
+import json
+import os
+import sys
+
+from align import RegionAligner
+from crop_profiles import DEFAULT_PROFILES_PATH, ProfileStore
+from dedupe import ACTIONS, DUPLICATE_DIR, DuplicateFinder
+from memory_budget import DEFAULT_MEMORY_BUDGET
+from metrics import RunMetrics
+from ocr_cache import DEFAULT_CACHE_PATH, OcrCache
+from ocr_engine import BACKENDS, resolve_backend
+from ocr_policy import DEFAULT_MIN_CONFIDENCE, DEFAULT_PASSES, RetryPolicy, parse_pass
+from preprocess import STEPS, Preprocessor, parse_steps
+from rename_journal import RenameJournal
+from rename_plan import RenamePlan
+from renamer_core import (DEFAULT_LANG, DEFAULT_TEMPLATE, as_regions, format_name,
+                          iter_image_paths, rename_batch)
+from watch_folder import watch
+from work_queue import DEFAULT_LEASE_SECONDS, WorkQueue, collect, work, worker_name
+
+# 影响识别结果的参数，加入工作队列时一起保存，工作进程按这些参数识别
+RECOGNITION_KEYS = ('lang', 'engine', 'preprocess', 'min_confidence', 'retry', 'retry_lang',
+                    'align', 'align_search', 'batch_size')
+
+
+def parse_box(value, relative=False):
+    """解析 x0,y0,x1,y1 格式的裁剪框"""
+    parts = value.split(',')
+    if len(parts) != 4:
+        raise argparse.ArgumentTypeError("裁剪框格式应为 x0,y0,x1,y1")
+
+    try:
+        if relative:
+            box = tuple(float(p) for p in parts)
+        else:
+            box = tuple(int(p) for p in parts)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的裁剪框: {value}")
+
+    if box[2] <= box[0] or box[3] <= box[1]:
+        raise argparse.ArgumentTypeError(f"裁剪框宽高必须大于0: {value}")
+    if relative and not all(0.0 <= c <= 1.0 for c in box):
+        raise argparse.ArgumentTypeError(f"比例坐标必须在0到1之间: {value}")
+    return box
+
+
+def parse_region(value, relative=False):
+    """解析 名称=x0,y0,x1,y1 格式的命名区域"""
+    name, sep, box = value.partition('=')
+    if not sep or not name.isidentifier():
+        raise argparse.ArgumentTypeError(f"区域格式应为 名称=x0,y0,x1,y1: {value}")
+    return name, parse_box(box, relative)
+
+
+def build_parser():
+    """创建命令行参数解析器"""
+    parser = argparse.ArgumentParser(
+        description="识别图片指定区域的文字并重命名图片，结果以JSON行输出"
+    )
+    parser.add_argument('inputs', nargs='*',
+                        help="图片目录或通配符（支持 ** 递归匹配）")
+    parser.add_argument('--box',
+                        help="裁剪框 x0,y0,x1,y1，默认为原图像素坐标")
+    parser.add_argument('--region', action='append', metavar='NAME=X0,Y0,X1,Y1',
+                        help="命名的识别区域，可以指定多次，配合 --template 组合文件名")
+    parser.add_argument('--relative', action='store_true',
+                        help="裁剪框使用相对宽高的比例坐标（0~1）")
+    parser.add_argument('--template',
+                        help="文件名模板，例如 {date}_{vendor}_{no}，默认直接使用识别的文字")
+    parser.add_argument('--profile',
+                        help="使用保存的裁剪方案代替 --box/--region")
+    parser.add_argument('--save-profile', metavar='NAME',
+                        help="把 --box/--region 指定的比例坐标区域和 --template 保存为裁剪方案")
+    parser.add_argument('--profiles', default=DEFAULT_PROFILES_PATH,
+                        help=f"裁剪方案文件，默认 {DEFAULT_PROFILES_PATH}")
+    parser.add_argument('--recursive', action='store_true',
+                        help="同时处理子目录中的图片")
+    parser.add_argument('--check-header', action='store_true',
+                        help="根据文件头过滤，跳过扩展名是图片但内容不是图片的文件")
+    parser.add_argument('--lang', default=DEFAULT_LANG,
+                        help=f"Tesseract识别语言，默认 {DEFAULT_LANG}")
+    parser.add_argument('--engine', choices=BACKENDS, default='auto',
+                        help="OCR引擎，auto 时优先使用 tesserocr，否则使用 pytesseract")
+    parser.add_argument('--preprocess', default='none', metavar='STEPS',
+                        help=f"识别前的预处理步骤，逗号分隔（{','.join(STEPS)}），"
+                             "all 表示全部，默认 none")
+    parser.add_argument('--align', action='store_true',
+                        help="以裁剪框为参考，在每张图片中找到文字实际所在的区域，适合标签位置每页略有偏移的扫描件")
+    parser.add_argument('--align-search', type=float, default=0.5, metavar='RATIO',
+                        help="对齐时向四周搜索的范围，相对裁剪框宽高的比例，默认 0.5")
+    parser.add_argument('--batch-size', type=int, default=0, metavar='N',
+                        help="把 N 张图片的识别区域合成一个多页TIFF，只调用一次 tesseract，"
+                             "适合 pytesseract 识别大量短文字条，默认不合并")
+    parser.add_argument('--min-confidence', type=float, metavar='N',
+                        help="识别置信度（0-100）低于 N 的区域用更费时的设置重新识别，"
+                             f"如 {DEFAULT_MIN_CONFIDENCE}；默认不重新识别，"
+                             f"只指定 --retry 或 --retry-lang 时为 {DEFAULT_MIN_CONFIDENCE}")
+    parser.add_argument('--retry', action='append', metavar='OPTIONS',
+                        help="重新识别使用的设置，如 psm=7,scale=2，可以多次指定，按顺序尝试；"
+                             "默认依次尝试单行模式、放大2倍、放大3倍")
+    parser.add_argument('--retry-lang', metavar='LANG',
+                        help="最后一次重新识别时增加的识别语言，如 eng")
+    parser.add_argument('--duplicates', choices=ACTIONS, metavar='ACTION',
+                        help="批次内重复的图片只识别一次：report 保留原名并在结果中标出，"
+                             f"move 移到所在目录的 {DUPLICATE_DIR} 子目录；默认不查重")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="OCR进程数，默认等于CPU核心数")
+    parser.add_argument('--memory-budget', type=int, default=DEFAULT_MEMORY_BUDGET // 2**20,
+                        metavar='MB',
+                        help="同时解码的整页图片总大小上限（MB），"
+                             f"默认 {DEFAULT_MEMORY_BUDGET // 2**20}，0 表示不限制")
+    parser.add_argument('--journal',
+                        help="重命名日志文件，重新运行时跳过已处理的图片")
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH,
+                        help=f"OCR结果缓存文件，默认 {DEFAULT_CACHE_PATH}")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="不使用OCR结果缓存")
+    parser.add_argument('--metrics', metavar='PATH',
+                        help="运行结束后写入各阶段耗时统计，扩展名为 .prom 时使用 Prometheus 文本格式，"
+                             "否则为 JSON")
+    parser.add_argument('--plan', metavar='PATH',
+                        help="只识别并把重命名计划写入文件，不重命名；检查或修改后用 --apply 执行")
+    parser.add_argument('--apply', metavar='PATH',
+                        help="执行 --plan 生成的重命名计划，不再识别")
+    parser.add_argument('--watch', action='store_true',
+                        help="一直监视指定的目录，新图片写入完成后立即识别并重命名，按 Ctrl+C 停止")
+    parser.add_argument('--existing', action='store_true',
+                        help="--watch 启动时也处理目录中已有的图片")
+    parser.add_argument('--settle', type=float, default=0.5, metavar='SECONDS',
+                        help="--watch 时新图片的大小和修改时间这么久不再变化才算写入完成，默认 0.5 秒")
+    parser.add_argument('--queue', metavar='PATH',
+                        help="不在本机识别，把图片和识别参数加入工作队列，由 --work 的工作进程识别")
+    parser.add_argument('--work', metavar='PATH',
+                        help="作为工作进程识别队列中的图片，可以在多台机器上同时运行")
+    parser.add_argument('--collect', metavar='PATH',
+                        help="按入队顺序重命名队列中识别完成的图片，等待全部识别完成")
+    parser.add_argument('--no-wait', action='store_true',
+                        help="--collect 只处理已经识别完成的图片，不等待其余图片")
+    parser.add_argument('--lease', type=float, default=DEFAULT_LEASE_SECONDS, metavar='SECONDS',
+                        help="工作进程领取图片的租约时长，工作进程中断后超过这个时间图片会被重新领取，"
+                             f"默认 {DEFAULT_LEASE_SECONDS} 秒")
+    parser.add_argument('--undo', action='store_true',
+                        help="根据 --journal 撤销最近一批重命名")
+    return parser
+
+
+def undo(journal_path):
+    """撤销日志中最近一批重命名"""
+    failed = 0
+    with RenameJournal(journal_path) as journal:
+        for current_path, original_path, error in journal.rollback():
+            if error:
+                failed += 1
+            print(json.dumps({'path': current_path, 'new_path': original_path,
+                              'error': error}, ensure_ascii=False), flush=True)
+    return 1 if failed else 0
+
+
+def apply_plan(plan_path, journal_path=None, cache_path=None, metrics_path=None):
+    """执行计划文件中的重命名"""
+    plan = RenamePlan.load(plan_path)
+    journal = RenameJournal(journal_path) if journal_path else None
+    cache = OcrCache(cache_path) if cache_path else None
+    metrics = RunMetrics(plan=os.path.basename(plan_path))
+    failed = 0
+    try:
+        for result in plan.apply(journal, cache, metrics):
+            if result['error']:
+                failed += 1
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+    finally:
+        if journal is not None:
+            journal.close()
+        if cache is not None:
+            cache.close()
+        if metrics_path:
+            metrics.write(metrics_path)
+        print(metrics.summary(), file=sys.stderr)
+    return 1 if failed else 0
+
+
+def recognition_options(settings):
+    """按识别参数创建 (预处理, 重新识别策略, 对齐器)，参数有误时抛出 ValueError"""
+    preprocess = Preprocessor(parse_steps(settings['preprocess']))
+    policy = None
+    min_confidence = settings['min_confidence']
+    if min_confidence is None and (settings['retry'] or settings['retry_lang']):
+        min_confidence = DEFAULT_MIN_CONFIDENCE
+    if min_confidence is not None and min_confidence > 0:
+        retry = settings['retry']
+        passes = [parse_pass(value) for value in retry] if retry else None
+        policy = RetryPolicy(min_confidence, passes or DEFAULT_PASSES,
+                             settings['retry_lang'])
+    aligner = RegionAligner(search=settings['align_search']) if settings['align'] else None
+    return preprocess, policy, aligner
+
+
+def enqueue(queue_path, image_paths, crop_box, template, args):
+    """把图片和识别参数加入工作队列"""
+    config = {key: getattr(args, key) for key in RECOGNITION_KEYS}
+    config.update(crop_box=crop_box, template=template)
+    # 按 JSON 的形式比较，元组和列表视为相同
+    config = json.loads(json.dumps(config))
+    with WorkQueue(queue_path, args.lease) as queue:
+        existing = queue.config()
+        if existing is not None and existing != config:
+            print("队列中已有使用其他识别参数的图片，请使用新的队列文件", file=sys.stderr)
+            return 1
+        queue.set_config(config)
+        added = queue.enqueue(image_paths)
+        counts = queue.counts()
+    print(f"已加入 {added} 张图片，队列中共 {sum(counts.values())} 张", file=sys.stderr)
+    return 0
+
+
+def run_worker(queue_path, workers=None, cache_path=None, metrics_path=None,
+               lease=DEFAULT_LEASE_SECONDS, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """作为工作进程识别队列中的图片，识别结果写回队列"""
+    with WorkQueue(queue_path, lease) as queue:
+        config = queue.config()
+        if config is None:
+            print(f"队列 {queue_path} 中没有图片", file=sys.stderr)
+            return 1
+        preprocess, policy, aligner = recognition_options(config)
+        cache = OcrCache(cache_path) if cache_path else None
+        metrics = RunMetrics(workers=workers or os.cpu_count() or 1, engine=config['engine'],
+                             lang=config['lang'], worker=worker_name())
+        failed = 0
+        try:
+            for result in work(queue, config['crop_box'], workers=workers,
+                               lang=config['lang'], backend=config['engine'], cache=cache,
+                               template=config['template'], preprocess=preprocess,
+                               metrics=metrics, batch_size=config['batch_size'],
+                               policy=policy, aligner=aligner,
+                               memory_budget=memory_budget):
+                if result['error']:
+                    failed += 1
+                print(json.dumps(result, ensure_ascii=False), flush=True)
+        finally:
+            if cache is not None:
+                cache.close()
+            if metrics_path:
+                metrics.write(metrics_path)
+            print(metrics.summary(), file=sys.stderr)
+    return 1 if failed else 0
+
+
+def collect_results(queue_path, journal_path=None, cache_path=None, metrics_path=None,
+                    wait=True):
+    """按入队顺序重命名队列中识别完成的图片"""
+    journal = RenameJournal(journal_path) if journal_path else None
+    cache = OcrCache(cache_path) if cache_path else None
+    metrics = RunMetrics(queue=os.path.basename(queue_path))
+    failed = 0
+    try:
+        with WorkQueue(queue_path) as queue:
+            config = queue.config()
+            if config is None:
+                print(f"队列 {queue_path} 中没有图片", file=sys.stderr)
+                return 1
+            for result in collect(queue, config['template'], journal, cache, metrics, wait):
+                if result['error']:
+                    failed += 1
+                print(json.dumps(result, ensure_ascii=False), flush=True)
+            remaining = queue.unfinished()
+        if remaining:
+            print(f"还有 {remaining} 张图片没有识别完成", file=sys.stderr)
+    finally:
+        if journal is not None:
+            journal.close()
+        if cache is not None:
+            cache.close()
+        if metrics_path:
+            metrics.write(metrics_path)
+        print(metrics.summary(), file=sys.stderr)
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    memory_budget = args.memory_budget * 2**20 or None
+    if args.undo:
+        if not args.journal:
+            parser.error("--undo 需要同时指定 --journal")
+        return undo(args.journal)
+    if args.apply:
+        return apply_plan(args.apply, args.journal, None if args.no_cache else args.cache,
+                          args.metrics)
+    if args.work:
+        return run_worker(args.work, args.workers, None if args.no_cache else args.cache,
+                          args.metrics, args.lease, memory_budget)
+    if args.collect:
+        return collect_results(args.collect, args.journal,
+                               None if args.no_cache else args.cache, args.metrics,
+                               wait=not args.no_wait)
+
+    profiles = ProfileStore(args.profiles)
+    template = DEFAULT_TEMPLATE
+    try:
+        if args.box and args.region:
+            parser.error("--box 和 --region 只能指定一个")
+        elif args.box:
+            crop_box = parse_box(args.box, args.relative)
+        elif args.region:
+            crop_box = dict(parse_region(value, args.relative) for value in args.region)
+        elif args.profile:
+            crop_box, template = profiles.get(args.profile)
+        else:
+            parser.error("需要指定 --box、--region 或 --profile")
+    except (argparse.ArgumentTypeError, KeyError) as e:
+        parser.error(e.args[0])
+    template = args.template or template
+
+    try:
+        format_name(template, {name: '' for name in as_regions(crop_box)})
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.save_profile:
+        if not args.relative:
+            parser.error("--save-profile 需要使用 --relative 比例坐标")
+        profiles.save(args.save_profile, crop_box, template)
+        if not args.inputs:
+            return 0
+
+    if not args.inputs:
+        parser.error("需要指定图片目录或通配符")
+    try:
+        resolve_backend(args.engine)
+    except RuntimeError as e:
+        parser.error(str(e))
+    try:
+        preprocess, policy, aligner = recognition_options(vars(args))
+    except ValueError as e:
+        parser.error(str(e))
+    duplicates = DuplicateFinder(args.duplicates) if args.duplicates else None
+
+    # 边扫描目录边识别，不先收集完整的路径列表
+    image_paths = iter_image_paths(args.inputs, args.recursive, args.check_header)
+    if args.queue:
+        if duplicates is not None or args.plan:
+            parser.error("--queue 不能与 --duplicates、--plan 一起使用")
+        return enqueue(args.queue, image_paths, crop_box, template, args)
+    if args.watch:
+        if duplicates is not None or args.plan:
+            parser.error("--watch 不能与 --duplicates、--plan 一起使用")
+        if not all(os.path.isdir(path) for path in args.inputs):
+            parser.error("--watch 只能指定目录")
+    journal = RenameJournal(args.journal) if args.journal else None
+    cache = None if args.no_cache else OcrCache(args.cache)
+    metrics = RunMetrics(workers=args.workers or os.cpu_count() or 1,
+                         engine=args.engine, lang=args.lang)
+    plan = None
+    if args.plan:
+        # 不重新识别时也按默认阈值标出置信度低的图片
+        plan = RenamePlan(min_confidence=DEFAULT_MIN_CONFIDENCE if args.min_confidence is None
+                          else args.min_confidence)
+    if args.watch:
+        print(f"正在监视 {', '.join(args.inputs)}，按 Ctrl+C 停止", file=sys.stderr)
+        results = watch(args.inputs, crop_box, recursive=args.recursive,
+                        existing=args.existing, settle=args.settle,
+                        workers=args.workers, lang=args.lang, backend=args.engine,
+                        preprocess=preprocess, metrics=metrics,
+                        batch_size=args.batch_size, policy=policy, aligner=aligner,
+                        memory_budget=memory_budget, journal=journal, cache=cache,
+                        template=template)
+    else:
+        results = rename_batch(image_paths, crop_box,
+                               workers=args.workers, lang=args.lang,
+                               backend=args.engine, journal=journal,
+                               cache=cache, template=template,
+                               preprocess=preprocess, metrics=metrics,
+                               batch_size=args.batch_size,
+                               dry_run=plan is not None, policy=policy,
+                               aligner=aligner, duplicates=duplicates,
+                               memory_budget=memory_budget)
+    failed = 0
+    try:
+        for result in results:
+            if result['error']:
+                failed += 1
+            if plan is not None:
+                plan.add(result)
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+        if plan is not None:
+            plan.save(args.plan)
+    except KeyboardInterrupt:
+        # 监视模式只能用 Ctrl+C 停止，不算出错
+        if not args.watch:
+            raise
+    finally:
+        if journal is not None:
+            journal.close()
+        if cache is not None:
+            cache.close()
+        if args.metrics:
+            metrics.write(args.metrics)
+        print(metrics.summary(), file=sys.stderr)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,841 @@
+"""图片识别重命名的核心流程，不依赖图形界面"""
+import glob
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import islice
+
+from image_io import (MIN_REGION_HEIGHT, has_image_header, image_size, load_regions,
+                      resolve_box)
+from memory_budget import DEFAULT_MEMORY_BUDGET, MemoryBudget
+from metrics import StageTimings
+from name_index import NameIndex
+from ocr_cache import file_digest
+from ocr_engine import DEFAULT_LANG, create_engine, resolve_backend
+
+# 支持的图片扩展名
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff')
+
+# 只有一个裁剪框时使用的区域名和文件名模板
+DEFAULT_REGION = 'text'
+DEFAULT_TEMPLATE = '{text}'
+
+# 除进程池中在途的图片外，已经登记、等待按顺序输出的图片最多这么多张，
+# 连续跳过或命中缓存的图片很多时先输出前面的，不在内存中堆积
+MAX_PENDING = 1024
+
+
+# 工作进程内常驻的识别引擎，模型只在进程启动时加载一次
+_engine = None
+# 工作进程内使用的预处理配置
+_preprocess = None
+# 工作进程内使用的重新识别策略
+_policy = None
+# 工作进程内使用的区域对齐器
+_aligner = None
+# 所有工作进程共享的解码内存预算
+_budget = None
+# 工作进程创建引擎的耗时，随第一个任务的结果报告给主进程
+_startup_time = None
+
+
+def _init_worker(lang, backend, preprocess=None, policy=None, aligner=None, budget=None):
+    """初始化工作进程并预热识别引擎"""
+    global _engine, _preprocess, _policy, _aligner, _budget, _startup_time
+    # 每个进程只跑一个tesseract线程，避免与进程池争抢CPU
+    os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+    start = time.perf_counter()
+    _engine = create_engine(lang, backend)
+    _startup_time = time.perf_counter() - start
+    _preprocess = preprocess
+    _policy = policy
+    _aligner = aligner
+    _budget = budget
+
+
+def as_regions(crop_box):
+    """把单个裁剪框或 {区域名: 裁剪框} 统一成区域字典"""
+    if isinstance(crop_box, dict):
+        return {name: tuple(box) for name, box in crop_box.items()}
+    return {DEFAULT_REGION: tuple(crop_box)}
+
+
+def _retry_regions(engine, policy, results, crop, timings, owned=False):
+    """按策略重新识别置信度低的区域，crop(i) 返回第 i 个区域的图片
+
+    owned 为真时 crop(i) 每次新裁剪出图片，重新识别后立即关闭。
+    """
+    if policy is None:
+        return results
+    results = list(results)
+    for i, (text, confidence) in enumerate(results):
+        if not policy.accept(text, confidence):
+            with timings.measure('retry'):
+                region = crop(i)
+                try:
+                    results[i] = policy.retry(engine, region, text, confidence)
+                finally:
+                    if owned:
+                        region.close()
+    return results
+
+
+def _split_results(names, results):
+    """把各区域的 (文字, 置信度) 拆成 {区域名: 文字} 和 {区域名: 置信度}"""
+    fields = {name: text for name, (text, _) in zip(names, results)}
+    confidences = {name: round(confidence, 1) for name, (_, confidence) in zip(names, results)}
+    return fields, confidences
+
+
+def load_aligned(image_path, crop_boxes, aligner, timings, budget=None):
+    """解码各区域所需的部分，有对齐器时先在每个区域的搜索范围内找到文字所在的位置
+
+    返回 (解码出的图片, 各区域在该图片中的坐标)，用完后由调用方关闭图片。
+    """
+    # 解码在裁剪时才真正发生，两者一起统计
+    if aligner is None:
+        with timings.measure('decode'):
+            return load_regions(image_path, crop_boxes, budget=budget)
+
+    with timings.measure('decode'):
+        size = image_size(image_path)
+        priors = [resolve_box(box, size) for box in crop_boxes]
+        windows = [aligner.window(prior, size) for prior in priors]
+        # 搜索范围比区域大，按比例提高最小高度，保证区域本身的解码精度
+        image, decoded = load_regions(image_path, windows,
+                                      round(MIN_REGION_HEIGHT * (1 + 2 * aligner.search)),
+                                      budget)
+
+    boxes = []
+    with timings.measure('align'):
+        for prior, window, box in zip(priors, windows, decoded):
+            # 解码结果可能按比例缩小，把框选区域换算到搜索范围的图片中
+            scale_x = (box[2] - box[0]) / max(1, window[2] - window[0])
+            scale_y = (box[3] - box[1]) / max(1, window[3] - window[1])
+            local = (round((prior[0] - window[0]) * scale_x), round((prior[1] - window[1]) * scale_y),
+                     round((prior[2] - window[0]) * scale_x), round((prior[3] - window[1]) * scale_y))
+            crop = image.crop(box)
+            try:
+                x0, y0, x1, y1 = aligner(crop, local)
+            finally:
+                crop.close()
+            boxes.append((box[0] + x0, box[1] + y0, box[0] + x1, box[1] + y1))
+    return image, boxes
+
+
+def _close_all(images):
+    """立即释放图片的像素，不等垃圾回收"""
+    for image in images:
+        image.close()
+
+
+def ocr_regions(image_path, regions, engine, preprocess=None, timings=None, policy=None,
+                aligner=None, budget=None):
+    """打开图片，一次解码所有区域并识别，返回 ({区域名: 文字}, {区域名: 置信度})
+
+    有对齐器时每个区域先按图片的实际版面对齐；有预处理时各区域分别预处理后再识别；
+    有重新识别策略时，置信度低的区域按策略重新识别；
+    timings 为 StageTimings 时记录各阶段耗时；budget 为解码时领取的 MemoryBudget。
+    """
+    if timings is None:
+        timings = StageTimings()
+    names = list(regions)
+    image, boxes = load_aligned(image_path, [regions[name] for name in names], aligner,
+                                timings, budget)
+    crops = []
+    try:
+        if preprocess is None or not preprocess.steps:
+            with timings.measure('ocr'):
+                results = engine.recognize_regions(image, boxes)
+            results = _retry_regions(engine, policy, results,
+                                     lambda i: image.crop(boxes[i]), timings, owned=True)
+        else:
+            results = []
+            for box in boxes:
+                with timings.measure('preprocess'):
+                    region = image.crop(box)
+                    try:
+                        crops.append(preprocess(region))
+                    finally:
+                        if not crops or crops[-1] is not region:
+                            region.close()
+                with timings.measure('ocr'):
+                    results.append(engine.recognize(crops[-1]))
+            results = _retry_regions(engine, policy, results, crops.__getitem__, timings)
+    finally:
+        image.close()
+        _close_all(crops)
+    return _split_results(names, results)
+
+
+def _worker_engine(timings):
+    """取工作进程内的引擎、预处理配置、重新识别策略、区域对齐器和内存预算，第一次取用时报告引擎的启动耗时"""
+    global _startup_time
+    if _startup_time is not None:
+        timings['engine_startup'] = _startup_time
+        _startup_time = None
+    return _engine, _preprocess, _policy, _aligner, _budget
+
+
+def _digest_lookup(image_path, with_digest, probe, timings):
+    """在工作进程中计算文件哈希，有 CacheProbe 时按哈希查询缓存，返回 (哈希, 缓存的结果或 None)"""
+    if not with_digest and probe is None:
+        return None, None
+    with timings.measure('digest'):
+        digest = file_digest(image_path)
+    if probe is None:
+        return digest, None
+    with timings.measure('cache_lookup'):
+        return digest, probe.get(digest)
+
+
+def _ocr_task(image_path, regions, engine=None, preprocess=None, with_digest=False,
+              policy=None, aligner=None, budget=None, probe=None):
+    """执行单张图片任务，返回 (路径, 各区域文字, 错误信息, 文件哈希, 各区域置信度, 是否命中缓存, 各阶段耗时)
+
+    异常转换为错误信息；engine 为 None 时使用工作进程内的引擎和各项配置。
+    """
+    timings = StageTimings()
+    if engine is None:
+        engine, preprocess, policy, aligner, budget = _worker_engine(timings)
+    try:
+        # 在工作进程中计算哈希，不占用主进程
+        digest, cached = _digest_lookup(image_path, with_digest, probe, timings)
+        if cached is not None:
+            return image_path, cached[0], None, digest, cached[1], True, timings
+        fields, confidences = ocr_regions(image_path, regions, engine, preprocess,
+                                          timings, policy, aligner, budget)
+        return image_path, fields, None, digest, confidences, False, timings
+    except Exception as e:
+        return image_path, {}, str(e), None, {}, False, timings
+
+
+def _ocr_grouped(image_paths, regions, engine=None, preprocess=None, with_digest=False,
+                 policy=None, aligner=None, budget=None, probe=None):
+    """合并识别一组图片：所有图片的所有区域一次交给引擎，返回每张图片的结果
+
+    pytesseract 只启动一次 tesseract 进程；识别耗时平均分到每张图片。
+    置信度低的区域再按策略逐个重新识别，只有这些区域承担额外的开销。
+    单张图片读取失败不影响其他图片，识别调用失败时整组都记为失败。
+    每张图片裁剪出区域后立即释放，整组只同时保留各区域的小图；按哈希命中缓存的图片不识别。
+    """
+    names = list(regions)
+    entries = []
+    crops = []
+    for image_path in image_paths:
+        timings = StageTimings()
+        if engine is None:
+            engine, preprocess, policy, aligner, budget = _worker_engine(timings)
+        try:
+            digest, cached = _digest_lookup(image_path, with_digest, probe, timings)
+            if cached is not None:
+                entries.append([image_path, None, digest, timings, cached])
+                continue
+            image, boxes = load_aligned(image_path, [regions[name] for name in names],
+                                        aligner, timings, budget)
+            images = []
+            try:
+                with timings.measure('decode'):
+                    for box in boxes:
+                        images.append(image.crop(box))
+                image.close()
+                if preprocess is not None and preprocess.steps:
+                    with timings.measure('preprocess'):
+                        for i, region in enumerate(images):
+                            images[i] = preprocess(region)
+                            if images[i] is not region:
+                                region.close()
+            except Exception:
+                # 裁剪或预处理到一半失败时，已经得到的区域也要释放
+                image.close()
+                _close_all(images)
+                raise
+            crops.extend(images)
+            entries.append([image_path, None, digest, timings, None])
+        except Exception as e:
+            entries.append([image_path, str(e), None, timings, None])
+
+    try:
+        texts = []
+        if crops:
+            start = time.perf_counter()
+            try:
+                texts = engine.recognize_batch(crops)
+            except Exception as e:
+                for entry in entries:
+                    entry[1] = entry[1] or str(e)
+            share = (time.perf_counter() - start) * len(names) / len(crops)
+
+        results = []
+        position = 0
+        for image_path, error, digest, timings, cached in entries:
+            if error:
+                results.append((image_path, {}, error, None, {}, False, timings))
+                continue
+            if cached is not None:
+                results.append((image_path, cached[0], None, digest, cached[1], True, timings))
+                continue
+            timings['ocr'] = share
+            first = position
+            found = _retry_regions(engine, policy, texts[first:first + len(names)],
+                                   lambda i: crops[first + i], timings)
+            position += len(names)
+            fields, confidences = _split_results(names, found)
+            results.append((image_path, fields, None, digest, confidences, False, timings))
+        return results
+    finally:
+        _close_all(crops)
+
+
+def _ocr_batch(image_paths, regions, with_digest, grouped=False, probe=None):
+    """工作进程中处理一组图片，grouped 为真时合并成一次识别调用"""
+    if grouped:
+        return _ocr_grouped(image_paths, regions, with_digest=with_digest, probe=probe)
+    return [_ocr_task(image_path, regions, with_digest=with_digest, probe=probe)
+            for image_path in image_paths]
+
+
+class OcrPool:
+    """并行裁剪并识别图片文字的进程池，每个进程持有一个常驻的识别引擎
+
+    在途任务的数量有限，同时解码的整页图片总大小不超过 memory_budget 字节，
+    内存峰值不随批次大小和进程数增长；memory_budget 为 None 时不限制。
+    """
+
+    def __init__(self, workers=None, lang=DEFAULT_LANG, backend='auto', preprocess=None,
+                 chunksize=4, metrics=None, batch_size=None, policy=None, aligner=None,
+                 memory_budget=DEFAULT_MEMORY_BUDGET):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        # 每个进程一次领取的图片数，减少调度次数
+        self.chunksize = chunksize
+        # 合并识别时每次交给引擎的图片数，为 None 时逐张识别
+        self.batch_size = batch_size
+        if batch_size:
+            self.chunksize = batch_size
+        # RunMetrics，汇总各任务的阶段耗时
+        self.metrics = metrics
+        self.lang = lang
+        self.preprocess = preprocess
+        # RetryPolicy，置信度低的区域按策略重新识别
+        self.policy = policy
+        # RegionAligner，每张图片按实际版面对齐识别区域
+        self.aligner = aligner
+        # MemoryBudget，所有工作进程和查重线程共享
+        self.budget = MemoryBudget(memory_budget) if memory_budget else None
+        # 提前检查引擎是否可用，避免工作进程初始化失败
+        self.backend = resolve_backend(backend)
+        self._executor = None
+        self._engine = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def capacity(self):
+        """最多同时在途的图片数"""
+        return self.workers * 2 * self.chunksize
+
+    def _get_executor(self):
+        """按需创建进程池"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.lang, self.backend, self.preprocess, self.policy, self.aligner,
+                          self.budget)
+            )
+        return self._executor
+
+    def _get_engine(self):
+        """按需创建当前进程内使用的识别引擎"""
+        if self._engine is None:
+            start = time.perf_counter()
+            self._engine = create_engine(self.lang, self.backend)
+            if self.metrics is not None:
+                self.metrics.observe('engine_startup', time.perf_counter() - start)
+        return self._engine
+
+    def warm_up(self):
+        """提前启动工作进程并加载识别引擎，第一批图片不必等待"""
+        if self.workers == 1:
+            self._get_engine()
+            return
+        executor = self._get_executor()
+        # 同时提交多个短任务，进程池才会启动所有进程
+        for future in [executor.submit(time.sleep, 0.05) for _ in range(self.workers)]:
+            future.result()
+
+    def recognize(self, image_paths, crop_box, with_digest=False, probe=None):
+        """识别所有图片，按输入顺序逐个返回 (路径, 各区域文字, 错误信息, 文件哈希, 各区域置信度, 是否命中缓存)
+
+        image_paths 可以是边扫描边产生路径的生成器，只会提前读取在途任务所需的路径。
+        crop_box 可以是单个裁剪框或 {区域名: 裁剪框}，每张图片的所有区域
+        在同一个任务中识别；with_digest 为假时文件哈希为 None。
+        probe 为 CacheProbe 时，工作进程计算哈希后先查询缓存，命中的图片不识别。
+        """
+        regions = as_regions(crop_box)
+        image_paths = iter(image_paths)
+
+        # 单进程时直接在当前进程处理，省去进程间通信开销
+        if self.workers == 1 and self.batch_size:
+            while True:
+                chunk = list(islice(image_paths, self.batch_size))
+                if not chunk:
+                    return
+                for result in _ocr_grouped(chunk, regions, self._get_engine(),
+                                           self.preprocess, with_digest, self.policy,
+                                           self.aligner, self.budget, probe):
+                    yield self._collect(result)
+        if self.workers == 1:
+            for image_path in image_paths:
+                yield self._collect(_ocr_task(image_path, regions, self._get_engine(),
+                                              self.preprocess, with_digest, self.policy,
+                                              self.aligner, self.budget, probe))
+            return
+
+        # 只保持有限数量的任务在途，调用方暂停读取时进程池也随之停下；
+        # 没有需要识别的图片时不启动进程池
+        pending = deque()
+        while True:
+            while len(pending) < self.workers * 2:
+                chunk = list(islice(image_paths, self.chunksize))
+                if not chunk:
+                    break
+                pending.append(self._get_executor().submit(
+                    _ocr_batch, chunk, regions, with_digest, bool(self.batch_size), probe))
+            if not pending:
+                return
+            for result in pending.popleft().result():
+                yield self._collect(result)
+
+    def _collect(self, result):
+        """把任务的阶段耗时汇总到统计中，返回去掉耗时后的结果"""
+        if self.metrics is not None:
+            self.metrics.add_timings(result[-1])
+        return result[:-1]
+
+    def close(self):
+        """关闭进程池和识别引擎"""
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+        if self._engine is not None:
+            self._engine.close()
+            self._engine = None
+
+
+def format_name(template, fields):
+    """按文件名模板组合各区域的文字"""
+    try:
+        return template.format_map({name: text.strip() for name, text in fields.items()})
+    except KeyError as e:
+        raise ValueError(f"文件名模板中的区域 {e.args[0]} 不存在")
+    except (IndexError, ValueError):
+        raise ValueError(f"无效的文件名模板: {template}")
+
+
+def missing_text(fields):
+    """有区域没有识别出文字时返回错误信息，否则返回 None"""
+    empty = [name for name, value in fields.items() if not value.strip()]
+    if len(empty) == len(fields):
+        return "OCR未能识别出文字"
+    if empty:
+        return f"区域 {', '.join(empty)} 未能识别出文字"
+    return None
+
+
+def make_file_name(text, ext):
+    """根据识别文本构建文件名（移除非法字符）"""
+    return ''.join(c for c in text if c.isalnum() or c in '._- ') + ext
+
+
+def unique_path(path):
+    """文件名已存在时在末尾追加编号"""
+    base, ext = os.path.splitext(path)
+    counter = 1
+    while os.path.exists(path):
+        path = f"{base}_{counter}{ext}"
+        counter += 1
+    return path
+
+
+def desired_path(image_path, text):
+    """按识别文本得到的目标路径，不检查是否重名"""
+    _, ext = os.path.splitext(image_path)
+    return os.path.join(os.path.dirname(image_path), make_file_name(text, ext))
+
+
+def assign_path(image_path, text, names=None):
+    """按识别文本分配不重复的新路径
+
+    有文件名索引时用索引分配并预留文件名，否则逐个检查文件是否存在。
+    """
+    new_path = desired_path(image_path, text)
+    if names is None:
+        return unique_path(new_path)
+    return names.claim(new_path, image_path)
+
+
+def move_image(image_path, new_path, journal=None, names=None):
+    """把图片重命名为 new_path，有日志时记录到日志中，返回新路径
+
+    移到其他目录时，目标目录不存在会先创建。
+    """
+    if new_path == image_path:
+        return new_path
+
+    if journal is not None:
+        journal.plan(image_path, new_path)
+    try:
+        directory = os.path.dirname(new_path)
+        if directory != os.path.dirname(image_path):
+            os.makedirs(directory, exist_ok=True)
+        os.rename(image_path, new_path)
+    except OSError:
+        if names is not None:
+            names.release(new_path)
+        raise
+    if names is not None:
+        names.release(image_path)
+        names.add_output(new_path)
+    if journal is not None:
+        journal.done(image_path, new_path)
+    return new_path
+
+
+def rename_image(image_path, text, journal=None, names=None):
+    """按识别文本重命名图片，返回新路径
+
+    有日志时记录到日志中；有文件名索引时用索引分配不重复的文件名，
+    否则逐个检查文件是否存在。
+    """
+    return move_image(image_path, assign_path(image_path, text, names), journal, names)
+
+
+def scan_images(directory, recursive=False, check_header=False):
+    """用 os.scandir 逐个列出目录中的图片，边扫描边返回，不先收集完整的路径列表
+
+    返回顺序为文件系统的目录顺序；check_header 为真时还会检查文件头。
+    """
+    directories = [directory]
+    while directories:
+        try:
+            entries = os.scandir(directories.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            directories.append(entry.path)
+                        continue
+                    if not entry.name.lower().endswith(IMAGE_EXTENSIONS) or not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+                if check_header and not has_image_header(entry.path):
+                    continue
+                yield entry.path
+
+
+def iter_image_paths(sources, recursive=False, check_header=False):
+    """展开目录和通配符，逐个返回图片路径
+
+    目录边扫描边返回；通配符的匹配结果按文件名排序。
+    """
+    for source in sources:
+        if os.path.isdir(source):
+            yield from scan_images(source, recursive, check_header)
+            continue
+
+        for path in sorted(glob.glob(source, recursive=True)):
+            if path.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(path):
+                if not check_header or has_image_header(path):
+                    yield path
+
+
+def rename_batch(image_paths, crop_box, workers=None, lang=DEFAULT_LANG,
+                 backend='auto', journal=None, cache=None,
+                 template=DEFAULT_TEMPLATE, preprocess=None, metrics=None,
+                 batch_size=None, dry_run=False, policy=None, aligner=None,
+                 duplicates=None, pool=None, memory_budget=DEFAULT_MEMORY_BUDGET, names=None):
+    """并行识别一批图片并按原顺序重命名，逐张返回处理结果
+
+    image_paths 可以是目录扫描生成器，扫描的同时就开始识别，不需要先收集完整列表。
+    crop_box 可以是单个裁剪框，也可以是 {区域名: 裁剪框}，
+    新文件名由 template 组合各区域的文字，例如 "{date}_{vendor}_{no}"。
+    调用方停止读取时，进程池在完成在途任务后也会停下；
+    提前关闭生成器会关闭进程池。
+    有日志时，日志中已经处理过的图片直接跳过，不再识别；
+    有缓存时，命中缓存的图片直接使用缓存的文字。
+    preprocess 为 Preprocessor 实例时，各区域预处理后再交给 tesseract。
+    metrics 为 RunMetrics 时记录各阶段耗时、缓存命中和处理结果的计数。
+    batch_size 大于1时每次把这么多张图片的区域合并成一次识别调用。
+    dry_run 为真时只分配新文件名、不重命名，结果中的 new_path 为计划的新路径，
+    collision 表示因重名追加了编号。
+    policy 为 RetryPolicy 时，置信度低的区域按策略重新识别；
+    结果中的 confidence 为各区域中最低的置信度，缓存中没有记录时为 None。
+    aligner 为 RegionAligner 时，以 crop_box 为参考在每张图片中找到文字实际所在的区域。
+    duplicates 为 DuplicateFinder 时，批次内重复的图片不再识别，
+    结果中的 duplicate_of 为代表图片（已重命名时为新路径），text 和 fields 沿用代表图片的；
+    按 duplicates.action 保留原名（new_path 为 None）或移到子目录，不会得到加编号的文件名。
+    pool 为调用方创建的 OcrPool 时使用它识别、结束后不关闭，多次调用之间识别引擎保持常驻；
+    它的识别参数需要与本次调用一致。
+    memory_budget 为同时解码的整页图片总大小上限（字节），见 OcrPool。
+    names 为调用方创建的 NameIndex 时沿用它分配文件名，多次调用之间不重新扫描目录；
+    调用方需要让它与目录的实际内容保持一致。
+    """
+    regions = as_regions(crop_box)
+    # 引擎和预处理配置不同，识别结果也不同，一起作为缓存键
+    config = backend
+    if preprocess is not None and preprocess.steps:
+        config = f"{backend}|{preprocess.signature}"
+    if batch_size and batch_size > 1:
+        # 合并识别按页拆分结果，与逐张识别的文字排版可能略有不同
+        config += '|batch'
+    else:
+        batch_size = None
+    if policy is not None:
+        config += f"|{policy.signature}"
+    if aligner is not None:
+        config += f"|align:{aligner.signature}"
+    # 先检查模板，避免识别完才发现模板有误
+    format_name(template, {name: '' for name in regions})
+
+    # 已经登记、等待按顺序输出的图片，最多为进程池的在途容量加 MAX_PENDING 张：
+    # (类型, 序号, 路径, 跳过时的新路径、缓存的文字或重复时的代表图片)
+    order = deque()
+    # 已经登记、还没有交给进程池的待识别图片
+    to_ocr = deque()
+    # 查重时记录代表图片的处理结果 {原路径: (新路径, 文字, 各区域文字, 置信度)}，
+    # 与查重索引一样只保留最近的，按加入顺序淘汰
+    seen = duplicates.index() if duplicates is not None else None
+    outcomes = OrderedDict()
+    # 每个目录只扫描一次，同一批次内的重名在重命名前就能分配好编号；
+    # 索引同时记下本批次重命名产生的文件名
+    if names is None:
+        names = NameIndex(journal)
+
+    def finished(image_path):
+        """不需要再处理的图片：本批次产生的新文件、已经移走的重复图片"""
+        return names.is_output(image_path) or (duplicates is not None
+                                               and duplicates.is_moved(image_path))
+
+    if pool is None:
+        pool = OcrPool(workers=workers, lang=lang, backend=backend, preprocess=preprocess,
+                       metrics=metrics, batch_size=batch_size, policy=policy, aligner=aligner,
+                       memory_budget=memory_budget)
+        pool_context = pool
+    else:
+        pool_context = nullcontext(pool)
+
+    if duplicates is None:
+        inputs = ((image_path, None) for image_path in image_paths)
+    else:
+        # 查重特征在线程池中提前计算，跳过的图片不计算；解码与识别进程共用内存预算
+        inputs = duplicates.signatures(
+            image_paths, list(regions.values()),
+            skip=lambda path: finished(path) or (journal is not None
+                                                 and journal.is_done(path)),
+            budget=pool.budget)
+    # 工作进程计算哈希后查询缓存，复制来的或只被 touch 过的图片也能命中
+    probe = cache.probe(regions, lang, config) if cache is not None else None
+    # 下一张登记的图片的序号
+    next_index = 0
+    # 当前一轮识别的结果生成器
+    results = None
+
+    def register():
+        """登记下一张需要处理的输入图片，只把需要识别的图片放入 to_ocr；没有更多图片时返回 False"""
+        nonlocal next_index
+        for image_path, signature in inputs:
+            if finished(image_path):
+                continue
+            representative = None
+            if signature is not None:
+                representative = seen.find(signature)
+                if representative is None:
+                    seen.add(image_path, signature)
+            index = next_index
+            next_index += 1
+            if journal is not None and journal.is_done(image_path):
+                order.append(('skip', index, image_path, journal.renamed_path(image_path)))
+            elif representative is not None:
+                order.append(('duplicate', index, image_path, representative))
+            else:
+                cached = None
+                if cache is not None:
+                    start = time.perf_counter()
+                    # 只用记录的哈希查询，其余的由工作进程计算哈希后查询
+                    cached = cache.lookup(image_path, regions, lang, config)
+                    if metrics is not None:
+                        metrics.observe('cache_lookup', time.perf_counter() - start)
+                        if cached is not None:
+                            metrics.incr('cache_hits')
+                if cached is not None:
+                    order.append(('cached', index, image_path, cached))
+                else:
+                    order.append(('ocr', index, image_path, None))
+                    to_ocr.append(image_path)
+            return True
+        return False
+
+    def feed():
+        """交给进程池的待识别路径，进程池只会提前读取在途任务所需的路径
+
+        沿途跳过或命中缓存的图片一起登记；等待输出的图片太多时暂停读取输入，
+        进程池做完在途任务后这一轮识别结束，由下一轮继续。
+        """
+        while True:
+            if to_ocr:
+                yield to_ocr.popleft()
+            elif len(order) >= pool.capacity + MAX_PENDING or not register():
+                return
+
+    def next_result():
+        """取下一个识别结果，与 order 中类型为 ocr 的图片按顺序一一对应"""
+        nonlocal results
+        while True:
+            if results is None:
+                results = pool.recognize(feed(), regions, with_digest=cache is not None,
+                                         probe=probe)
+            try:
+                return next(results)
+            except StopIteration:
+                results = None
+
+    def duplicate_result(index, image_path, representative):
+        """重复图片不识别，按配置保留原名或移到子目录"""
+        rep_path, text, fields, confidence = outcomes.get(
+            representative, (representative, '', {}, None))
+        new_path = None
+        error = None
+        if duplicates.action == 'move':
+            try:
+                new_path = names.claim(duplicates.target(image_path))
+                if not dry_run:
+                    move_image(image_path, new_path, journal, names)
+            except OSError as e:
+                new_path = None
+                error = str(e)
+        if metrics is not None:
+            metrics.incr('failed' if error else 'duplicates')
+        return {
+            'index': index,
+            'path': image_path,
+            'new_path': new_path,
+            'text': text,
+            'fields': fields,
+            'error': error,
+            'skipped': False,
+            'collision': False,
+            'confidence': confidence,
+            'duplicate_of': rep_path
+        }
+
+    if journal is not None and not dry_run and journal.batch is None:
+        # 同一个日志多次调用时（如监视目录的每一小批）只开始一批
+        journal.begin()
+
+    if metrics is not None and metrics.started is None:
+        # 同一个统计多次调用时从第一次开始计时
+        metrics.start()
+
+    try:
+        with pool_context:
+            while True:
+                if not order:
+                    # 没有等待输出的图片时直接登记下一张，不经过进程池
+                    if not register():
+                        break
+                    continue
+
+                kind, index, image_path, payload = order.popleft()
+                if metrics is not None:
+                    metrics.incr('images')
+                if kind == 'skip':
+                    if metrics is not None:
+                        metrics.incr('skipped')
+                    yield {
+                        'index': index,
+                        'path': image_path,
+                        'new_path': payload,
+                        'text': '',
+                        'fields': {},
+                        'error': None,
+                        'skipped': True,
+                        'collision': False,
+                        'confidence': None
+                    }
+                    continue
+
+                if kind == 'duplicate':
+                    yield duplicate_result(index, image_path, payload)
+                    continue
+
+                if kind == 'cached':
+                    (fields, confidences), error = payload, None
+                else:
+                    _, fields, error, digest, confidences, hit = next_result()
+                    if cache is not None and not error:
+                        cache.store(image_path, digest, regions, lang, fields, config,
+                                    confidences, hit)
+                    if cache is not None and metrics is not None:
+                        metrics.incr('cache_hits' if hit else 'cache_misses')
+                # 文件名取决于所有区域，以最不确定的区域为准
+                confidence = min(confidences.values()) if confidences else None
+
+                text = ''
+                new_path = None
+                collision = False
+                if not error:
+                    error = missing_text(fields)
+                if not error:
+                    try:
+                        text = format_name(template, fields)
+                        start = time.perf_counter()
+                        new_path = assign_path(image_path, text, names)
+                        collision = new_path not in (image_path, desired_path(image_path, text))
+                        if not dry_run:
+                            move_image(image_path, new_path, journal, names)
+                            if metrics is not None:
+                                metrics.observe('rename', time.perf_counter() - start)
+                            if new_path != image_path and cache is not None:
+                                cache.move(image_path, new_path)
+                    except (OSError, ValueError) as e:
+                        new_path = None
+                        error = str(e)
+
+                if metrics is not None:
+                    metrics.incr('failed' if error else 'planned' if dry_run else 'renamed')
+                    if (policy is not None and confidence is not None
+                            and confidence < policy.min_confidence):
+                        metrics.incr('low_confidence')
+                if duplicates is not None:
+                    outcomes[image_path] = (new_path or image_path, text, fields, confidence)
+                    if len(outcomes) > seen.max_digests:
+                        outcomes.popitem(last=False)
+                yield {
+                    'index': index,
+                    'path': image_path,
+                    'new_path': new_path,
+                    'text': text,
+                    'fields': fields,
+                    'error': error,
+                    'skipped': False,
+                    'collision': collision,
+                    'confidence': confidence
+                }
+    finally:
+        if journal is not None:
+            journal.flush()
+        if cache is not None:
+            cache.commit()
+        if metrics is not None:
+            metrics.finish()
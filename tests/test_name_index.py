@@ -0,0 +1,54 @@
+import os
+
+from name_index import NameIndex
+from rename_journal import RenameJournal
+
+
+def _touch(path):
+    with open(path, 'w') as f:
+        f.write('x')
+    return str(path)
+
+
+def test_claim_numbers_collisions_within_batch(tmp_path):
+    _touch(tmp_path / 'invoice.png')
+    _touch(tmp_path / 'invoice_1.png')
+    names = NameIndex()
+    target = str(tmp_path / 'invoice.png')
+    assert names.claim(target) == str(tmp_path / 'invoice_2.png')
+    assert names.claim(target) == str(tmp_path / 'invoice_3.png')
+    assert names.claim(str(tmp_path / 'other.png')) == str(tmp_path / 'other.png')
+    assert names.claim(str(tmp_path / 'other.png')) == str(tmp_path / 'other_1.png')
+
+
+def test_claim_keeps_current_name(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _touch('invoice.png')
+    names = NameIndex()
+    # 相对路径和绝对路径指向同一个文件
+    assert names.claim(str(tmp_path / 'invoice.png'), './invoice.png') == './invoice.png'
+    # 不是本程序重命名产生的 base_N 文件仍然重命名
+    _touch('invoice_2024.png')
+    assert names.claim('invoice.png', 'invoice_2024.png') == 'invoice_1.png'
+
+
+def test_claim_keeps_numbered_output_from_journal(tmp_path):
+    _touch(tmp_path / 'invoice.png')
+    output = _touch(tmp_path / 'invoice_1.png')
+    with RenameJournal(str(tmp_path / 'journal.jsonl')) as journal:
+        journal.begin()
+        journal.done(str(tmp_path / 'scan.png'), output)
+        names = NameIndex(journal)
+        assert names.claim(str(tmp_path / 'invoice.png'), output) == output
+
+
+def test_release_and_add(tmp_path):
+    names = NameIndex()
+    target = str(tmp_path / 'a.png')
+    assert names.claim(target) == target
+    names.release(target)
+    assert names.claim(target) == target
+    # 目录扫描之后才写入的文件
+    names.add(str(tmp_path / 'b.png'))
+    assert names.claim(str(tmp_path / 'b.png')) == str(tmp_path / 'b_1.png')
+    assert not os.path.exists(tmp_path / 'b.png')
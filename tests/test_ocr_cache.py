@@ -0,0 +1,109 @@
+import os
+import shutil
+
+import pytest
+from PIL import Image
+
+import ocr_cache
+import renamer_core
+from metrics import RunMetrics
+from ocr_cache import OcrCache, file_digest
+from ocr_engine import resolve_backend
+from renamer_core import rename_batch, scan_images
+
+REGIONS = {'text': (0, 0, 200, 60)}
+
+
+def _write(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+    return str(path)
+
+
+def test_known_digest_uses_metadata_only(tmp_path):
+    path = _write(tmp_path / 'a.png', b'first')
+    with OcrCache(str(tmp_path / 'cache.sqlite3')) as cache:
+        # 没有记录时不读取文件
+        assert cache.known_digest(path) is None
+        digest = file_digest(path)
+        cache.store(path, digest, REGIONS, 'eng', {'text': 'A'})
+        assert cache.known_digest(path) == digest
+        assert cache.lookup(path, REGIONS, 'eng') == ({'text': 'A'}, {})
+        assert cache.lookup(path, REGIONS, 'chi_sim') is None
+
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+        assert cache.known_digest(path) is None
+
+
+def test_probe_reads_committed_results(tmp_path):
+    path = _write(tmp_path / 'a.png', b'content')
+    digest = file_digest(path)
+    with OcrCache(str(tmp_path / 'cache.sqlite3')) as cache:
+        cache.store(path, digest, REGIONS, 'eng', {'text': 'A'}, confidences={'text': 90})
+        probe = cache.probe(REGIONS, 'eng')
+        cache.commit()
+        assert probe.get(digest) == ({'text': 'A'}, {'text': 90})
+        assert probe.get(file_digest(_write(tmp_path / 'b.png', b'other'))) is None
+        assert cache.probe(REGIONS, 'chi_sim').get(digest) is None
+
+
+def test_evict_and_prune(tmp_path):
+    with OcrCache(str(tmp_path / 'cache.sqlite3'), max_entries=4) as cache:
+        for i in range(10):
+            path = _write(tmp_path / f'{i}.png', str(i).encode())
+            cache.store(path, file_digest(path), REGIONS, 'eng', {'text': str(i)})
+        cache.commit()
+        db = cache._db
+        assert db.execute('SELECT COUNT(*) FROM results').fetchone()[0] <= 4
+        # 结果被淘汰的文件记录一起删除
+        orphans = db.execute(
+            "SELECT COUNT(*) FROM files WHERE NOT EXISTS (SELECT 1 FROM results "
+            "WHERE key LIKE files.digest || '|%')").fetchone()[0]
+        assert orphans == 0
+        # 最近写入的结果保留
+        assert cache.lookup(str(tmp_path / '9.png'), REGIONS, 'eng') == ({'text': '9'}, {})
+
+
+def test_each_file_hashed_once(tmp_path, monkeypatch):
+    try:
+        resolve_backend()
+    except RuntimeError as e:
+        pytest.skip(str(e))
+
+    hashed = []
+
+    def counting_digest(path, *args, **kwargs):
+        hashed.append(os.path.basename(path))
+        return file_digest(path, *args, **kwargs)
+
+    monkeypatch.setattr(renamer_core, 'file_digest', counting_digest)
+    monkeypatch.setattr(ocr_cache, 'file_digest', counting_digest)
+
+    source = tmp_path / 'd1'
+    source.mkdir()
+    for i in range(3):
+        Image.new('L', (400, 120), 255 - i).save(str(source / f'scan_{i}.png'))
+    shutil.copytree(str(source), str(tmp_path / 'copy'))
+
+    with OcrCache(str(tmp_path / 'cache.sqlite3')) as cache:
+        first = list(rename_batch(scan_images(str(source)), REGIONS, workers=1,
+                                  cache=cache, dry_run=True))
+        assert sorted(hashed) == ['scan_0.png', 'scan_1.png', 'scan_2.png']
+        cache.commit()
+
+        # 复制的图片没有文件记录，工作进程计算哈希后命中，不再识别
+        hashed.clear()
+        metrics = RunMetrics()
+        copied = list(rename_batch(scan_images(str(tmp_path / 'copy')), REGIONS, workers=1,
+                                   cache=cache, dry_run=True, metrics=metrics))
+        assert sorted(hashed) == ['scan_0.png', 'scan_1.png', 'scan_2.png']
+        assert metrics.counters['cache_hits'] == 3
+        assert 'ocr' not in metrics.stages
+        assert [r['text'] for r in copied] == [r['text'] for r in first]
+
+        # 有文件记录时主进程直接使用记录的哈希
+        hashed.clear()
+        list(rename_batch(scan_images(str(tmp_path / 'copy')), REGIONS, workers=1,
+                          cache=cache, dry_run=True))
+        assert hashed == []
@@ -0,0 +1,98 @@
+import json
+import os
+
+import pytest
+from PIL import Image
+
+from ocr_engine import resolve_backend
+from rename_journal import RenameJournal
+from renamer_core import rename_batch, scan_images
+
+
+def _touch(path):
+    with open(path, 'w') as f:
+        f.write('x')
+    return str(path)
+
+
+def test_relative_and_absolute_paths_match(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('d1')
+    _touch('d1/b.png')
+    with RenameJournal('journal.jsonl') as journal:
+        journal.begin()
+        journal.plan('d1/a.png', 'd1/b.png')
+        journal.done('d1/a.png', 'd1/b.png')
+
+    with RenameJournal(str(tmp_path / 'journal.jsonl')) as journal:
+        assert journal.is_done(str(tmp_path / 'd1' / 'a.png'))
+        assert journal.is_done('./d1/../d1/a.png')
+        assert journal.is_output(str(tmp_path / 'd1' / 'b.png'))
+        assert journal.renamed_path('d1/a.png') == str(tmp_path / 'd1' / 'b.png')
+
+
+def test_recover_records_finished_rename(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    src = _touch(tmp_path / 'a.png')
+    dst = str(tmp_path / 'b.png')
+    with RenameJournal(path) as journal:
+        journal.begin()
+        journal.plan(src, dst)
+    # 重命名完成后、写入完成记录前崩溃
+    os.rename(src, dst)
+
+    with RenameJournal(path) as journal:
+        assert journal.renamed_path(src) == dst
+    with open(path, encoding='utf-8') as f:
+        ops = [json.loads(line)['op'] for line in f]
+    assert ops == ['begin', 'plan', 'done']
+
+
+def test_rollback_from_another_directory(tmp_path, monkeypatch):
+    os.mkdir(tmp_path / 'd1')
+    os.mkdir(tmp_path / 'elsewhere')
+    monkeypatch.chdir(tmp_path)
+    with RenameJournal('journal.jsonl') as journal:
+        journal.begin()
+        for name in ('a', 'b'):
+            _touch(f'd1/{name}_new.png')
+            journal.done(f'd1/{name}.png', f'd1/{name}_new.png')
+        first = journal.batch
+        journal.begin()
+        _touch('d1/c_new.png')
+        journal.done('d1/c.png', 'd1/c_new.png')
+
+    monkeypatch.chdir(tmp_path / 'elsewhere')
+    with RenameJournal(str(tmp_path / 'journal.jsonl')) as journal:
+        # 默认撤销最近一批
+        assert [error for _, _, error in journal.rollback()] == [None]
+        assert journal.last_batch == first
+        assert [error for _, _, error in journal.rollback()] == [None, None]
+        assert journal.last_batch is None
+    assert sorted(os.listdir(tmp_path / 'd1')) == ['a.png', 'b.png', 'c.png']
+
+
+def test_rerun_with_absolute_path_skips_finished(tmp_path, monkeypatch):
+    try:
+        resolve_backend()
+    except RuntimeError as e:
+        pytest.skip(str(e))
+
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('d1')
+    image = Image.new('L', (400, 120), 255)
+    for i in range(3):
+        image.save(f'd1/scan_{i}.png')
+
+    with RenameJournal('journal.jsonl') as journal:
+        first = list(rename_batch(scan_images('d1'), (0, 0, 200, 60), workers=1,
+                                  journal=journal))
+    assert all(result['error'] is None and not result['skipped'] for result in first)
+    names = sorted(os.listdir('d1'))
+
+    with RenameJournal(str(tmp_path / 'journal.jsonl')) as journal:
+        second = list(rename_batch(scan_images(str(tmp_path / 'd1')), (0, 0, 200, 60),
+                                   workers=1, journal=journal))
+    assert len(second) == 3
+    assert all(result['skipped'] for result in second)
+    assert sorted(os.listdir('d1')) == names
@@ -0,0 +1,40 @@
+import os
+
+from PIL import Image
+
+from image_io import load_regions
+from renamer_core import iter_image_paths, scan_images
+
+
+def _save(path, image, **options):
+    image.save(path, **options)
+    return str(path)
+
+
+def test_scan_images_finds_tiff(tmp_path):
+    image = Image.new('L', (64, 48), 255)
+    expected = {
+        _save(tmp_path / 'a.png', image),
+        _save(tmp_path / 'b.tif', image),
+        _save(tmp_path / 'c.TIFF', image, compression='tiff_lzw'),
+    }
+    (tmp_path / 'notes.txt').write_text('不是图片')
+
+    assert set(scan_images(str(tmp_path), check_header=True)) == expected
+    assert set(iter_image_paths([str(tmp_path / '*.tif')])) == {str(tmp_path / 'b.tif')}
+
+
+def test_scanned_tiff_regions_decode(tmp_path):
+    image = Image.new('L', (400, 300), 255)
+    image.paste(0, (100, 200, 180, 240))
+    # 未压缩的只读取区域所在的行，LZW 压缩的完整解码
+    _save(tmp_path / 'lzw.tif', image, compression='tiff_lzw')
+    _save(tmp_path / 'raw.tif', image, compression='raw')
+
+    paths = sorted(scan_images(str(tmp_path)))
+    assert [os.path.basename(path) for path in paths] == ['lzw.tif', 'raw.tif']
+    for path in paths:
+        region, (box,) = load_regions(path, [(100, 200, 180, 240)])
+        crop = region.crop(box)
+        assert crop.size == (80, 40)
+        assert crop.getextrema() == (0, 0)
@@ -0,0 +1,100 @@
+import json
+import os
+
+import pytest
+from PIL import Image
+
+import name_index
+from ocr_engine import resolve_backend
+from rename_journal import RenameJournal
+from watch_folder import watch
+
+
+def _records(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_watch_journal_spans_batches(tmp_path):
+    try:
+        resolve_backend()
+    except RuntimeError as e:
+        pytest.skip(str(e))
+
+    drop = tmp_path / 'drop'
+    drop.mkdir()
+    journal_path = str(tmp_path / 'journal.jsonl')
+    journal = RenameJournal(journal_path)
+    # 生成器第一次取结果时才开始监视，第一批作为已有的图片处理
+    results = watch([str(drop)], (0, 0, 200, 60), existing=True, settle=0.1, debounce=0.1,
+                    max_delay=0.5, poll_interval=0.1, workers=1, journal=journal,
+                    journal_limit=4)
+    image = Image.new('L', (400, 120), 255)
+    renamed = []
+    try:
+        # 三小批，每批三张，第二批之后日志超过上限归档
+        for batch in range(3):
+            for i in range(3):
+                image.save(str(drop / f'scan_{batch}_{i}.png'))
+            for _ in range(3):
+                result = next(results)
+                assert result['error'] is None
+                renamed.append(result)
+        # 第二批的结果取完、生成器继续运行时归档，内存中只剩第三批
+        assert len(journal) == 3
+    finally:
+        results.close()
+        journal.close()
+
+    archives = [name for name in os.listdir(tmp_path) if name.startswith('journal.jsonl.')]
+    assert len(archives) == 1
+    begins = [record for path in (journal_path, str(tmp_path / archives[0]))
+              for record in _records(path) if record['op'] == 'begin']
+    # 每个文件一条开始记录，归档后继续同一批
+    assert len(begins) == 2
+    assert len({record['batch'] for record in begins}) == 1
+
+    archived = [record for record in _records(str(tmp_path / archives[0]))
+                if record['op'] == 'done']
+    current = [record for record in _records(journal_path) if record['op'] == 'done']
+    assert len(archived) == 6
+    assert len(current) == 3
+    assert {record['src'] for record in archived + current} == {r['path'] for r in renamed}
+
+    with RenameJournal(journal_path) as reopened:
+        assert len(reopened) == 3
+
+
+def test_watch_reuses_name_index(tmp_path, monkeypatch):
+    try:
+        resolve_backend()
+    except RuntimeError as e:
+        pytest.skip(str(e))
+
+    scanned = []
+    original = name_index._DirectoryNames.__init__
+
+    def counting_init(self, directory):
+        scanned.append(directory)
+        original(self, directory)
+
+    monkeypatch.setattr(name_index._DirectoryNames, '__init__', counting_init)
+
+    drop = tmp_path / 'drop'
+    drop.mkdir()
+    results = watch([str(drop)], (0, 0, 200, 60), existing=True, settle=0.1, debounce=0.1,
+                    max_delay=0.5, poll_interval=0.1, workers=1)
+    image = Image.new('L', (400, 120), 255)
+    try:
+        for batch in range(3):
+            for i in range(2):
+                image.save(str(drop / f'scan_{batch}_{i}.png'))
+            for _ in range(2):
+                assert next(results)['error'] is None
+    finally:
+        results.close()
+
+    # 目录只列出一次；识别文字相同，各小批之间的编号也不重复
+    assert len(scanned) == 1
+    assert len(os.listdir(drop)) == 6
+    assert not any(name.startswith('scan_') for name in os.listdir(drop))
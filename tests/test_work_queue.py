@@ -0,0 +1,91 @@
+import os
+import time
+
+import work_queue
+from rename_journal import RenameJournal
+from work_queue import WorkQueue, collect, work
+
+
+def _touch(path):
+    with open(path, 'w') as f:
+        f.write('x')
+    return str(path)
+
+
+def _states(queue):
+    return {os.path.basename(item['path']): item['state'] for item in queue.items()}
+
+
+def test_claim_and_lease_expiry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with WorkQueue(str(tmp_path / 'queue.db'), lease_seconds=0.05, max_attempts=2) as queue:
+        assert queue.enqueue(['a.png', 'b.png', 'c.png']) == 3
+        assert queue.enqueue([str(tmp_path / 'a.png')]) == 0
+
+        first = queue.claim('w1', 2)
+        assert [path for _, path in first] == [str(tmp_path / 'a.png'), str(tmp_path / 'b.png')]
+        second = queue.claim('w2', 5)
+        assert [path for _, path in second] == [str(tmp_path / 'c.png')]
+        assert queue.claim('w2', 5) == []
+
+        assert queue.complete(first[0][0], 'w1', {'text': 'A'})
+        time.sleep(0.1)
+        # w1 的租约到期，b 由 w2 接手，w1 再写回时忽略
+        assert [item_id for item_id, _ in queue.claim('w2', 5)] == [first[1][0], second[0][0]]
+        assert not queue.complete(first[1][0], 'w1', {'text': 'B'})
+
+        time.sleep(0.1)
+        queue.claim('w3', 5)
+        assert _states(queue) == {'a.png': 'done', 'b.png': 'failed', 'c.png': 'failed'}
+
+
+def test_work_matches_results_by_path(tmp_path, monkeypatch):
+    paths = [_touch(tmp_path / f'{name}.png') for name in ('a', 'b', 'c')]
+
+    def fake_rename_batch(image_paths, crop_box, **options):
+        # 像查重或已处理的图片一样跳过 b，不返回它的结果
+        for image_path in image_paths:
+            if image_path.endswith('b.png'):
+                continue
+            name = os.path.basename(image_path)
+            yield {'path': image_path, 'fields': {'text': name}, 'confidence': 90.0,
+                   'error': None}
+
+    monkeypatch.setattr(work_queue, 'rename_batch', fake_rename_batch)
+    with WorkQueue(str(tmp_path / 'queue.db')) as queue:
+        queue.enqueue(paths)
+        results = work(queue, (0, 0, 10, 10), worker='w1', poll_interval=0)
+        assert [next(results)['id'] for _ in range(2)] == [1, 3]
+        results.close()
+
+        items = {os.path.basename(item['path']): item for item in queue.items()}
+        assert items['a.png']['fields'] == {'text': 'a.png'}
+        assert items['c.png']['fields'] == {'text': 'c.png'}
+        # 没有结果的图片不会写入其他图片的文字，停止时放回队列
+        assert items['b.png']['state'] == 'pending'
+        assert items['b.png']['fields'] == {}
+
+
+def test_collect_renames_in_queue_order(tmp_path):
+    paths = [_touch(tmp_path / f'scan_{i}.png') for i in range(3)]
+    _touch(tmp_path / 'invoice.png')
+    with WorkQueue(str(tmp_path / 'queue.db')) as queue:
+        queue.enqueue(paths)
+        for item_id, _ in queue.claim('w1', 2):
+            queue.complete(item_id, 'w1', {'text': 'invoice'})
+
+        with RenameJournal(str(tmp_path / 'journal.jsonl')) as journal:
+            # 第三张还没有识别，不等待时处理到它之前为止
+            results = list(collect(queue, '{text}', journal=journal, wait=False))
+            assert [os.path.basename(r['new_path']) for r in results] == [
+                'invoice_1.png', 'invoice_2.png']
+
+            for item_id, _ in queue.claim('w1', 1):
+                queue.complete(item_id, 'w1', {'text': 'invoice'})
+            results = list(collect(queue, '{text}', journal=journal, wait=False))
+            assert [os.path.basename(r['new_path']) for r in results] == ['invoice_3.png']
+
+        assert set(_states(queue).values()) == {'applied'}
+        assert sorted(os.listdir(tmp_path)) == [
+            'invoice.png', 'invoice_1.png', 'invoice_2.png', 'invoice_3.png',
+            'journal.jsonl', 'queue.db', 'queue.db-shm', 'queue.db-wal']
@@ -0,0 +1,161 @@
+"""缩略图的磁盘缓存和后台生成
+
+缩略图以 JPEG 保存在缓存目录中，按文件的设备号、inode、大小和修改时间命名，
+图片被重命名后仍能命中。内存中只保留最近使用的少量缩略图；
+界面只为正在显示的缩略图创建 PhotoImage，这里只处理 PIL 图片。
+"""
+import hashlib
+import os
+import queue
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from image_io import load_thumbnail
+
+DEFAULT_THUMBNAIL_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+    'image_renamer',
+    'thumbnails'
+)
+
+# 缩略图的最大尺寸
+DEFAULT_THUMBNAIL_SIZE = (128, 128)
+
+# 内存中保留的缩略图张数
+DEFAULT_MEMORY_ITEMS = 512
+
+# 磁盘上最多保留的缩略图张数，超出时删除最久未修改的文件
+DEFAULT_MAX_FILES = 50000
+
+
+class ThumbnailCache:
+    """缩略图缓存，后台线程池按请求生成缩略图"""
+
+    def __init__(self, directory=DEFAULT_THUMBNAIL_DIR, size=DEFAULT_THUMBNAIL_SIZE,
+                 workers=2, memory_items=DEFAULT_MEMORY_ITEMS, max_files=DEFAULT_MAX_FILES):
+        self.directory = directory
+        self.size = tuple(size)
+        self.memory_items = memory_items
+        self.max_files = max_files
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 生成请求，新的请求替换尚未处理的旧请求
+        self._requests = queue.Queue()
+        # 已经处理完的图片路径（包括失败的），界面线程轮询后取用
+        self.finished = queue.Queue()
+        # 无法生成缩略图的图片，不再重复尝试
+        self.failed = set()
+
+        self._workers = [threading.Thread(target=self._work_loop, daemon=True)
+                         for _ in range(max(1, workers))]
+        for worker in self._workers:
+            worker.start()
+        threading.Thread(target=self.prune, daemon=True).start()
+
+    def _cache_path(self, image_path):
+        """缩略图在磁盘缓存中的路径，文件不存在时抛出 OSError"""
+        st = os.stat(image_path)
+        # 没有 inode 的文件系统上退回使用路径
+        identity = f"{st.st_dev}:{st.st_ino}" if st.st_ino else os.path.abspath(image_path)
+        key = f"{identity}|{st.st_size}|{st.st_mtime_ns}|{self.size[0]}x{self.size[1]}"
+        name = hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+        return os.path.join(self.directory, name[:2], name + '.jpg')
+
+    def get(self, image_path):
+        """从内存取缩略图，没有时返回 None，不读取文件"""
+        with self._lock:
+            image = self._items.get(image_path)
+            if image is not None:
+                self._items.move_to_end(image_path)
+            return image
+
+    def load(self, image_path):
+        """获取缩略图：依次查找内存、磁盘缓存，都没有时读取原图生成"""
+        image = self.get(image_path)
+        if image is not None:
+            return image
+
+        cache_path = self._cache_path(image_path)
+        try:
+            with Image.open(cache_path) as cached:
+                image = cached.copy()
+        except OSError:
+            image = load_thumbnail(image_path, self.size)
+            self._save(image, cache_path)
+        self._remember(image_path, image)
+        return image
+
+    def _save(self, image, cache_path):
+        """写入磁盘缓存，先写临时文件再替换；写入失败时只是不缓存"""
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            temp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+            image.save(temp_path, 'JPEG', quality=85)
+            os.replace(temp_path, cache_path)
+        except OSError:
+            pass
+
+    def _remember(self, image_path, image):
+        """放入内存，超出张数上限时淘汰最久未使用的缩略图"""
+        with self._lock:
+            self._items[image_path] = image
+            self._items.move_to_end(image_path)
+            while len(self._items) > self.memory_items:
+                self._items.popitem(last=False)
+
+    def request(self, image_paths):
+        """在后台生成这些图片的缩略图，新的请求会替换尚未处理的旧请求"""
+        try:
+            while True:
+                self._requests.get_nowait()
+        except queue.Empty:
+            pass
+
+        for image_path in image_paths:
+            if image_path not in self.failed and self.get(image_path) is None:
+                self._requests.put(image_path)
+
+    def _work_loop(self):
+        """后台生成线程"""
+        while True:
+            image_path = self._requests.get()
+            if self.get(image_path) is not None:
+                continue
+            try:
+                self.load(image_path)
+            except Exception:
+                # 读取失败的图片不显示缩略图
+                self.failed.add(image_path)
+            self.finished.put(image_path)
+
+    def prune(self):
+        """磁盘上的缩略图超出上限时，删除最久未修改的一部分"""
+        files = []
+        try:
+            with os.scandir(self.directory) as subdirs:
+                for subdir in subdirs:
+                    if not subdir.is_dir():
+                        continue
+                    with os.scandir(subdir.path) as entries:
+                        for entry in entries:
+                            files.append((entry.stat().st_mtime, entry.path))
+        except OSError:
+            return
+        if len(files) <= self.max_files:
+            return
+
+        # 多删除一成，避免每次启动都要清理
+        files.sort()
+        for _, path in files[:len(files) - int(self.max_files * 0.9)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def forget(self, image_path):
+        """图片被重命名或删除后，移除内存中按旧路径保存的缩略图"""
+        with self._lock:
+            self._items.pop(image_path, None)
@@ -0,0 +1,332 @@
+"""监视文件夹，扫描仪放入的新图片写入完成后一两秒内自动识别并重命名
+
+Linux 上通过 ctypes 使用 inotify，不需要额外的依赖；其他系统或 inotify 不可用时，
+定时检查目录的修改时间，只有目录有变化时才用 os.scandir 重新列出。
+新图片要等大小和修改时间在 settle 秒内不再变化才算写入完成，
+之后再攒几百毫秒凑成一小批交给常驻的进程池，识别引擎在两批之间不会重新加载。
+各小批共用一个文件名索引，发现新图片时登记到索引中，目录只在索引过期时重新列出。
+整个运行期间只开始一批重命名日志，日志记录超过 journal_limit 条时归档成旧文件，
+长时间运行时内存只与等待中的图片和目录中的文件数有关，与运行时长无关。
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from collections import OrderedDict
+
+from image_io import has_image_header
+from memory_budget import DEFAULT_MEMORY_BUDGET
+from name_index import NameIndex
+from ocr_engine import DEFAULT_LANG
+from renamer_core import IMAGE_EXTENSIONS, OcrPool, rename_batch
+
+# inotify 事件
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+# 只关心写完关闭和移入的文件，以及新建的子目录
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+# 本程序重命名产生的路径保留多久（秒），超过时认为不会再收到它的事件
+IGNORE_SECONDS = 60
+
+# 重命名日志在内存中最多保留的记录数，超过时归档日志文件
+DEFAULT_JOURNAL_LIMIT = 10000
+
+# 文件名索引最长使用多久（秒），之后重新列出目录，
+# 补上其他程序删除、改名等没有登记到索引中的变化
+NAMES_MAX_AGE = 600
+
+
+class _Inotify:
+    """Linux inotify 的最小封装"""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        # {监视编号: 目录}
+        self._directories = {}
+
+    def add(self, directory):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), directory)
+        self._directories[wd] = directory
+
+    def read(self, timeout):
+        """等待最多 timeout 秒，返回 [(目录, 文件名, 事件)]，队列溢出时目录为 None"""
+        ready, _, _ = select.select([self.fd], [], [], max(0, timeout))
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                events.append((None, None, mask))
+            elif mask & IN_IGNORED:
+                # 目录被删除或移走
+                self._directories.pop(wd, None)
+            elif wd in self._directories:
+                events.append((self._directories[wd], name, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """监视目录中新写入的图片
+
+    existing 为真时启动时目录中已有的图片也算新图片；
+    ignore() 登记本程序重命名产生的路径，之后收到的对应事件被忽略。
+    names 为 NameIndex 时，发现的新图片还没写完就登记为已占用的文件名。
+    """
+
+    def __init__(self, directories, recursive=False, settle=0.5, poll_interval=1.0,
+                 existing=False, use_inotify=True, names=None):
+        self.recursive = recursive
+        self.names = names
+        self.settle = settle
+        self.poll_interval = poll_interval
+        # 等待写入完成的图片 {路径: (大小, 修改时间, 开始不再变化的时间)}
+        self._pending = {}
+        # 本程序重命名产生的路径 {路径: 登记时间}
+        self._ignored = OrderedDict()
+        # 轮询时每个目录的 (目录修改时间, {文件名: (大小, 修改时间)})
+        self._listings = {}
+        self._last_poll = 0.0
+        # 最近一次处理完事件的时间，inotify 队列溢出时从这里开始补扫
+        self._synced = time.time()
+
+        self._inotify = None
+        if use_inotify and sys.platform.startswith('linux'):
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError):
+                # 没有 inotify（如 WSL1 或精简的 libc），退回轮询
+                self._inotify = None
+
+        since = 0 if existing else None
+        for directory in directories:
+            self._add_directory(os.path.abspath(directory), since)
+
+    @property
+    def mode(self):
+        return 'inotify' if self._inotify is not None else 'poll'
+
+    def _add_directory(self, directory, since=None):
+        """开始监视目录（递归时包括子目录），把修改时间不早于 since 的图片加入等待"""
+        directories = [directory]
+        while directories:
+            directory = directories.pop()
+            if self._inotify is not None:
+                try:
+                    # 先监视再列出，列出期间写入的图片不会漏掉
+                    self._inotify.add(directory)
+                except OSError:
+                    continue
+            subdirs = self._scan(directory, since)
+            if self.recursive:
+                directories.extend(subdirs)
+
+    def _scan(self, directory, since=None):
+        """列出目录中的图片并返回子目录；轮询时同时记录目录内容"""
+        subdirs = []
+        listing = {}
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                            continue
+                        if not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                            continue
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    listing[entry.name] = (st.st_size, st.st_mtime_ns)
+                    if since is not None and st.st_mtime >= since:
+                        self._track(entry.path, st.st_size, st.st_mtime_ns)
+        except OSError:
+            return subdirs
+        if self._inotify is None:
+            self._listings[directory] = (mtime, listing)
+        return subdirs
+
+    def _track(self, path, size=None, mtime=None):
+        """把图片加入等待，已经登记为本程序产生的路径时忽略"""
+        if self._ignored.pop(path, None) is not None:
+            return
+        if self.names is not None:
+            self.names.add(path)
+        if path not in self._pending:
+            self._pending[path] = (size, mtime, time.monotonic())
+
+    def ignore(self, path):
+        """登记本程序重命名产生的路径"""
+        now = time.monotonic()
+        self._ignored[path] = now
+        self._ignored.move_to_end(path)
+        while self._ignored and next(iter(self._ignored.values())) < now - IGNORE_SECONDS:
+            self._ignored.popitem(last=False)
+
+    def _handle(self, events):
+        for directory, name, mask in events:
+            if directory is None:
+                # 事件队列溢出，补扫最近修改过的图片
+                for root in list(self._inotify._directories.values()):
+                    self._scan(root, self._synced - self.settle - 1)
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    # 新的子目录，里面可能已经有图片
+                    self._add_directory(path, since=0)
+                continue
+            if mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and name.lower().endswith(IMAGE_EXTENSIONS):
+                self._track(path)
+        self._synced = time.time()
+
+    def _poll(self):
+        """轮询各目录，目录修改时间没有变化时不重新列出"""
+        for directory, (mtime, listing) in list(self._listings.items()):
+            try:
+                current = os.stat(directory).st_mtime_ns
+            except OSError:
+                del self._listings[directory]
+                continue
+            if current == mtime:
+                continue
+            subdirs = self._scan(directory)
+            for name, stat in self._listings[directory][1].items():
+                if listing.get(name) != stat:
+                    self._track(os.path.join(directory, name), *stat)
+            if self.recursive:
+                for subdir in subdirs:
+                    if subdir not in self._listings:
+                        self._add_directory(subdir, since=0)
+
+    def _settled(self):
+        """大小和修改时间在 settle 秒内没有变化的图片"""
+        now = time.monotonic()
+        ready = []
+        for path, (size, mtime, since) in list(self._pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                # 已被移走或删除
+                del self._pending[path]
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime):
+                self._pending[path] = (st.st_size, st.st_mtime_ns, now)
+                continue
+            if now - since < self.settle:
+                continue
+            del self._pending[path]
+            if st.st_size and has_image_header(path):
+                ready.append(path)
+        return ready
+
+    def wait(self, timeout):
+        """等待最多 timeout 秒，返回写入完成的图片路径
+
+        有等待中的图片时提前返回，以便按时检查是否写入完成。
+        """
+        if self._pending:
+            timeout = min(timeout, self.settle / 2)
+        if self._inotify is not None:
+            self._handle(self._inotify.read(timeout))
+        else:
+            time.sleep(max(0, min(timeout, self._last_poll + self.poll_interval - time.monotonic())))
+            if time.monotonic() - self._last_poll >= self.poll_interval:
+                self._poll()
+                self._last_poll = time.monotonic()
+        return self._settled()
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+
+def watch(directories, crop_box, recursive=False, existing=False, settle=0.5, debounce=0.3,
+          max_delay=1.0, max_batch=64, poll_interval=1.0, workers=None, lang=DEFAULT_LANG,
+          backend='auto', preprocess=None, metrics=None, batch_size=None, policy=None,
+          aligner=None, memory_budget=DEFAULT_MEMORY_BUDGET,
+          journal_limit=DEFAULT_JOURNAL_LIMIT, **options):
+    """一直监视目录，逐张返回 rename_batch 格式的结果，关闭生成器时停止
+
+    新图片写入完成后，等 debounce 秒内没有更多图片、或最早的一张已等了 max_delay 秒、
+    或攒够 max_batch 张时，作为一批交给 rename_batch。
+    其余参数与 rename_batch 相同，options 原样传给它（journal、cache、template 等）。
+    所有小批共用一个日志批次，日志记录达到 journal_limit 条时用 rotate() 归档。
+    所有小批也共用一个文件名索引，超过 NAMES_MAX_AGE 秒后重建。
+    """
+    journal = options.get('journal')
+    if journal is not None and not options.get('dry_run') and journal.batch is None:
+        journal.begin()
+    batch_size = batch_size if batch_size and batch_size > 1 else None
+    names = NameIndex(journal)
+    names_built = time.monotonic()
+    watcher = FolderWatcher(directories, recursive, settle, poll_interval, existing,
+                            names=names)
+    # 每个任务只处理一张图片，小批量时也能分给所有进程
+    pool = OcrPool(workers=workers, lang=lang, backend=backend, preprocess=preprocess,
+                   chunksize=1, metrics=metrics, batch_size=batch_size, policy=policy,
+                   aligner=aligner, memory_budget=memory_budget)
+    try:
+        pool.warm_up()
+        batch = []
+        first = last = None
+        while True:
+            arrived = watcher.wait(debounce if batch else poll_interval)
+            now = time.monotonic()
+            if arrived:
+                batch.extend(arrived)
+                first = first or now
+                last = now
+            if not batch or (len(batch) < max_batch and now - last < debounce
+                             and now - first < max_delay):
+                continue
+
+            if now - names_built > NAMES_MAX_AGE:
+                names = watcher.names = NameIndex(journal)
+                names_built = now
+            for result in rename_batch(batch, crop_box, workers=workers, lang=lang,
+                                       backend=backend, preprocess=preprocess,
+                                       metrics=metrics, batch_size=batch_size, policy=policy,
+                                       aligner=aligner, pool=pool, names=names, **options):
+                if result['new_path'] and result['new_path'] != result['path']:
+                    watcher.ignore(result['new_path'])
+                yield result
+            if journal is not None and len(journal) >= journal_limit:
+                journal.rotate()
+            batch = []
+            first = last = None
+    finally:
+        pool.close()
+        watcher.close()
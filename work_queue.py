@@ -0,0 +1,364 @@
+"""多台机器分担识别的工作队列
+
+协调端把图片路径写入一个 SQLite 队列文件，任意多个工作进程（可以在不同的机器上）
+领取一小批图片的租约、识别后把文字写回队列，最后由协调端按入队顺序统一重命名。
+工作进程崩溃时，租约到期后图片会被其他工作进程重新领取。
+
+各台机器需要以相同的路径访问图片和队列文件（如挂载同一个共享目录），
+共享目录要支持 SQLite 需要的文件锁。队列中保存图片的绝对路径，
+工作进程可以在任意目录下启动。
+
+每张图片的状态：
+    pending   等待领取
+    leased    已被工作进程领取，lease_until 前不会再被领取
+    done      识别完成，等待重命名
+    failed    识别失败或多次租约到期
+    applied   协调端已处理（重命名或记录了失败）
+"""
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+
+from name_index import NameIndex
+from renamer_core import (assign_path, desired_path, format_name, missing_text, move_image,
+                          rename_batch)
+
+# 默认租约时长（秒），工作进程处理期间会不断续约
+DEFAULT_LEASE_SECONDS = 300
+
+# 租约到期多少次后不再重试
+DEFAULT_MAX_ATTEMPTS = 3
+
+# 工作进程找不到图片时，过多少秒再让其他工作进程重试（共享目录可能还没有同步）
+DEFAULT_RETRY_DELAY = 60
+
+
+def worker_name():
+    """工作进程的名称：主机名和进程号"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """基于 SQLite 的图片识别队列，多个进程可以同时打开"""
+
+    def __init__(self, path, lease_seconds=DEFAULT_LEASE_SECONDS,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # 其他进程写入时最多等待30秒
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        with self._db:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT)'
+            )
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS items ('
+                'id INTEGER PRIMARY KEY, path TEXT UNIQUE, state TEXT DEFAULT \'pending\', '
+                'worker TEXT, claim TEXT, lease_until REAL, attempts INTEGER DEFAULT 0, '
+                'fields TEXT, confidence REAL, error TEXT, new_path TEXT)'
+            )
+            self._db.execute('CREATE INDEX IF NOT EXISTS items_state ON items (state, id)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def set_config(self, config):
+        """保存识别参数（区域、模板、语言等），工作进程按这些参数识别"""
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)',
+                             ('job', json.dumps(config, ensure_ascii=False)))
+
+    def config(self):
+        """读取识别参数，队列还没有参数时返回 None"""
+        row = self._db.execute('SELECT value FROM config WHERE key = ?', ('job',)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def enqueue(self, image_paths, chunk_size=1000):
+        """把图片加入队列，已经在队列中的图片忽略，返回新加入的张数
+
+        image_paths 可以是目录扫描生成器，每 chunk_size 张提交一次；
+        相对路径按当前目录换算成绝对路径后保存。
+        """
+        added = 0
+        chunk = []
+        for image_path in image_paths:
+            chunk.append((os.path.abspath(image_path),))
+            if len(chunk) >= chunk_size:
+                added += self._insert(chunk)
+                chunk = []
+        if chunk:
+            added += self._insert(chunk)
+        return added
+
+    def _insert(self, rows):
+        with self._db:
+            before = self._db.total_changes
+            self._db.executemany('INSERT OR IGNORE INTO items (path) VALUES (?)', rows)
+            return self._db.total_changes - before
+
+    def claim(self, worker, count):
+        """领取最多 count 张图片的租约，返回 [(编号, 路径)]
+
+        等待中的和租约已到期的图片都可以领取；租约到期次数过多的图片记为失败。
+        一条 UPDATE 语句完成领取，多个进程同时领取时不会拿到同一张图片。
+        """
+        now = time.time()
+        token = uuid.uuid4().hex
+        with self._db:
+            self._db.execute(
+                "UPDATE items SET state = 'failed', error = COALESCE(error, ?) "
+                "WHERE state = 'leased' AND lease_until < ? AND attempts >= ?",
+                (f"{self.max_attempts} 次处理都没有完成", now, self.max_attempts)
+            )
+            self._db.execute(
+                "UPDATE items SET state = 'leased', worker = ?, claim = ?, lease_until = ?, "
+                "attempts = attempts + 1 WHERE id IN ("
+                "SELECT id FROM items WHERE state = 'pending' "
+                "OR (state = 'leased' AND lease_until < ?) ORDER BY id LIMIT ?)",
+                (worker, token, now + self.lease_seconds, now, count)
+            )
+        return self._db.execute(
+            'SELECT id, path FROM items WHERE claim = ? ORDER BY id', (token,)
+        ).fetchall()
+
+    def renew(self, worker):
+        """延长这个工作进程持有的所有租约"""
+        with self._db:
+            self._db.execute(
+                "UPDATE items SET lease_until = ? WHERE state = 'leased' AND worker = ?",
+                (time.time() + self.lease_seconds, worker)
+            )
+
+    def complete(self, item_id, worker, fields, confidence=None, error=None):
+        """写回识别结果；租约已经被其他进程领走时忽略，返回是否写入"""
+        with self._db:
+            cursor = self._db.execute(
+                "UPDATE items SET state = ?, fields = ?, confidence = ?, error = ?, "
+                "lease_until = NULL WHERE id = ? AND state = 'leased' AND worker = ?",
+                ('failed' if error else 'done', json.dumps(fields, ensure_ascii=False),
+                 confidence, error, item_id, worker)
+            )
+        return cursor.rowcount > 0
+
+    def defer(self, item_id, worker, error, delay=DEFAULT_RETRY_DELAY):
+        """暂时无法处理的图片 delay 秒后再被领取，与租约到期一样计入次数，
+        次数用完后记为失败；返回是否更新"""
+        with self._db:
+            cursor = self._db.execute(
+                "UPDATE items SET worker = NULL, error = ?, lease_until = ? "
+                "WHERE id = ? AND state = 'leased' AND worker = ?",
+                (error, time.time() + delay, item_id, worker)
+            )
+        return cursor.rowcount > 0
+
+    def release(self, worker):
+        """放回这个工作进程还没有完成的图片，不计入到期次数"""
+        with self._db:
+            self._db.execute(
+                "UPDATE items SET state = 'pending', worker = NULL, lease_until = NULL, "
+                "attempts = attempts - 1 WHERE state = 'leased' AND worker = ?", (worker,)
+            )
+
+    def unfinished(self):
+        """还在等待或处理中的图片张数"""
+        return self._db.execute(
+            "SELECT COUNT(*) FROM items WHERE state IN ('pending', 'leased')"
+        ).fetchone()[0]
+
+    def counts(self):
+        """各状态的图片张数"""
+        return dict(self._db.execute('SELECT state, COUNT(*) FROM items GROUP BY state'))
+
+    def items(self, after_id=0, limit=256):
+        """按编号顺序读取 after_id 之后的图片记录"""
+        rows = self._db.execute(
+            'SELECT id, path, state, fields, confidence, error FROM items '
+            'WHERE id > ? ORDER BY id LIMIT ?', (after_id, limit)
+        ).fetchall()
+        return [{
+            'id': row[0],
+            'path': row[1],
+            'state': row[2],
+            'fields': json.loads(row[3]) if row[3] else {},
+            'confidence': row[4],
+            'error': row[5]
+        } for row in rows]
+
+    def mark_applied(self, item_id, new_path=None, error=None):
+        """记录协调端对这张图片的处理结果"""
+        with self._db:
+            self._db.execute(
+                "UPDATE items SET state = 'applied', new_path = ?, error = COALESCE(?, error) "
+                "WHERE id = ?", (new_path, error, item_id)
+            )
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def _claimed(queue, worker, items, held, chunk_size):
+    """从已领取的 items 开始逐张返回路径，用完后继续领取，领取不到时结束
+
+    返回的图片记入 held {路径: 编号}，结果按路径找回对应的图片。
+    """
+    while items:
+        for item_id, image_path in items:
+            held[image_path] = item_id
+            yield image_path
+        items = queue.claim(worker, chunk_size)
+
+
+def work(queue, crop_box, workers=None, worker=None, chunk_size=None,
+         poll_interval=5.0, **options):
+    """作为工作进程识别队列中的图片，逐张返回 rename_batch 格式的结果
+
+    识别由 rename_batch(dry_run=True) 完成，options 原样传给它（lang、cache、preprocess 等），
+    只取识别出的文字写回队列，不重命名。队列中没有可领取的图片、
+    但其他工作进程还有未完成的租约时，每隔 poll_interval 秒检查一次，
+    租约到期的图片由这里接手；全部完成后结束。
+    找不到的图片不记为失败，过一段时间再由任意工作进程重试。
+    """
+    worker = worker or worker_name()
+    chunk_size = chunk_size or max(1, (workers or os.cpu_count() or 1) * 2)
+    try:
+        while True:
+            items = queue.claim(worker, chunk_size)
+            if not items:
+                if not queue.unfinished():
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            held = {}
+            last_renew = time.monotonic()
+            for result in rename_batch(_claimed(queue, worker, items, held, chunk_size),
+                                       crop_box, workers=workers, dry_run=True, **options):
+                # rename_batch 会跳过一些不需要处理的图片，不能按位置对应
+                item_id = held.pop(result['path'])
+                if result['error'] and not os.path.exists(result['path']):
+                    queue.defer(item_id, worker, result['error'])
+                else:
+                    queue.complete(item_id, worker, result['fields'], result['confidence'],
+                                   result['error'])
+                if time.monotonic() - last_renew > queue.lease_seconds / 3:
+                    queue.renew(worker)
+                    last_renew = time.monotonic()
+                result['id'] = item_id
+                yield result
+            # 被跳过、没有结果的图片过一段时间再重试，次数用完后记为失败
+            for item_id in held.values():
+                queue.defer(item_id, worker, "没有识别结果")
+    finally:
+        # 中途停止时把领取了还没完成的图片放回队列
+        queue.release(worker)
+
+
+def collect(queue, template, journal=None, cache=None, metrics=None, wait=True,
+            poll_interval=2.0):
+    """作为协调端按入队顺序重命名识别完成的图片，逐张返回 rename_batch 格式的结果
+
+    前面的图片还没有识别完时等待（wait 为假时直接结束），
+    保证编号分配与单机运行时一致。重新运行时从上次处理到的位置继续。
+    """
+    if journal is not None:
+        journal.begin()
+    if metrics is not None:
+        metrics.start()
+    names = NameIndex(journal)
+    after_id = 0
+    index = 0
+    try:
+        while True:
+            items = queue.items(after_id)
+            if not items:
+                return
+            for item in items:
+                if item['state'] in ('pending', 'leased'):
+                    break
+                after_id = item['id']
+                if item['state'] == 'applied':
+                    index += 1
+                    continue
+                yield _apply_item(queue, item, index, template, names, journal, cache, metrics)
+                index += 1
+            else:
+                continue
+            if not wait:
+                return
+            time.sleep(poll_interval)
+    finally:
+        if journal is not None:
+            journal.flush()
+        if cache is not None:
+            cache.commit()
+        if metrics is not None:
+            metrics.finish()
+
+
+def _apply_item(queue, item, index, template, names, journal, cache, metrics):
+    """重命名一张识别完成的图片，并在队列中记为已处理"""
+    image_path = item['path']
+    fields = item['fields']
+    error = item['error']
+    result = {
+        'index': index,
+        'path': image_path,
+        'new_path': None,
+        'text': '',
+        'fields': fields,
+        'error': error,
+        'skipped': False,
+        'collision': False,
+        'confidence': item['confidence']
+    }
+    if metrics is not None:
+        metrics.incr('images')
+
+    if not error and journal is not None and journal.is_done(image_path):
+        # 上次运行已经重命名，只是没来得及记入队列
+        result['new_path'] = journal.renamed_path(image_path)
+        result['skipped'] = True
+        queue.mark_applied(item['id'], result['new_path'])
+        if metrics is not None:
+            metrics.incr('skipped')
+        return result
+
+    if not error:
+        error = missing_text(fields)
+    if not error:
+        try:
+            text = format_name(template, fields)
+            start = time.perf_counter()
+            new_path = assign_path(image_path, text, names)
+            move_image(image_path, new_path, journal, names)
+            if metrics is not None:
+                metrics.observe('rename', time.perf_counter() - start)
+            if cache is not None and new_path != image_path:
+                cache.move(image_path, new_path)
+            result['text'] = text
+            result['new_path'] = new_path
+            result['collision'] = new_path not in (image_path, desired_path(image_path, text))
+        except (OSError, ValueError) as e:
+            error = str(e)
+
+    result['error'] = error
+    queue.mark_applied(item['id'], result['new_path'], error)
+    if metrics is not None:
+        metrics.incr('failed' if error else 'renamed')
+    return result